@@ -1,111 +1,113 @@
+import argparse
+import shutil
+import tempfile
+import time
 import pandas as pd
 import numpy as np
 from xgboost import XGBClassifier, plot_importance
 from sklearn.model_selection import train_test_split, cross_val_score
-from sklearn.metrics import classification_report, confusion_matrix, ConfusionMatrixDisplay
+from sklearn.metrics import classification_report, confusion_matrix, ConfusionMatrixDisplay, roc_auc_score
 import matplotlib.pyplot as plt
-from sklearn.preprocessing import StandardScaler
-from sklearn.impute import SimpleImputer
-import os
-import joblib
-
-# Загрузка данных
-df = pd.read_csv("processed/transplant_data.csv")
-
-# Удаляем потенциальный leakage-признак
-df = df.drop(columns=["engraftment_days"])
-
-# Удаляем строки с пропущенными значениями в целевой переменной
-df = df.dropna(subset=["engraftment_success"])
-
-# Целевая переменная и признаки
-X = df.drop(columns=["engraftment_success"])
-y = df["engraftment_success"]
-
-# ===== Уравниваем классы через апсемплинг =====
-from sklearn.utils import resample
-
-df_full = pd.concat([X, y], axis=1)
-df_majority = df_full[df_full["engraftment_success"] == 1.0]
-df_minority = df_full[df_full["engraftment_success"] == 0.0]
-
-df_minority_upsampled = resample(df_minority,
-                                 replace=True,
-                                 n_samples=len(df_majority),
-                                 random_state=42)
-
-df_balanced = pd.concat([df_majority, df_minority_upsampled])
-
-# Обновляем X и y
-X = df_balanced.drop(columns=["engraftment_success"])
-y = df_balanced["engraftment_success"]
-
-# Разделение на категориальные и числовые признаки
-cat_cols = X.select_dtypes(include=['object']).columns.tolist()
-num_cols = X.select_dtypes(include=[np.number]).columns.tolist()
-
-# Обработка категориальных признаков
-if cat_cols:
-    # Удаляем пустые категориальные колонки
-    empty_cat_cols = [col for col in cat_cols if X[col].isna().all()]
-    if empty_cat_cols:
-        print(f"Removing empty categorical columns: {empty_cat_cols}")
-        cat_cols = [col for col in cat_cols if col not in empty_cat_cols]
-        X = X.drop(columns=empty_cat_cols)
-
-    # Импутация пропущенных значений
-    cat_imputer = SimpleImputer(strategy='most_frequent')
-    X[cat_cols] = pd.DataFrame(
-        cat_imputer.fit_transform(X[cat_cols]),
-        columns=cat_cols,
-        index=X.index
-    )
-
-    # One-hot encoding
-    X = pd.get_dummies(X, columns=cat_cols, drop_first=True)
-
-# Обработка числовых признаков
-if num_cols:
-    # Импутация пропущенных значений
-    num_imputer = SimpleImputer(strategy='mean')
-    X[num_cols] = pd.DataFrame(
-        num_imputer.fit_transform(X[num_cols]),
-        columns=num_cols,
-        index=X.index
-    )
-
-    # Стандартизация
-    scaler = StandardScaler()
-    X[num_cols] = scaler.fit_transform(X[num_cols])
 
-# Балансировка классов
-n_negative = sum(y == 0)
-n_positive = sum(y == 1)
-scale_pos_weight = n_negative / n_positive
+from utils.balancing import BALANCING_STRATEGIES, DEFAULT_BALANCING, apply_balancing, training_rows, unwrap_model
+from utils.calibration import (
+    CALIBRATION_METHODS,
+    DEFAULT_CALIBRATION,
+    apply_calibration,
+    calibration_artifacts,
+    calibration_metrics,
+    fit_calibration,
+)
+from utils.drift import drift_artifacts, fit_drift_sketches
+from utils.registry import promote_run, register_run
+from utils.cohort import parse_filter
+from utils.training import ENCODINGS, TARGET, fit_preprocessing, load_training_data, row_keys, split_artifacts
+
+parser = argparse.ArgumentParser(description="Train the engraftment XGBoost model")
+parser.add_argument("--balancing", choices=BALANCING_STRATEGIES, default=DEFAULT_BALANCING,
+                    help="Class balancing strategy (default: sample weights, the matrix is never grown)")
+parser.add_argument("--encoding", choices=ENCODINGS, default="onehot",
+                    help="Categorical encoding: one-hot dummies or XGBoost native categories")
+parser.add_argument("--calibration", choices=CALIBRATION_METHODS, default=DEFAULT_CALIBRATION,
+                    help="Probability calibration fitted on a held-out part of the training rows")
+parser.add_argument("--calibration-size", type=float, default=0.2,
+                    help="Share of the training rows held out for calibration")
+parser.add_argument("--data", default="processed/transplant_data.csv",
+                    help="Harmonized CSV or the cohort store (processed/transplant_data.sqlite)")
+parser.add_argument("--cohort", nargs="+", default=[], metavar="CONDITION",
+                    help='Train on a cohort only, e.g. diagnosis=AML "patient_age>50" (see cohort.py)')
+parser.add_argument("--promote", action="store_true",
+                    help="Promote the registered run so that api.py serves it")
+args = parser.parse_args()
+timings = {}
+
+# Загрузка данных (leakage-признак и строки без целевой переменной не читаются)
+X, y = load_training_data(args.data, filters=[parse_filter(condition) for condition in args.cohort])
+
+# Скетчи исходных (некодированных) признаков для мониторинга дрейфа в API
+drift_sketches = fit_drift_sketches(X)
+
+# Ключи строк: разбиение сохраняется с запуском для дообучения и сжатия модели
+keys = pd.Series(row_keys(X, y), index=X.index)
+
+# Импутация, кодирование категорий и стандартизация
+start = time.perf_counter()
+X, preprocessing_objects = fit_preprocessing(X, encoding=args.encoding)
+timings['preprocessing'] = time.perf_counter() - start
+print(f"Encoding: {args.encoding} ({X.shape[1]} features)")
 
 # Разделение на train/test
 X_train, X_test, y_train, y_test = train_test_split(X, y, stratify=y, test_size=0.2, random_state=42)
+if args.calibration != 'none':
+    # Калибровка обучается на строках, которые модель не видела
+    X_train, X_cal, y_train, y_cal = train_test_split(
+        X_train, y_train, stratify=y_train, test_size=args.calibration_size, random_state=42
+    )
 
 # Модель
-model = XGBClassifier(
-    objective="binary:logistic",
-    scale_pos_weight=scale_pos_weight,
-    eval_metric="logloss",
-    use_label_encoder=False,
-    random_state=42,
-    n_estimators=100,
-    max_depth=4,
-    learning_rate=0.1
-)
+def make_model():
+    return XGBClassifier(
+        objective="binary:logistic",
+        eval_metric="logloss",
+        use_label_encoder=False,
+        random_state=42,
+        n_estimators=100,
+        max_depth=4,
+        learning_rate=0.1,
+        tree_method="hist",
+        enable_categorical=args.encoding == "native"
+    )
+
+# Балансировка классов без дублирования строк в исходной матрице
+model, fit_params = apply_balancing(make_model(), y_train, args.balancing)
+print(f"Balancing strategy: {args.balancing} "
+      f"({training_rows(y_train, args.balancing)} training rows for {len(y_train)} samples)")
 
 # Обучение
-model.fit(X_train, y_train)
+start = time.perf_counter()
+model.fit(X_train, y_train, **fit_params)
+timings['fit'] = time.perf_counter() - start
+print(f"Fit time: {timings['fit']:.2f}s")
 
 # Оценка
 y_pred = model.predict(X_test)
+test_probabilities = model.predict_proba(X_test)[:, 1]
+test_auc = roc_auc_score(y_test, test_probabilities)
 print("=== Classification Report ===")
 print(classification_report(y_test, y_pred))
 
+# Калибровка вероятностей: кусочно-линейная таблица, в API применяется через np.interp
+calibration_table = None
+calibration_report = {}
+if args.calibration != 'none':
+    calibration_table = fit_calibration(model.predict_proba(X_cal)[:, 1], y_cal, args.calibration)
+    calibration_report = calibration_metrics(
+        test_probabilities, apply_calibration(test_probabilities, calibration_table), y_test
+    )
+    print(f"Calibration ({args.calibration}, {len(calibration_table['x'])} knots): "
+          f"Brier {calibration_report['brier_raw']:.4f} -> {calibration_report['brier_calibrated']:.4f}, "
+          f"ECE {calibration_report['ece_raw']:.4f} -> {calibration_report['ece_calibrated']:.4f}")
+
 # Confusion Matrix
 cm = confusion_matrix(y_test, y_pred)
 disp = ConfusionMatrixDisplay(confusion_matrix=cm)
@@ -115,34 +117,53 @@ plt.show()
 
 # Важность признаков
 plt.figure(figsize=(10, 6))
-plot_importance(model, max_num_features=10)
+plot_importance(unwrap_model(model), max_num_features=10)
 plt.title("Feature Importance (XGBoost)")
 plt.tight_layout()
 plt.show()
 
 # Кросс-валидация (AUC как метрика)
 from sklearn.model_selection import StratifiedKFold
-from sklearn.metrics import roc_auc_score
 
 cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
-scores = cross_val_score(model, X, y, cv=cv, scoring="roc_auc")
+cv_model, cv_fit_params = apply_balancing(make_model(), y, args.balancing)
+start = time.perf_counter()
+scores = cross_val_score(cv_model, X, y, cv=cv, scoring="roc_auc", fit_params=cv_fit_params)
+timings['cv'] = time.perf_counter() - start
 print(f"Mean AUC (5-fold CV): {np.mean(scores):.3f} ± {np.std(scores):.3f}")
 
-# Создаем папку models, если её нет
-os.makedirs('models', exist_ok=True)
-
-# Сохраняем модель
-model.save_model('models/xgboost_model.json')
-
-# Сохраняем объекты предобработки
-preprocessing_objects = {
-    'cat_imputer': cat_imputer if cat_cols else None,
-    'num_imputer': num_imputer if num_cols else None,
-    'scaler': scaler if num_cols else None,
-    'cat_cols': cat_cols,
-    'num_cols': num_cols,
-    'feature_names': X.columns.tolist()
+# Регистрируем запуск: модель, предобработка, параметры, метрики, версия данных и время
+params = {
+    **unwrap_model(model).get_xgb_params(),
+    'balancing': args.balancing,
+    'encoding': args.encoding,
+    'calibration': args.calibration,
+    'calibration_size': args.calibration_size,
 }
-
-joblib.dump(preprocessing_objects, 'models/preprocessing_objects.joblib')
-print("\nМодель и объекты предобработки сохранены в папке 'models'")
+if args.cohort:
+    params['cohort'] = args.cohort
+metrics = {
+    'cv_auc_mean': float(np.mean(scores)),
+    'cv_auc_std': float(np.std(scores)),
+    'cv_auc_scores': [float(score) for score in scores],
+    'test_auc': float(test_auc),
+    **calibration_report,
+}
+split = {
+    'train': keys[X_train.index],
+    'calibration': keys[X_cal.index] if args.calibration != 'none' else [],
+    'test': keys[X_test.index],
+}
+artifacts_dir = tempfile.mkdtemp(prefix="artifacts_")
+try:
+    run_id = register_run(unwrap_model(model), preprocessing_objects, params, metrics, args.data, timings,
+                          kind=TARGET, artifacts={**calibration_artifacts(calibration_table, artifacts_dir),
+                                                  **drift_artifacts(drift_sketches, artifacts_dir),
+                                                  **split_artifacts(split, artifacts_dir)})
+finally:
+    shutil.rmtree(artifacts_dir, ignore_errors=True)
+print(f"\nЗапуск {run_id} сохранен в models/runs/{run_id}")
+
+if args.promote:
+    promote_run(run_id)
+    print(f"Запуск {run_id} отмечен как promoted и будет использоваться API")
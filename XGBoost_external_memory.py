@@ -0,0 +1,141 @@
+import argparse
+import json
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import xgboost as xgb
+from sklearn.metrics import roc_auc_score
+
+from utils.calibration import CALIBRATION_METHODS, DEFAULT_CALIBRATION, calibration_artifacts, fit_calibration
+from utils.external_memory import (
+    ParquetBatchIter,
+    csv_to_parquet,
+    fit_streaming_preprocessing,
+)
+from utils.registry import promote_run, register_run
+from utils.training import NON_FEATURE_COLUMNS, TARGET
+
+
+def peak_memory_mb() -> float:
+    """
+    Returns peak resident memory of the current process in MB
+    """
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Out-of-core XGBoost training from chunked Parquet via an external-memory DataIter"
+    )
+    parser.add_argument("--data", default="processed/transplant_data.parquet",
+                        help="Parquet file with the harmonized dataset")
+    parser.add_argument("--csv", default="processed/transplant_data.csv",
+                        help="CSV converted to --data in chunks if the Parquet file does not exist")
+    parser.add_argument("--batch-size", type=int, default=100_000, help="Rows per streamed chunk")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=4)
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    parser.add_argument("--holdout-every", type=int, default=5,
+                        help="Every N-th row is held out for validation (0 disables the holdout)")
+    parser.add_argument("--calibration", choices=CALIBRATION_METHODS, default=DEFAULT_CALIBRATION,
+                        help="Probability calibration fitted on the holdout rows (needs --holdout-every)")
+    parser.add_argument("--promote", action="store_true",
+                        help="Promote the registered run so that api.py serves it")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    timings = {}
+
+    if not os.path.exists(args.data):
+        print(f"Converting {args.csv} to Parquet chunks...")
+        start = time.perf_counter()
+        csv_to_parquet(args.csv, args.data, chunksize=args.batch_size)
+        timings['csv_to_parquet'] = time.perf_counter() - start
+
+    # Статистики предобработки считаются потоково, датасет целиком в память не загружается
+    print("Fitting preprocessing statistics...")
+    start = time.perf_counter()
+    preprocessing_objects = fit_streaming_preprocessing(args.data, TARGET, NON_FEATURE_COLUMNS, args.batch_size)
+    timings['preprocessing'] = time.perf_counter() - start
+    print(f"Class counts: {preprocessing_objects['class_counts']}")
+    print(f"Features: {len(preprocessing_objects['feature_names'])}")
+
+    cache_dir = tempfile.mkdtemp(prefix="xgb_cache_")
+    try:
+        start = time.perf_counter()
+        train_iter = ParquetBatchIter(
+            args.data, preprocessing_objects, TARGET, args.batch_size,
+            cache_prefix=os.path.join(cache_dir, "train"), subset="train", holdout_every=args.holdout_every
+        )
+        dtrain = xgb.DMatrix(train_iter)
+        evals = [(dtrain, "train")]
+        dvalid = None
+        if args.holdout_every:
+            valid_iter = ParquetBatchIter(
+                args.data, preprocessing_objects, TARGET, args.batch_size,
+                cache_prefix=os.path.join(cache_dir, "valid"), subset="valid", holdout_every=args.holdout_every
+            )
+            dvalid = xgb.DMatrix(valid_iter)
+            evals.append((dvalid, "valid"))
+        timings['dmatrix'] = time.perf_counter() - start
+
+        # Параметры совпадают с XGBoost.py; внешняя память поддерживается только методом hist
+        params = {
+            "objective": "binary:logistic",
+            "eval_metric": ["logloss", "auc"],
+            "tree_method": "hist",
+            "max_depth": args.max_depth,
+            "learning_rate": args.learning_rate,
+            "seed": 42,
+        }
+        start = time.perf_counter()
+        booster = xgb.train(params, dtrain, num_boost_round=args.n_estimators, evals=evals, verbose_eval=25)
+        timings['training'] = time.perf_counter() - start
+
+        metrics = {}
+        calibration_table = None
+        if dvalid is not None:
+            y_valid = dvalid.get_label()
+            valid_probabilities = booster.predict(dvalid)
+            if len(np.unique(y_valid)) > 1:
+                metrics['valid_auc'] = float(roc_auc_score(y_valid, valid_probabilities))
+                print(f"Validation AUC: {metrics['valid_auc']:.3f}")
+            if args.calibration != 'none':
+                calibration_table = fit_calibration(valid_probabilities, y_valid, args.calibration)
+                print(f"Calibration: {args.calibration} ({len(calibration_table['x'])} knots)")
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    # Метаданные sklearn нужны, чтобы api.py загружал модель через XGBClassifier без изменений
+    booster.set_attr(scikit_learn=json.dumps({"_estimator_type": "classifier", "n_classes_": 2}))
+
+    print("\n=== Timings (s) ===")
+    for stage, seconds in timings.items():
+        print(f"- {stage}: {seconds:.2f}")
+    metrics['peak_memory_mb'] = peak_memory_mb()
+    print(f"Peak memory: {metrics['peak_memory_mb']:.1f} MB")
+
+    params = {**params, 'n_estimators': args.n_estimators, 'batch_size': args.batch_size,
+              'balancing': 'weights', 'encoding': 'onehot', 'external_memory': True,
+              'calibration': args.calibration if calibration_table is not None else 'none'}
+    artifacts_dir = tempfile.mkdtemp(prefix="calibration_")
+    try:
+        run_id = register_run(booster, preprocessing_objects, params, metrics, args.data, timings, kind=TARGET,
+                              artifacts=calibration_artifacts(calibration_table, artifacts_dir))
+    finally:
+        shutil.rmtree(artifacts_dir, ignore_errors=True)
+    print(f"\nЗапуск {run_id} сохранен в models/runs/{run_id}")
+
+    if args.promote:
+        promote_run(run_id)
+        print(f"Запуск {run_id} отмечен как promoted и будет использоваться API")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+import argparse
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from sklearn.metrics import roc_auc_score
+from xgboost import XGBClassifier
+
+from utils.balancing import DEFAULT_BALANCING, apply_balancing, model_fit_params, training_rows, unwrap_model
+from utils.calibration import CALIBRATION_METHODS, DEFAULT_CALIBRATION, calibration_artifacts, fit_calibration
+from utils.drift import drift_artifacts, fit_drift_sketches
+from utils.encoding import encode_features
+from utils.registry import get_run, promote_run, register_run
+from utils.serving import load_bundle
+from utils.training import (
+    TARGET,
+    check_feature_layout,
+    fit_preprocessing,
+    holdout_mask,
+    load_split,
+    load_training_data,
+    refit_changed_statistics,
+    row_keys,
+    split_artifacts,
+)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Continue boosting the promoted model on the current dataset (old + newly ingested rows)"
+    )
+    parser.add_argument("--data", default="processed/transplant_data.csv")
+    parser.add_argument("--extra-rounds", type=int, default=20, help="Trees added to the promoted model")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="Relative change above which an imputation statistic is refitted")
+    parser.add_argument("--calibration", choices=CALIBRATION_METHODS,
+                        help="Probability calibration refitted for the new model (default: the parent run's method)")
+    parser.add_argument("--calibration-size", type=float, default=0.2,
+                        help="Share of the new training rows held out for calibration")
+    parser.add_argument("--skip-full-retrain", action="store_true",
+                        help="Do not train the from-scratch model used for the time/AUC comparison")
+    parser.add_argument("--promote", action="store_true",
+                        help="Promote the registered run so that api.py serves it")
+    return parser.parse_args()
+
+
+def make_model(params: dict, n_estimators: int, enable_categorical: bool) -> XGBClassifier:
+    return XGBClassifier(
+        objective="binary:logistic",
+        eval_metric="logloss",
+        random_state=42,
+        n_estimators=n_estimators,
+        max_depth=params.get("max_depth", 4),
+        learning_rate=params.get("learning_rate", 0.1),
+        tree_method="hist",
+        enable_categorical=enable_categorical
+    )
+
+
+def main():
+    args = parse_args()
+    timings = {}
+
+    # Текущая модель: promoted-запуск из реестра или файлы в models/
+    bundle = load_bundle(TARGET)
+    parent_params = get_run(bundle.run_id)["params"] if bundle.run_id else {}
+    booster = bundle.model.get_booster()
+    base_rounds = booster.num_boosted_rounds()
+    native = bundle.preprocessing_objects.get('encoding') == 'native'
+    print(f"Base model: {bundle.version} ({base_rounds} trees)")
+
+    # Старые и новые строки реестра вместе
+    X_raw, y = load_training_data(args.data)
+
+    # Новые данные должны кодироваться в ту же раскладку признаков, что и у деревьев
+    problems = check_feature_layout(bundle.preprocessing_objects, X_raw)
+    if booster.feature_names is not None and list(booster.feature_names) != bundle.preprocessing_objects['feature_names']:
+        problems.append("Booster feature names differ from the preprocessing feature layout")
+    if problems:
+        print("Feature layout is not compatible, run a full retrain (XGBoost.py):")
+        for problem in problems:
+            print(f"- {problem}")
+        sys.exit(1)
+
+    # Обновляем только изменившиеся статистики импутации
+    start = time.perf_counter()
+    preprocessing_objects, changes = refit_changed_statistics(bundle.preprocessing_objects, X_raw, args.tolerance)
+    X = encode_features(X_raw, preprocessing_objects)
+    timings['preprocessing'] = time.perf_counter() - start
+    print("Preprocessing changes:" if changes else "Preprocessing statistics unchanged")
+    for change in changes:
+        print(f"- {change}")
+
+    # Оценка и калибровка - только на строках, которых родитель не видел: его тестовые и калибровочные
+    # строки из сохраненного разбиения и доля новых строк
+    calibration = args.calibration or parent_params.get('calibration', DEFAULT_CALIBRATION)
+    calibration_size = args.calibration_size if calibration != 'none' else 0.0
+    keys = row_keys(X_raw, y)
+    parent_split = load_split(bundle.model_dir)
+    if parent_split is not None:
+        seen = np.isin(keys, parent_split['train'])
+        parent_test = ~seen & np.isin(keys, parent_split['test'])
+        parent_calibration = ~seen & ~parent_test & np.isin(keys, parent_split['calibration'])
+        new = ~(seen | parent_test | parent_calibration)
+        test = parent_test.copy()
+        test[new] = holdout_mask(y[new], 0.2)
+        new_train = new & ~test
+        calibration_rows = parent_calibration.copy() if calibration != 'none' else np.zeros(len(y), dtype=bool)
+        calibration_rows[new_train] = holdout_mask(y[new_train], calibration_size)
+        holdout = 'parent_split'
+        print(f"Rows: {seen.sum()} seen by the parent, {(parent_test | parent_calibration).sum()} held out by it, "
+              f"{new.sum()} new")
+    else:
+        # Запуски без split_rows.npz (в т.ч. models/): родитель мог обучаться на части тестовых строк
+        test = holdout_mask(y, 0.2)
+        calibration_rows = np.zeros(len(y), dtype=bool)
+        calibration_rows[~test] = holdout_mask(y[~test], calibration_size)
+        holdout = 'resplit'
+        print("Warning: the parent run has no recorded split, the test rows are a new random split and may "
+              "include rows the parent was trained on; base and incremental AUC are optimistic")
+    train = ~(test | calibration_rows)
+    if y[test].nunique() < 2:
+        print("The held-out rows contain one class only, AUC is undefined; ingest more rows first")
+        sys.exit(1)
+    if calibration != 'none' and not calibration_rows.any():
+        print("No held-out rows left for calibration, the run is registered without a calibration table")
+        calibration = 'none'
+
+    X_train, X_cal, X_test = X[train], X[calibration_rows], X[test]
+    y_train, y_cal, y_test = y[train], y[calibration_rows], y[test]
+    print(f"Split: {len(y_train)} train, {len(y_cal)} calibration, {len(y_test)} test rows ({holdout})")
+    # Новые деревья и полное переобучение используют стратегию балансировки родителя
+    balancing = parent_params.get('balancing', DEFAULT_BALANCING)
+    print(f"Balancing strategy: {balancing} "
+          f"({training_rows(y_train, balancing)} training rows for {len(y_train)} samples)")
+
+    base_auc = roc_auc_score(y_test, bundle.predict_proba(X_test, calibrated=False))
+
+    # Продолжаем бустинг от текущей модели (xgb_model=)
+    start = time.perf_counter()
+    model, fit_params = apply_balancing(make_model(parent_params, args.extra_rounds, native), y_train, balancing)
+    model.fit(X_train, y_train, **fit_params, **model_fit_params(model, xgb_model=booster))
+    model = unwrap_model(model)
+    timings['warm_start_fit'] = time.perf_counter() - start
+    incremental_auc = roc_auc_score(y_test, model.predict_proba(X_test)[:, 1])
+
+    print("\n=== Incremental retraining ===")
+    print(f"Trees: {base_rounds} -> {model.get_booster().num_boosted_rounds()}")
+    print(f"Base model AUC on current data: {base_auc:.4f}")
+    print(f"Warm-start AUC: {incremental_auc:.4f} ({timings['warm_start_fit']:.2f}s)")
+
+    metrics = {
+        'test_auc': float(incremental_auc),
+        'base_test_auc': float(base_auc),
+        'holdout': holdout,
+    }
+    if not args.skip_full_retrain:
+        # Полное переобучение с нуля для сравнения времени и качества
+        start = time.perf_counter()
+        X_full, _ = fit_preprocessing(X_raw, encoding='native' if native else 'onehot')
+        X_full_train, X_full_test = X_full[train], X_full[test]
+        full_model, fit_params = apply_balancing(
+            make_model(parent_params, parent_params.get('n_estimators') or base_rounds, native), y_train, balancing
+        )
+        full_model.fit(X_full_train, y_train, **fit_params)
+        full_model = unwrap_model(full_model)
+        timings['full_retrain_fit'] = time.perf_counter() - start
+        full_auc = roc_auc_score(y_test, full_model.predict_proba(X_full_test)[:, 1])
+
+        metrics['full_retrain_auc'] = float(full_auc)
+        metrics['auc_drift'] = float(incremental_auc - full_auc)
+        metrics['time_saved_s'] = timings['full_retrain_fit'] - timings['warm_start_fit']
+        print(f"Full retrain AUC: {full_auc:.4f} ({timings['full_retrain_fit']:.2f}s)")
+        print(f"AUC drift vs full retrain: {metrics['auc_drift']:+.4f}")
+        print(f"Time saved: {metrics['time_saved_s']:.2f}s")
+
+    # Калибровка родителя к новым деревьям не подходит, переобучаем ее на отдельных отложенных строках
+    calibration_table = None
+    if calibration != 'none':
+        calibration_table = fit_calibration(model.predict_proba(X_cal)[:, 1], y_cal, calibration)
+        print(f"Calibration: {calibration} ({len(calibration_table['x'])} knots)")
+
+    params = {
+        **parent_params,
+        'balancing': balancing,
+        'calibration': calibration,
+        'calibration_size': args.calibration_size,
+        'parent_run': bundle.version,
+        'warm_start_rounds': args.extra_rounds,
+        'n_estimators': model.get_booster().num_boosted_rounds(),
+        'preprocessing_changes': changes,
+    }
+    artifacts_dir = tempfile.mkdtemp(prefix="artifacts_")
+    try:
+        # Скетчи дрейфа по текущим данным, на которых дообучена модель
+        artifacts = {**calibration_artifacts(calibration_table, artifacts_dir),
+                     **drift_artifacts(fit_drift_sketches(X_raw), artifacts_dir),
+                     **split_artifacts({'train': keys[train], 'calibration': keys[calibration_rows],
+                                        'test': keys[test]}, artifacts_dir)}
+        run_id = register_run(model, preprocessing_objects, params, metrics, args.data, timings, kind=TARGET,
+                              artifacts=artifacts)
+    finally:
+        shutil.rmtree(artifacts_dir, ignore_errors=True)
+    print(f"\nЗапуск {run_id} сохранен в models/runs/{run_id}")
+
+    if args.promote:
+        promote_run(run_id)
+        print(f"Запуск {run_id} отмечен как promoted и будет использоваться API")
+
+
+if __name__ == "__main__":
+    main()
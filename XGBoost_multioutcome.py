@@ -0,0 +1,170 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from joblib import Parallel, delayed
+from sklearn.metrics import roc_auc_score
+from sklearn.model_selection import train_test_split
+from sklearn.utils.class_weight import compute_sample_weight
+from xgboost import XGBClassifier
+
+from utils.calibration import (
+    CALIBRATION_METHODS,
+    DEFAULT_CALIBRATION,
+    apply_calibration,
+    calibration_metrics,
+    fit_calibration,
+)
+from utils.cohort import parse_filter
+from utils.outcomes import (
+    MIN_CLASS_ROWS,
+    OUTCOME_CALIBRATION_FILE,
+    OUTCOME_MODELS_FILE,
+    OUTCOMES,
+    OUTCOMES_KIND,
+    load_outcome_data,
+    save_outcome_calibration,
+)
+from utils.packed_trees import stack_boosters
+from utils.registry import promote_run, register_run
+from utils.training import fit_preprocessing
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Train one XGBoost model per transplant outcome on shared features and pack them together"
+    )
+    parser.add_argument("--data", default="processed/transplant_data.csv",
+                        help="Harmonized CSV or the cohort store (processed/transplant_data.sqlite)")
+    parser.add_argument("--cohort", nargs="+", default=[], metavar="CONDITION",
+                        help='Train on a cohort only, e.g. diagnosis=AML "patient_age>50" (see cohort.py)')
+    parser.add_argument("--outcomes", nargs="+", choices=OUTCOMES, default=list(OUTCOMES))
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Outcome models trained in parallel (-1: all cores)")
+    parser.add_argument("--calibration", choices=CALIBRATION_METHODS, default=DEFAULT_CALIBRATION,
+                        help="Probability calibration of every outcome, fitted on held-out training rows")
+    parser.add_argument("--calibration-size", type=float, default=0.2,
+                        help="Share of the training rows held out for calibration")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=4)
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    parser.add_argument("--promote", action="store_true",
+                        help="Promote the registered run so that api.py returns all outcome risks")
+    return parser.parse_args()
+
+
+def split_outcome(X, y, calibrated: bool, calibration_size: float):
+    """
+    Train/test (and calibration) rows of one outcome: only rows where the outcome is reported
+    """
+    labelled = y.notna().to_numpy()
+    X, y = X[labelled], y[labelled].astype(int)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, stratify=y, test_size=0.2, random_state=42)
+    X_cal = y_cal = None
+    if calibrated:
+        X_train, X_cal, y_train, y_cal = train_test_split(
+            X_train, y_train, stratify=y_train, test_size=calibration_size, random_state=42
+        )
+    return X_train, X_test, X_cal, y_train, y_test, y_cal
+
+
+def train_outcome(X_train, y_train, params: dict) -> XGBClassifier:
+    """
+    Trains the model of one outcome with balanced sample weights
+    """
+    model = XGBClassifier(
+        objective="binary:logistic",
+        eval_metric="logloss",
+        random_state=42,
+        tree_method="hist",
+        # Параллелизм - по исходам, каждая модель обучается в один поток
+        n_jobs=1,
+        **params
+    )
+    model.fit(X_train, y_train, sample_weight=compute_sample_weight('balanced', y_train))
+    return model
+
+
+def main():
+    args = parse_args()
+    timings = {}
+
+    X, labels = load_outcome_data(args.data, tuple(args.outcomes),
+                                  [parse_filter(condition) for condition in args.cohort])
+    start = time.perf_counter()
+    # Общая one-hot матрица для всех исходов: упакованные деревья поддерживают только числовые сплиты
+    X, preprocessing_objects = fit_preprocessing(X, encoding="onehot")
+    timings['preprocessing'] = time.perf_counter() - start
+    print(f"{X.shape[1]} shared features")
+
+    outcomes, splits = [], []
+    for outcome in args.outcomes:
+        counts = labels[outcome].value_counts()
+        if len(counts) < 2 or counts.min() < MIN_CLASS_ROWS:
+            print(f"Skipping {outcome}: class counts {counts.to_dict()}")
+            continue
+        outcomes.append(outcome)
+        splits.append(split_outcome(X, labels[outcome], args.calibration != 'none', args.calibration_size))
+    if not outcomes:
+        raise ValueError("No outcome has enough labelled rows of both classes")
+
+    params = {"n_estimators": args.n_estimators, "max_depth": args.max_depth, "learning_rate": args.learning_rate}
+    start = time.perf_counter()
+    models = Parallel(n_jobs=args.n_jobs)(
+        delayed(train_outcome)(X_train, y_train, params) for X_train, _, _, y_train, _, _ in splits
+    )
+    timings['fit'] = time.perf_counter() - start
+    print(f"Trained {len(models)} outcome models in {timings['fit']:.2f}s")
+
+    # Все модели в одном лесу: участник ансамбля = исход
+    forest = stack_boosters(models)
+    metrics, tables = {}, {}
+    print(f"\n{'outcome':<22} {'rows':>6} {'positive':>9} {'test AUC':>9} {'Brier':>15} {'ECE':>15}")
+    for j, (outcome, (_, X_test, X_cal, y_train, y_test, y_cal)) in enumerate(zip(outcomes, splits)):
+        test_probabilities = forest.predict_proba(X_test)[:, j]
+        tables[outcome] = None
+        entry = {'rows': int(len(y_train) + len(y_test) + (len(y_cal) if y_cal is not None else 0)),
+                 'positive_rate': float(labels[outcome].mean()),
+                 'test_auc': float(roc_auc_score(y_test, test_probabilities))}
+        if args.calibration != 'none':
+            tables[outcome] = fit_calibration(forest.predict_proba(X_cal)[:, j], y_cal, args.calibration)
+            entry.update(calibration_metrics(test_probabilities,
+                                             apply_calibration(test_probabilities, tables[outcome]), y_test))
+            brier = f"{entry['brier_raw']:.4f}->{entry['brier_calibrated']:.4f}"
+            ece = f"{entry['ece_raw']:.4f}->{entry['ece_calibrated']:.4f}"
+        else:
+            brier = ece = "-"
+        # Плоские метрики <исход>_<метрика>, чтобы они попадали в сводку реестра
+        metrics.update({f"{outcome}_{name}": value for name, value in entry.items()})
+        print(f"{outcome:<22} {entry['rows']:>6} {entry['positive_rate']:>9.3f} {entry['test_auc']:>9.3f} "
+              f"{brier:>15} {ece:>15}")
+
+    metrics['mean_test_auc'] = float(np.mean([metrics[f"{outcome}_test_auc"] for outcome in outcomes]))
+
+    artifacts_dir = tempfile.mkdtemp(prefix="outcomes_")
+    try:
+        forest_path = os.path.join(artifacts_dir, OUTCOME_MODELS_FILE)
+        forest.save(forest_path)
+        calibration_path = os.path.join(artifacts_dir, OUTCOME_CALIBRATION_FILE)
+        save_outcome_calibration(outcomes, tables, calibration_path)
+
+        run_params = {**params, 'outcomes': outcomes, 'balancing': 'weights', 'encoding': 'onehot',
+                      'calibration': args.calibration}
+        if args.cohort:
+            run_params['cohort'] = args.cohort
+        run_id = register_run(None, preprocessing_objects, run_params, metrics, args.data, timings,
+                              kind=OUTCOMES_KIND,
+                              artifacts={OUTCOME_MODELS_FILE: forest_path, OUTCOME_CALIBRATION_FILE: calibration_path})
+    finally:
+        shutil.rmtree(artifacts_dir, ignore_errors=True)
+    print(f"\nЗапуск {run_id} сохранен в models/runs/{run_id}")
+
+    if args.promote:
+        promote_run(run_id)
+        print(f"Запуск {run_id} отмечен как promoted, API будет возвращать риски всех исходов")
+
+
+if __name__ == "__main__":
+    main()
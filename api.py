@@ -1,23 +1,118 @@
-from fastapi import FastAPI, HTTPException
-from pydantic import BaseModel
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.exception_handlers import request_validation_exception_handler
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import FileResponse, ORJSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from pydantic import BaseModel, ConfigDict, TypeAdapter, ValidationError
 import pandas as pd
 import numpy as np
+import orjson
 from xgboost import XGBClassifier
 import joblib
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple, Union
+from contextlib import contextmanager
 import os
+import time
+
+from utils.drift import DriftMonitor
+from utils.hla import load_donor_registry, parse_typing
+from utils.jobs import (
+    CSV,
+    INPUT_FILES,
+    PARQUET,
+    RESULT_FORMATS,
+    JobConflict,
+    JobManager,
+    JobNotFound,
+    JobQueueFull,
+    iter_results,
+    result_format,
+)
+from utils.metrics import CONTENT_TYPE, MetricsMiddleware, MetricsRegistry, elapsed_since_start
+from utils.scoring import DEFAULT_FIELDS, INPUT_FIELDS, fill_default_fields, recommendations, risk_levels
+from utils.serving import load_bundle, load_ensemble, load_outcomes
+from utils.sweep import DEFAULT_AXIS_STEPS, axis_values, check_axes, sweep_grid
+from utils.training import TARGET
+from utils.wire import (
+    ARROW_STREAM,
+    COLUMNAR_FORMATS,
+    JSON,
+    MSGPACK,
+    ColumnValidationError,
+    UnsupportedFormat,
+    check_format,
+    media_type,
+    read_columns,
+    response_format,
+    validate_columns,
+    write_columns,
+)
 
 app = FastAPI(
     title="GenoMatch API",
     description="API для предсказания успешности трансплантации на основе генетической совместимости и клинических данных",
-    version="1.0.0"
+    version="1.0.0",
+    # JSON-ответы сериализуются orjson
+    default_response_class=ORJSONResponse
 )
 
-# Загрузка модели и объектов предобработки
-model = XGBClassifier()
-model.load_model('models/xgboost_model.json')
-preprocessing_objects = joblib.load('models/preprocessing_objects.joblib')
+# Загрузка модели и объектов предобработки: promoted-запуск из реестра models/runs,
+# либо файлы models/xgboost_model.json и models/preprocessing_objects.joblib
+bundle = load_bundle()
+# Бутстрап-ансамбль для интервалов (uncertainty=true), если он зарегистрирован и promoted
+ensemble = load_ensemble()
+# Модели всех исходов (приживление, выживаемость, GVHD, рецидив, TRM) в одном упакованном лесу (outcomes=true)
+outcome_models = load_outcomes()
+# Регистр доноров с HLA-типированием для /donors/search (CSV или Parquet, см. utils/hla.py)
+DONOR_REGISTRY_PATH = os.environ.get("GENOMATCH_DONOR_REGISTRY")
+donor_registry = load_donor_registry(DONOR_REGISTRY_PATH) if DONOR_REGISTRY_PATH else None
+# Сколько лучших по HLA кандидатов оценивается моделью за один поиск
+MAX_SCORED_CANDIDATES = 5000
+# Задачи пакетного скоринга (/jobs): каталог задач, каталог файлов, на которые можно сослаться при отправке
+# (без него принимаются только загруженные файлы), процессы скоринга и одновременно выполняемые задачи
+JOBS_DIR = os.environ.get("GENOMATCH_JOBS_DIR", "processed/jobs")
+JOB_INPUTS_DIR = os.environ.get("GENOMATCH_JOB_INPUTS")
+JOB_WORKERS = int(os.environ.get("GENOMATCH_JOB_WORKERS", max(1, (os.cpu_count() or 1) - 1)))
+MAX_RUNNING_JOBS = int(os.environ.get("GENOMATCH_MAX_JOBS", 1))
+# Сколько секунд останавливаемый процесс API дает выполняемым задачам на завершение (serve.py задает сам)
+JOB_DRAIN_SECONDS = float(os.environ.get("GENOMATCH_JOB_DRAIN_SECONDS", 30))
+
+# Метрики в формате Prometheus, отдаются через /metrics
+metrics = MetricsRegistry()
+REQUESTS = metrics.counter("genomatch_requests_total", "HTTP requests by endpoint, method and status", ("endpoint", "method", "status"))
+ERRORS = metrics.counter("genomatch_errors_total", "Failed requests by exception type", ("endpoint", "type"))
+IN_FLIGHT = metrics.gauge("genomatch_requests_in_flight", "Requests currently being processed")
+LATENCY = metrics.histogram("genomatch_stage_latency_seconds", "Latency of request processing stages", ("stage", "endpoint"))
+MODEL_INFO = metrics.gauge("genomatch_model_info", "Served model versions", ("model", "version"))
+MODEL_INFO.set(1, model="classifier", version=bundle.version)
+if ensemble is not None:
+    MODEL_INFO.set(1, model="ensemble", version=ensemble.version)
+if outcome_models is not None:
+    MODEL_INFO.set(1, model="outcomes", version=outcome_models.version)
+
+JOBS = metrics.counter("genomatch_jobs_total", "Finished batch-scoring jobs by state", ("state",))
+JOB_ROWS = metrics.counter("genomatch_job_rows_total", "Rows scored by batch-scoring jobs")
+DRIFT_PSI = metrics.gauge("genomatch_feature_psi", "PSI of live inputs against the training distribution", ("feature",))
+app.add_middleware(MetricsMiddleware, requests=REQUESTS, in_flight=IN_FLIGHT, latency=LATENCY)
+
+
+def record_job(state: str, rows: int) -> None:
+    JOBS.inc(state=state)
+    JOB_ROWS.inc(rows)
+
+# Пул процессов скоринга создается при первой задаче, а не при импорте: serve.py импортирует api.py до fork
+jobs = JobManager(JOBS_DIR, bundle.model_dir, bundle.run_id, bundle.version, workers=JOB_WORKERS,
+                  max_running=MAX_RUNNING_JOBS, on_finish=record_job)
+app.router.on_shutdown.append(lambda: jobs.shutdown(JOB_DRAIN_SECONDS))
+
 
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request: Request, exc: RequestValidationError):
+    # Ошибки схемы pydantic (422) тоже учитываются в метриках
+    ERRORS.inc(endpoint=getattr(request.scope.get("endpoint"), "__name__", "unmatched"), type="RequestValidationError")
+    return await request_validation_exception_handler(request, exc)
+
+# Поля совпадают с utils.scoring.INPUT_FIELDS, по которым проверяются входные файлы пакетного скоринга
 class TransplantData(BaseModel):
     # Генетические и иммунные параметры
     hla_match_score: float  # Совместимость по HLA
@@ -33,116 +128,555 @@ class TransplantData(BaseModel):
     days_from_diagnosis_to_hct: int  # Дни с диагноза до достижения HCT
     cd34_dose: float  # Доза CD34
 
+# Мониторинг дрейфа: только поля запроса, значения DEFAULT_FIELDS постоянны и дрейф в них не информативен
+drift = DriftMonitor(bundle.drift_sketches, columns=TransplantData.model_fields) if bundle.drift_sketches else None
+
+# /predict/batch принимает JSON-список или колоночный Arrow IPC/msgpack; тело разбирается в обработчике
+BATCH_ADAPTER = TypeAdapter(List[TransplantData])
+BATCH_BODY = {"requestBody": {"required": True, "content": {
+    JSON: {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/TransplantData"}}},
+    ARROW_STREAM: {"schema": {"type": "string", "format": "binary"}},
+    MSGPACK: {"schema": {"type": "string", "format": "binary"}},
+}}}
+COLUMNAR_RESPONSES = {200: {"content": {ARROW_STREAM: {}, MSGPACK: {}}}}
+
+class JobInput(BaseModel):
+    input: str  # CSV или Parquet, путь относительно GENOMATCH_JOB_INPUTS
+
+class JobStatus(BaseModel):
+    # model_version - версия модели, а не поле pydantic
+    model_config = ConfigDict(protected_namespaces=())
+
+    job_id: str
+    state: str  # queued, running, succeeded, failed, cancelled, interrupted
+    model_version: str
+    rows_total: Optional[int] = None  # Для CSV до завершения - оценка по числу строк файла
+    rows_scored: int
+    chunks_scored: int  # Готовые части результата (Parquet)
+    progress: Optional[float] = None
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    rows_per_second: Optional[float] = None
+    error: Optional[str] = None
+
+# /jobs принимает ссылку на файл (JSON) или сам файл в теле запроса
+JOB_BODY = {"requestBody": {"required": True, "content": {
+    JSON: {"schema": JobInput.model_json_schema()},
+    CSV: {"schema": {"type": "string", "format": "binary"}},
+    PARQUET: {"schema": {"type": "string", "format": "binary"}},
+}}}
+
+class Explanation(BaseModel):
+    base_value: float  # Смещение модели (log-odds)
+    contributions: Dict[str, float]  # Вклад полей в log-odds, по убыванию модуля
+
+class Interval(BaseModel):
+    lower: str  # Нижняя граница вероятности успеха
+    upper: str  # Верхняя граница вероятности успеха
+    level: str  # Номинальный уровень интервала
+
 class PredictionResponse(BaseModel):
     success_probability: str  # Вероятность успеха в процентах
     risk_level: str  # Уровень риска
     recommendation: str  # Рекомендация
-    confidence: str  # Уверенность в предсказании
+    confidence: str  # Уверенность в предсказании (при uncertainty=true - 1 минус ширина интервала)
+    interval: Optional[Interval] = None  # Только при uncertainty=true
+    outcomes: Optional[Dict[str, str]] = None  # Только при outcomes=true: вероятность каждого исхода
+    explanation: Optional[Explanation] = None  # Только при explain=true
 
-def get_risk_level(probability: float) -> str:
-    if probability >= 0.85:
-        return "Низкий риск"
-    elif probability >= 0.70:
-        return "Умеренный риск"
-    else:
-        return "Высокий риск"
+class SweepAxis(BaseModel):
+    field: str  # Поле TransplantData, например days_from_diagnosis_to_hct
+    values: Optional[List[Union[float, str]]] = None  # Явный список значений (для категорий - только он)
+    start: Optional[float] = None  # Либо равномерная сетка от start до stop
+    stop: Optional[float] = None
+    steps: int = DEFAULT_AXIS_STEPS
+
+class SweepRequest(BaseModel):
+    base: TransplantData  # Базовый запрос, в котором меняются поля осей
+    axes: List[SweepAxis]  # Одна или две оси
+
+class SweepAxisValues(BaseModel):
+    field: str
+    values: List[Union[float, str]]
+
+class SweepResponse(BaseModel):
+    base_probability: float  # Вероятность успеха базового запроса
+    axes: List[SweepAxisValues]
+    # Поверхность вероятностей успеха: список по значениям первой оси, для двух осей - матрица [ось 1][ось 2]
+    success_probability: Union[List[float], List[List[float]]]
+
+class DonorSearchRequest(BaseModel):
+    # Типирование пациента: {"A": ["02:01", "24:02"], ...} или "A*02:01 A*24:02 B*07:02 ..."
+    patient_hla: Union[str, Dict[str, List[str]]]
+    patient_age: int
+    patient_sex: str
+    diagnosis: str
+    conditioning_regimen: str
+    source_of_cells: str
+    days_from_diagnosis_to_hct: int
+    cd34_dose: float
+    min_matches: int = 8  # Минимум совпавших аллелей из 10
+    limit: int = 20
+
+class DonorMatch(BaseModel):
+    donor_id: str
+    hla_match: str  # Совпадения аллелей, например "9/10"
+    mismatched_loci: List[str]
+    prediction: PredictionResponse
+
+class DonorSearchResponse(BaseModel):
+    candidates: int  # Доноров с не меньше чем min_matches совпадениями
+    scored: int  # Из них оценено моделью
+    donors: List[DonorMatch]  # Лучшие по вероятности успеха
+
+def observe_stage(stage: str, start: float, endpoint: str) -> float:
+    now = time.perf_counter()
+    LATENCY.observe(now - start, stage=stage, endpoint=endpoint)
+    return now
+
+def observe_validation(request: Request, endpoint: str) -> None:
+    # Время от получения запроса до входа в обработчик: чтение тела, разбор JSON и валидация pydantic
+    validation_seconds = elapsed_since_start(request.scope.get("state"))
+    if validation_seconds is not None:
+        LATENCY.observe(validation_seconds, stage="validation", endpoint=endpoint)
+
+@contextmanager
+def count_errors(endpoint: str):
+    try:
+        yield
+    except HTTPException:
+        raise
+    except (ValueError, KeyError, TypeError) as e:
+        # Некорректные входные значения - ошибка клиента
+        ERRORS.inc(endpoint=endpoint, type=type(e).__name__)
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        # Остальное - ошибка сервиса (модель, предобработка), а не запроса
+        ERRORS.inc(endpoint=endpoint, type=type(e).__name__)
+        raise HTTPException(status_code=500, detail=f"Internal error: {type(e).__name__}")
+
+def check_uncertainty(uncertainty: bool) -> None:
+    if uncertainty and ensemble is None:
+        raise HTTPException(status_code=503,
+                            detail="Uncertainty mode needs a promoted ensemble (python XGBoost_ensemble.py --promote)")
+
+def check_outcomes(outcomes: bool, explain: bool) -> None:
+    if outcomes and outcome_models is None:
+        raise HTTPException(status_code=503,
+                            detail="Outcome risks need a promoted multi-outcome run (python XGBoost_multioutcome.py --promote)")
+    if outcomes and explain and outcomes_serve_success():
+        raise HTTPException(status_code=400,
+                            detail="With outcomes=true the success probability comes from the multi-outcome forest, "
+                                   "which has no explanations; request explain=true without outcomes")
+
+def outcomes_serve_success() -> bool:
+    # Если promoted-лес исходов содержит приживление, с outcomes=true оценка успеха берется из него:
+    # одна модель и одно кодирование вместо двух разных оценок приживления в одном ответе
+    return outcome_models is not None and TARGET in outcome_models.outcomes
+
+def body_format(request: Request) -> str:
+    fmt = media_type(request.headers.get("content-type"))
+    if fmt != JSON and fmt not in COLUMNAR_FORMATS:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type {fmt}, use JSON, {ARROW_STREAM} or {MSGPACK}")
+    try:
+        check_format(fmt)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=415, detail=str(e))
+    return fmt
 
-def get_recommendation(probability: float) -> str:
-    if probability >= 0.85:
-        return "Высокая вероятность успешной трансплантации. Можно планировать процедуру."
-    elif probability >= 0.70:
-        return "Умеренная вероятность успеха. Рекомендуется дополнительное обследование."
+def reply_format_for(request: Request, default: str = JSON) -> str:
+    """
+    Response format from the Accept header; columnar requests are answered in their own format by default
+    """
+    fmt = response_format(request.headers.get("accept"), default)
+    try:
+        check_format(fmt)
+    except UnsupportedFormat as e:
+        raise HTTPException(status_code=406, detail=str(e))
+    return fmt
+
+def read_batch(body: bytes, fmt: str, endpoint: str) -> Union[List[TransplantData], pd.DataFrame]:
+    """
+    Validates a /predict/batch body: JSON into TransplantData objects, Arrow or msgpack column by column
+    into a frame of request rows merged with DEFAULT_FIELDS
+    """
+    try:
+        if fmt == JSON:
+            # orjson + validate_python быстрее, чем validate_json pydantic
+            return BATCH_ADAPTER.validate_python(orjson.loads(body))
+        columns = read_columns(body, fmt)
+        start = time.perf_counter()
+        input_data = fill_default_fields(validate_columns(columns, TransplantData.model_fields))
+        observe_stage("merge", start, endpoint)
+        return input_data
+    except ValidationError as e:
+        # Тот же ответ 422, что и при разборе тела FastAPI
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)])
+    except ColumnValidationError as e:
+        raise RequestValidationError(e.errors)
+    except (ValueError, orjson.JSONDecodeError) as e:
+        if fmt == JSON:
+            raise RequestValidationError([{"type": "json_invalid", "loc": ("body",), "msg": f"JSON decode error: {e}",
+                                           "input": {}}])
+        # Поврежденный Arrow/msgpack
+        ERRORS.inc(endpoint=endpoint, type=type(e).__name__)
+        raise HTTPException(status_code=400, detail=f"Malformed {fmt} payload: {e}")
+
+def columnar_response(result: pd.DataFrame, fmt: str, endpoint: str, headers: Optional[Dict[str, str]] = None) -> Response:
+    start = time.perf_counter()
+    content = write_columns(result, fmt)
+    observe_stage("serialize", start, endpoint)
+    return Response(content, media_type=fmt, headers=headers)
+
+@contextmanager
+def job_errors():
+    try:
+        yield
+    except JobNotFound as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    except JobConflict as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e))
+
+def job_input(body: bytes) -> str:
+    """
+    Resolves a {"input": path} reference inside GENOMATCH_JOB_INPUTS
+    """
+    try:
+        reference = JobInput.model_validate_json(body).input
+    except ValidationError as e:
+        raise RequestValidationError([{**error, "loc": ("body", *error["loc"])} for error in e.errors(include_url=False)])
+    if JOB_INPUTS_DIR is None:
+        raise HTTPException(status_code=403, detail="File references are disabled (set GENOMATCH_JOB_INPUTS), upload the file instead")
+    root = os.path.realpath(JOB_INPUTS_DIR)
+    path = os.path.realpath(os.path.join(root, reference))
+    if os.path.commonpath([root, path]) != root:
+        raise HTTPException(status_code=403, detail=f"{reference} is outside GENOMATCH_JOB_INPUTS")
+    if not path.endswith((".csv", ".csv.gz", ".parquet")) or not os.path.isfile(path):
+        raise HTTPException(status_code=400, detail=f"No CSV or Parquet file {reference} in GENOMATCH_JOB_INPUTS")
+    return path
+
+def score(items: List[TransplantData], explain: bool, endpoint: str, uncertainty: bool = False,
+          outcomes: bool = False) -> List[Dict[str, Any]]:
+    """
+    Scores a batch of requests with one encode/predict (and pred_contribs) call
+    """
+    return response_records(score_rows(merge_items(items, endpoint), explain, endpoint, uncertainty, outcomes))
+
+def merge_items(items: List[TransplantData], endpoint: str) -> pd.DataFrame:
+    start = time.perf_counter()
+    # Объединяем входные данные с данными по умолчанию
+    # Поля модели pydantic v2 хранятся в __dict__: vars() не копирует их, в отличие от model_dump()
+    input_data = fill_default_fields(pd.DataFrame([vars(item) for item in items]))
+    observe_stage("merge", start, endpoint)
+    return input_data
+
+def score_rows(input_data: pd.DataFrame, explain: bool, endpoint: str, uncertainty: bool = False,
+               outcomes: bool = False) -> pd.DataFrame:
+    """
+    Scores merged request rows, counting them for drift monitoring
+    """
+    if drift is not None:
+        start = time.perf_counter()
+        # Счетчики фиксированного размера: обновление не зависит от объема прошедшего трафика
+        drift.update(input_data)
+        observe_stage("drift", start, endpoint)
+    return score_frame(input_data, explain, endpoint, uncertainty, outcomes)
+
+def score_frame(input_data: pd.DataFrame, explain: bool, endpoint: str, uncertainty: bool = False,
+                outcomes: bool = False) -> pd.DataFrame:
+    """
+    Scores merged input rows into one column per response field, probabilities as fractions:
+    success_probability, risk_level, confidence, interval_lower/interval_upper (uncertainty),
+    outcome_<outcome> (outcomes), contribution_<field> and contribution_bias (explain)
+    """
+    serve_outcomes = outcomes and outcomes_serve_success()
+    # Применяем предобработку: импутация, стандартизация и кодирование категорий
+    # (one-hot или нативные категории), колонки упорядочены как при обучении
+    timings = {}
+    X = (outcome_models if serve_outcomes else bundle).encode(input_data, timings)
+    for stage, seconds in timings.items():
+        LATENCY.observe(seconds, stage=stage, endpoint=endpoint)
+
+    # Получаем предсказание (откалиброванное одним np.interp на весь батч)
+    start = time.perf_counter()
+    if serve_outcomes:
+        # Один проход по лесу для всех исходов; вероятность успеха - колонка приживления этого же леса
+        outcome_probabilities = outcome_models.predict_proba(X)
+        probabilities = outcome_probabilities[:, outcome_models.outcomes.index(TARGET)]
     else:
-        return "Высокий риск отторжения. Рекомендуется поиск альтернативного донора."
+        probabilities = bundle.predict_proba(X)
+    start = observe_stage("predict", start, endpoint)
+    # Эвристика |p - 0.5| * 2, если интервалы не запрошены
+    result = {"success_probability": probabilities, "risk_level": risk_levels(probabilities),
+              "confidence": np.abs(probabilities - 0.5) * 2}
+
+    if outcomes:
+        if not serve_outcomes:
+            # Лес исходов без приживления: оценка успеха остается за основной моделью, исходы кодируются отдельно
+            outcome_probabilities = outcome_models.predict_proba(outcome_models.encode(input_data))
+            start = observe_stage("outcomes", start, endpoint)
+        for outcome, column in zip(outcome_models.outcomes, outcome_probabilities.T):
+            result[f"outcome_{outcome}"] = column
+
+    if explain:
+        # Вклады TreeSHAP, свернутые из one-hot колонок в исходные поля
+        contributions, bias = bundle.explain(X)
+        for column in contributions.columns:
+            result[f"contribution_{column}"] = contributions[column].to_numpy()
+        result["contribution_bias"] = bias
+        observe_stage("explain", start, endpoint)
+
+    if uncertainty:
+        start = time.perf_counter()
+        # Все участники ансамбля считаются одним векторизованным проходом по упакованным деревьям
+        # Разброс участников (в шкале калибровки самого ансамбля) откладывается в log-odds вокруг
+        # отдаваемой вероятности, поэтому точечная оценка всегда лежит внутри своего интервала
+        _, lower, upper = ensemble.intervals(ensemble.encode(input_data), center=probabilities)
+        result["interval_lower"] = lower
+        result["interval_upper"] = upper
+        result["confidence"] = 1 - (result["interval_upper"] - result["interval_lower"])
+        observe_stage("uncertainty", start, endpoint)
+
+    return pd.DataFrame(result)
+
+def response_records(result: pd.DataFrame) -> List[Dict[str, Any]]:
+    """
+    PredictionResponse dicts of score_frame rows (optional fields only when present),
+    built column by column without intermediate model objects
+    """
+    probabilities = result["success_probability"].to_numpy()
+    records = [
+        {"success_probability": f'{probability * 100:.2f}%', "risk_level": risk_level,
+         "recommendation": recommendation, "confidence": f'{confidence * 100:.2f}%'}
+        for probability, risk_level, recommendation, confidence
+        in zip(probabilities.tolist(), result["risk_level"].tolist(), recommendations(probabilities).tolist(),
+               result["confidence"].tolist())
+    ]
 
-@app.post("/predict", response_model=PredictionResponse)
-async def predict_transplant_success(data: TransplantData):
+    if "interval_lower" in result.columns:
+        level = f'{ensemble.level * 100:.0f}%'
+        for record, low, high in zip(records, result["interval_lower"].tolist(), result["interval_upper"].tolist()):
+            record["interval"] = {"lower": f'{low * 100:.2f}%', "upper": f'{high * 100:.2f}%', "level": level}
+
+    outcome_columns = [col for col in result.columns if col.startswith("outcome_")]
+    if outcome_columns:
+        names = [col[len("outcome_"):] for col in outcome_columns]
+        for record, row in zip(records, result[outcome_columns].to_numpy().tolist()):
+            record["outcomes"] = {outcome: f'{p * 100:.2f}%' for outcome, p in zip(names, row)}
+
+    contribution_columns = [col for col in result.columns if col.startswith("contribution_") and col != "contribution_bias"]
+    if contribution_columns:
+        values = result[contribution_columns].to_numpy()
+        columns = np.array([col[len("contribution_"):] for col in contribution_columns])
+        order = np.argsort(-np.abs(values), axis=1)
+        for record, row, o, b in zip(records, values, order, result["contribution_bias"].tolist()):
+            record["explanation"] = {"base_value": b, "contributions": dict(zip(columns[o].tolist(), row[o].tolist()))}
+    return records
+
+@app.post("/predict", response_model=PredictionResponse, response_model_exclude_none=True)
+async def predict_transplant_success(data: TransplantData, request: Request, explain: bool = False,
+                                     uncertainty: bool = False, outcomes: bool = False):
+    endpoint = "predict_transplant_success"
+    observe_validation(request, endpoint)
+    check_uncertainty(uncertainty)
+    check_outcomes(outcomes, explain)
+    with count_errors(endpoint):
+        return score([data], explain, endpoint, uncertainty, outcomes)[0]
+
+@app.post("/predict/batch", response_model=List[PredictionResponse], response_model_exclude_none=True,
+          openapi_extra=BATCH_BODY, responses=COLUMNAR_RESPONSES)
+async def predict_transplant_success_batch(request: Request, explain: bool = False, uncertainty: bool = False,
+                                           outcomes: bool = False):
+    endpoint = "predict_transplant_success_batch"
+    check_uncertainty(uncertainty)
+    check_outcomes(outcomes, explain)
+    request_format = body_format(request)
+    reply_format = reply_format_for(request, default=request_format)
+    data = read_batch(await request.body(), request_format, endpoint)
+    observe_validation(request, endpoint)
+    if not len(data):
+        return [] if reply_format == JSON else columnar_response(pd.DataFrame(), reply_format, endpoint)
+    with count_errors(endpoint):
+        input_data = merge_items(data, endpoint) if isinstance(data, list) else data
+        result = score_rows(input_data, explain, endpoint, uncertainty, outcomes)
+        if reply_format == JSON:
+            # Словари уже в форме PredictionResponse: повторная валидация response_model не нужна
+            start = time.perf_counter()
+            response = ORJSONResponse(response_records(result))
+            observe_stage("serialize", start, endpoint)
+            return response
+        return columnar_response(result, reply_format, endpoint)
+
+@app.post("/sweep", response_model=SweepResponse)
+async def sweep(data: SweepRequest, request: Request):
+    endpoint = "sweep"
+    observe_validation(request, endpoint)
+    with count_errors(endpoint):
+        axes = [(axis.field, axis_values(axis.values, axis.start, axis.stop, axis.steps)) for axis in data.axes]
+        check_axes([field for field, _ in axes], [len(values) for _, values in axes], list(TransplantData.model_fields))
+        start = time.perf_counter()
+        base = pd.DataFrame([{**data.base.dict(), **DEFAULT_FIELDS}])
+        base_encoded = bundle.encode(base)
+        # Базовая строка и значения осей кодируются один раз, сетка собирается из закодированной строки
+        grid = sweep_grid(base, base_encoded, axes, bundle.encode, bundle.contribution_groups,
+                          numeric=bundle.preprocessing_objects['num_cols'])
+        start = observe_stage("encode", start, endpoint)
+        # Вся сетка и базовый запрос - один вызов модели
+        probabilities = bundle.predict_proba(pd.concat([grid, base_encoded], ignore_index=True))
+        observe_stage("predict", start, endpoint)
+        surface = probabilities[:-1].reshape([len(values) for _, values in axes])
+        return SweepResponse(base_probability=float(probabilities[-1]),
+                             axes=[SweepAxisValues(field=field, values=values) for field, values in axes],
+                             success_probability=surface.tolist())
+
+@app.post("/donors/search", response_model=DonorSearchResponse, response_model_exclude_none=True,
+          responses=COLUMNAR_RESPONSES)
+async def search_donors(data: DonorSearchRequest, request: Request, explain: bool = False):
+    endpoint = "search_donors"
+    observe_validation(request, endpoint)
+    reply_format = reply_format_for(request)
+    if donor_registry is None:
+        raise HTTPException(status_code=503, detail="No donor registry loaded (set GENOMATCH_DONOR_REGISTRY)")
+    with count_errors(endpoint):
+        patient = parse_typing(data.patient_hla)
+        start = time.perf_counter()
+        # Инвертированный индекс: читаются только списки доноров с аллелями пациента
+        candidates = donor_registry.search(patient, data.min_matches)
+        observe_stage("hla_search", start, endpoint)
+        scored = candidates.head(MAX_SCORED_CANDIDATES)
+        if scored.empty and reply_format == JSON:
+            return DonorSearchResponse(candidates=0, scored=0, donors=[])
+        if scored.empty:
+            return columnar_response(pd.DataFrame(), reply_format, endpoint, headers={"X-Candidates": "0", "X-Scored": "0"})
+
+        # Все кандидаты оцениваются одним батчем; hla_match_score - совпадения из 10, как в обучающих данных
+        patient_fields = data.dict(exclude={"patient_hla", "min_matches", "limit"})
+        input_data = pd.DataFrame({
+            "hla_match_score": scored["hla_matches"].to_numpy(dtype=float),
+            "donor_age": scored.get("donor_age", pd.Series(np.nan, index=scored.index)).to_numpy(),
+            "donor_sex": scored.get("donor_sex", pd.Series(None, index=scored.index, dtype=object)).to_numpy(),
+            **patient_fields,
+            **DEFAULT_FIELDS,
+        })
+        result = score_frame(input_data, explain, endpoint)
+
+        best = np.argsort(-result["success_probability"].to_numpy(), kind="stable")[:data.limit]
+        grades = [donor_registry.grade(patient, scored.index[i]) for i in best]
+        donor_ids = [str(scored["donor_id"].iloc[i]) for i in best]
+        # Ответы строятся только для возвращаемых доноров, а не для всех оцененных
+        result = result.iloc[best].reset_index(drop=True)
+        if reply_format != JSON:
+            columns = pd.DataFrame({"donor_id": donor_ids, "hla_match": [grade["grade"] for grade in grades],
+                                    "mismatched_loci": [grade["mismatched_loci"] for grade in grades]})
+            return columnar_response(pd.concat([columns, result], axis=1), reply_format, endpoint,
+                                     headers={"X-Candidates": str(len(candidates)), "X-Scored": str(len(scored))})
+        donors = [
+            DonorMatch(donor_id=donor_id, hla_match=grade["grade"], mismatched_loci=grade["mismatched_loci"],
+                       prediction=prediction)
+            for donor_id, grade, prediction in zip(donor_ids, grades, response_records(result))
+        ]
+        return DonorSearchResponse(candidates=len(candidates), scored=len(scored), donors=donors)
+
+@app.post("/jobs", response_model=JobStatus, status_code=202, openapi_extra=JOB_BODY)
+async def submit_job(request: Request, explain: bool = False, chunksize: int = Query(50_000, ge=1000, le=1_000_000),
+                     keep_columns: List[str] = Query([])):
+    endpoint = "submit_job"
+    fmt = media_type(request.headers.get("content-type"))
+    if fmt != JSON and fmt not in INPUT_FILES:
+        raise HTTPException(status_code=415, detail=f"Unsupported content type {fmt}, use JSON (file reference), {CSV} or {PARQUET}")
+    # Файловые операции (статусы задач, запись входа, проверка и подсчет строк) идут в пуле потоков,
+    # чтобы не останавливать цикл событий воркера
+    with job_errors():
+        # Очередь проверяется до загрузки файла
+        await run_in_threadpool(jobs.check_capacity)
+    input_path = job_input(await request.body()) if fmt == JSON else None
+    job_id = await run_in_threadpool(jobs.new_job)
     try:
-        # Создаем словарь с данными по умолчанию
-        default_data = {
-            "disease_status": "active",
-            "donor_relation": "sibling",
-            "gvhd_prophylaxis": "standard",
-            "patient_ethnicity": "white",
-            "acute_gvhd_grade": 0,
-            "chronic_gvhd": 0,
-            "overall_survival_1y": 1,
-            "relapse": 0,
-            "trm": 0
-        }
+        if input_path is None:
+            # Файл пишется на диск по мере получения, целиком в памяти он не держится
+            input_path = jobs.input_path(job_id, fmt)
+            f = await run_in_threadpool(open, input_path, "wb")
+            try:
+                async for block in request.stream():
+                    await run_in_threadpool(f.write, block)
+            finally:
+                await run_in_threadpool(f.close)
+        with count_errors(endpoint), job_errors():
+            return await run_in_threadpool(jobs.submit, job_id, input_path, list(INPUT_FIELDS),
+                                           keep_columns, explain, chunksize)
+    except BaseException:
+        await run_in_threadpool(jobs.discard, job_id)
+        raise
 
-        # Объединяем входные данные с данными по умолчанию
-        input_dict = data.dict()
-        input_dict.update(default_data)
-
-        # Преобразуем в DataFrame
-        input_data = pd.DataFrame([input_dict])
-
-        # Применяем предобработку
-        if preprocessing_objects['cat_cols']:
-            # Импутация категориальных признаков
-            cat_data = input_data[preprocessing_objects['cat_cols']]
-            cat_data = pd.DataFrame(
-                preprocessing_objects['cat_imputer'].transform(cat_data),
-                columns=preprocessing_objects['cat_cols'],
-                index=input_data.index
-            )
-            # One-hot encoding
-            cat_data = pd.get_dummies(cat_data, columns=preprocessing_objects['cat_cols'], drop_first=True)
-
-        if preprocessing_objects['num_cols']:
-            # Импутация числовых признаков
-            num_data = input_data[preprocessing_objects['num_cols']]
-            num_data = pd.DataFrame(
-                preprocessing_objects['num_imputer'].transform(num_data),
-                columns=preprocessing_objects['num_cols'],
-                index=input_data.index
-            )
-            # Стандартизация
-            num_data = pd.DataFrame(
-                preprocessing_objects['scaler'].transform(num_data),
-                columns=preprocessing_objects['num_cols'],
-                index=input_data.index
-            )
-
-        # Объединяем обработанные данные
-        if preprocessing_objects['cat_cols'] and preprocessing_objects['num_cols']:
-            X = pd.concat([cat_data, num_data], axis=1)
-        elif preprocessing_objects['cat_cols']:
-            X = cat_data
-        else:
-            X = num_data
-
-        # Убеждаемся, что все необходимые признаки присутствуют
-        for feature in preprocessing_objects['feature_names']:
-            if feature not in X.columns:
-                X[feature] = 0
-
-        # Упорядочиваем колонки как при обучении
-        X = X[preprocessing_objects['feature_names']]
-
-        # Получаем предсказание
-        probability = model.predict_proba(X)[0][1]
-        risk_level = get_risk_level(probability)
-        recommendation = get_recommendation(probability)
-
-        return PredictionResponse(
-            success_probability=f'{probability * 100:.2f}%',
-            risk_level=risk_level,
-            recommendation=recommendation,
-            confidence=f'{(abs(probability - 0.5) * 2) * 100:.2f}%'
-        )
+# Остальные обработчики /jobs читают и удаляют файлы задач, поэтому они синхронные: FastAPI выполняет их в пуле потоков
+@app.get("/jobs", response_model=List[JobStatus])
+def list_jobs(limit: int = Query(100, ge=1, le=1000)):
+    return jobs.list_jobs(limit)
 
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+def get_job(job_id: str):
+    with job_errors():
+        return jobs.status(job_id)
+
+@app.post("/jobs/{job_id}/resume", response_model=JobStatus, status_code=202)
+def resume_job(job_id: str):
+    with job_errors():
+        return jobs.resume(job_id)
+
+@app.delete("/jobs/{job_id}")
+def delete_job(job_id: str):
+    with job_errors():
+        return {"job_id": job_id, "state": jobs.cancel(job_id)}
+
+@app.get("/jobs/{job_id}/results", responses={200: {"content": {fmt: {} for fmt in RESULT_FORMATS}}})
+def get_job_results(job_id: str, request: Request):
+    with job_errors():
+        parts = jobs.parts(job_id)
+    fmt = result_format(request.headers.get("accept"))
+    # Части читаются по одной по мере отправки ответа
+    return StreamingResponse(iter_results(parts, fmt), media_type=fmt)
+
+@app.get("/jobs/{job_id}/results/{part}", responses={200: {"content": {PARQUET: {}}}})
+def get_job_result_part(job_id: str, part: int):
+    with job_errors():
+        parts = jobs.parts(job_id)
+    if not 0 <= part < len(parts):
+        raise HTTPException(status_code=404, detail=f"Job {job_id} has {len(parts)} parts")
+    return FileResponse(parts[part], media_type=PARQUET, filename=os.path.basename(parts[part]))
+
+@app.get("/drift")
+async def get_drift():
+    if drift is None:
+        raise HTTPException(status_code=503, detail="The served model has no training sketches (retrain with XGBoost.py)")
+    return {"model_version": bundle.version, "window": drift.window, "features": drift.report()}
+
+@app.get("/metrics")
+async def get_metrics():
+    if drift is not None:
+        for feature, entry in drift.report().items():
+            if "psi" in entry:
+                DRIFT_PSI.set(entry["psi"], feature=feature)
+    return Response(metrics.render(), media_type=CONTENT_TYPE)
 
 @app.get("/")
 async def root():
     return {
         "name": "GenoMatch API",
         "description": "API для предсказания успешности трансплантации",
+        "model_version": bundle.version,
+        "ensemble_version": ensemble.version if ensemble is not None else None,
+        "outcomes_version": outcome_models.version if outcome_models is not None else None,
         "endpoints": {
-            "/predict": "Предсказание успешности трансплантации на основе генетической совместимости и клинических данных"
+            "/predict": "Предсказание успешности трансплантации на основе генетической совместимости и клинических данных",
+            "/predict/batch": "Предсказание для списка пар пациент-донор одним запросом",
+            "/sweep": "Чувствительность вероятности успеха к одному или двум полям запроса (сетка значений)",
+            "/donors/search": "Поиск доноров по HLA-типированию пациента и ранжирование по вероятности успеха",
+            "/jobs": "Асинхронный скоринг CSV/Parquet-файлов: отправка, статус и прогресс, выгрузка результатов",
+            "/drift": "Дрейф входных данных относительно обучающей выборки (PSI/KS)",
+            "/metrics": "Метрики сервиса в формате Prometheus"
         }
     }
 
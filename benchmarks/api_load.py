@@ -0,0 +1,245 @@
+"""
+Load test of POST /predict: in-process through the ASGI transport and over a uvicorn server.
+Reports RPS, p50/p95/p99 latency and CPU time per request for several concurrency levels
+and compares the result with a JSON baseline (exit code 1 on regression). A baseline recorded
+on another machine (CPU count, platform, architecture, Python) is not compared
+
+Usage: python -m benchmarks.api_load [--modes asgi uvicorn] [--concurrency 1 8 32]
+       python -m benchmarks.api_load --update-baseline
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+from benchmarks.payloads import synthetic_payloads
+
+BASELINE_PATH = "benchmarks/baselines/api_load.json"
+ENDPOINT = "/predict"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Throughput and latency benchmark of the GenoMatch API")
+    parser.add_argument("--modes", nargs="+", choices=["asgi", "uvicorn"], default=["asgi", "uvicorn"])
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 8, 32])
+    parser.add_argument("--requests", type=int, default=500, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests before every level")
+    parser.add_argument("--data", default="processed/transplant_data.csv",
+                        help="Dataset the payload distributions are drawn from")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true", help="Overwrite the baseline with this run")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="Allowed relative RPS drop / p95 and p99 growth against the baseline")
+    parser.add_argument("--ignore-machine", action="store_true",
+                        help="Compare even if the baseline was recorded on a different machine")
+    return parser.parse_args()
+
+
+def process_cpu_seconds(pid: int) -> Optional[float]:
+    """
+    User + system CPU time of a process from /proc (Linux), None where unavailable
+    """
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # После имени процесса: utime и stime - 12-е и 13-е поля
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+async def drive(client: httpx.AsyncClient, payloads: List[Dict], concurrency: int, n_requests: int) -> Dict:
+    latencies = []
+    errors = 0
+    pending = iter(range(n_requests))
+
+    async def worker():
+        nonlocal errors
+        # Общий итератор: каждый воркер берет следующий номер запроса
+        for i in pending:
+            start = time.perf_counter()
+            response = await client.post(ENDPOINT, json=payloads[i % len(payloads)])
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "requests": n_requests,
+        "errors": errors,
+        "rps": n_requests / elapsed,
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p95_ms": float(np.percentile(latencies_ms, 95)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+    }
+
+
+async def run_levels(client: httpx.AsyncClient, payloads: List[Dict], args, cpu_seconds: Callable[[], Optional[float]]) -> Dict:
+    results = {}
+    for concurrency in args.concurrency:
+        await drive(client, payloads, concurrency, args.warmup)
+        cpu_start = cpu_seconds()
+        stats = await drive(client, payloads, concurrency, args.requests)
+        cpu_end = cpu_seconds()
+        stats["cpu_ms_per_request"] = (
+            (cpu_end - cpu_start) * 1000 / args.requests if cpu_start is not None and cpu_end is not None else None
+        )
+        results[str(concurrency)] = stats
+        print(f"  concurrency {concurrency:>3}: {stats['rps']:8.1f} rps, p50 {stats['p50_ms']:.2f} ms, "
+              f"p95 {stats['p95_ms']:.2f} ms, p99 {stats['p99_ms']:.2f} ms, "
+              f"cpu/request {stats['cpu_ms_per_request'] or float('nan'):.2f} ms, errors {stats['errors']}")
+    return results
+
+
+async def run_asgi(payloads: List[Dict], args) -> Dict:
+    import api
+
+    # Клиент и приложение в одном процессе: CPU включает и генерацию нагрузки
+    transport = httpx.ASGITransport(app=api.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        return await run_levels(client, payloads, args, time.process_time)
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(base_url: str, server: subprocess.Popen, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with code {server.returncode}")
+            try:
+                if (await client.get("/")).status_code == 200:
+                    return
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("uvicorn did not start in time")
+
+
+async def run_uvicorn(payloads: List[Dict], args) -> Dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    )
+    try:
+        await wait_until_ready(base_url, server)
+        limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+        async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+            # CPU считается только для процесса сервера
+            return await run_levels(client, payloads, args, lambda: process_cpu_seconds(server.pid))
+    finally:
+        server.terminate()
+        server.wait(timeout=10)
+
+
+def machine_info() -> Dict:
+    return {
+        "python": platform.python_version(),
+        "system": platform.system(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+    }
+
+
+def machine_differences(machine: Dict, baseline: Dict) -> List[str]:
+    """
+    Fields of the machine block that differ from the baseline's (fields missing in either are skipped)
+    """
+    recorded = baseline.get("machine", {})
+    return [f"{key}: {machine[key]} (baseline {recorded[key]})"
+            for key in machine if key in recorded and machine[key] != recorded[key]]
+
+
+def find_regressions(results: Dict, baseline: Dict, tolerance: float) -> List[str]:
+    """
+    Compares every (mode, concurrency) present in both runs
+    """
+    regressions = []
+    for mode, levels in results["modes"].items():
+        for concurrency, stats in levels.items():
+            base = baseline.get("modes", {}).get(mode, {}).get(concurrency)
+            if base is None:
+                continue
+            if stats["rps"] < base["rps"] * (1 - tolerance):
+                regressions.append(f"{mode} c={concurrency}: rps {stats['rps']:.1f} < baseline {base['rps']:.1f}")
+            for key in ("p95_ms", "p99_ms"):
+                if stats[key] > base[key] * (1 + tolerance):
+                    regressions.append(f"{mode} c={concurrency}: {key} {stats[key]:.2f} > baseline {base[key]:.2f}")
+            if stats["errors"] > base["errors"]:
+                regressions.append(f"{mode} c={concurrency}: {stats['errors']} errors (baseline {base['errors']})")
+    return regressions
+
+
+def main():
+    args = parse_args()
+
+    from api import TransplantData
+    payloads = synthetic_payloads(TransplantData, max(args.requests, 1000), args.data)
+
+    results = {
+        "machine": machine_info(),
+        "requests": args.requests,
+        "modes": {},
+    }
+    runners = {"asgi": run_asgi, "uvicorn": run_uvicorn}
+    for mode in args.modes:
+        print(f"\n=== {mode} ===")
+        results["modes"][mode] = asyncio.run(runners[mode](payloads, args))
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo baseline at {args.baseline}, run with --update-baseline to create it")
+        return
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    # Пропускная способность и задержки зависят от числа ядер и платформы: чужой baseline не сравниваем
+    differences = machine_differences(results["machine"], baseline)
+    if differences and not args.ignore_machine:
+        print(f"\n{args.baseline} was recorded on a different machine:")
+        for difference in differences:
+            print(f"- {difference}")
+        sys.exit("Not compared; record a baseline on this machine with --update-baseline "
+                 "or compare anyway with --ignore-machine")
+    if differences:
+        print(f"\nWarning: comparing with a baseline from a different machine ({'; '.join(differences)})")
+    regressions = find_regressions(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\nPerformance regressions (tolerance {args.tolerance:.0%}):")
+        for regression in regressions:
+            print(f"- {regression}")
+        sys.exit(1)
+    print(f"\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})")
+
+
+if __name__ == "__main__":
+    main()
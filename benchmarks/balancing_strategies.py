@@ -0,0 +1,59 @@
+"""
+Compares class balancing strategies: CV AUC, fit time and memory per strategy
+
+Usage: python -m benchmarks.balancing_strategies
+"""
+import argparse
+import time
+import tracemalloc
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from xgboost import XGBClassifier
+
+from utils.balancing import BALANCING_STRATEGIES, apply_balancing, training_rows
+from utils.training import load_training_data, fit_preprocessing
+
+
+def make_model():
+    return XGBClassifier(
+        objective="binary:logistic",
+        eval_metric="logloss",
+        random_state=42,
+        n_estimators=100,
+        max_depth=4,
+        learning_rate=0.1,
+        n_jobs=1
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data", default="processed/transplant_data.csv")
+    parser.add_argument("--folds", type=int, default=5)
+    args = parser.parse_args()
+
+    X, y = load_training_data(args.data)
+    X, _ = fit_preprocessing(X)
+    row_bytes = X.memory_usage(deep=True).sum() / len(X)
+    cv = StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=42)
+
+    print(f"{'strategy':<18}{'AUC':>14}{'fit, s':>9}{'rows':>8}{'matrix, MB':>12}{'py peak, MB':>13}")
+    for strategy in BALANCING_STRATEGIES:
+        estimator, fit_params = apply_balancing(make_model(), y, strategy)
+
+        tracemalloc.start()
+        start = time.perf_counter()
+        scores = cross_val_score(estimator, X, y, cv=cv, scoring="roc_auc", fit_params=fit_params)
+        elapsed = time.perf_counter() - start
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        # Строки, на которых обучается бустер в одном фолде
+        rows = training_rows(y.iloc[:len(y) * (args.folds - 1) // args.folds], strategy)
+        print(f"{strategy:<18}{np.mean(scores):>8.3f}±{np.std(scores):.3f}{elapsed:>9.2f}{rows:>8}"
+              f"{rows * row_bytes / 2**20:>12.2f}{peak / 2**20:>13.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+"""
+Compares one-hot and native categorical encoding: matrix width, fit time, inference latency and CV AUC
+
+Usage: python -m benchmarks.categorical_encoding
+"""
+import argparse
+import time
+
+import numpy as np
+from sklearn.model_selection import StratifiedKFold, cross_val_score
+from xgboost import XGBClassifier
+
+from utils.balancing import apply_balancing
+from utils.encoding import encode_features
+from utils.training import ENCODINGS, load_training_data, fit_preprocessing
+
+
+def make_model(encoding: str):
+    return XGBClassifier(
+        objective="binary:logistic",
+        eval_metric="logloss",
+        random_state=42,
+        n_estimators=100,
+        max_depth=4,
+        learning_rate=0.1,
+        tree_method="hist",
+        enable_categorical=encoding == "native",
+        n_jobs=1
+    )
+
+
+def latency_ms(func, repeats: int) -> float:
+    """
+    Returns the median latency of func in milliseconds
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings)) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--data", default="processed/transplant_data.csv")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    X_raw, y = load_training_data(args.data)
+    cv = StratifiedKFold(n_splits=5, shuffle=True, random_state=42)
+    single_row = X_raw.iloc[[0]]
+    batch = X_raw.sample(args.batch_size, replace=True, random_state=42)
+
+    print(f"{'encoding':<10}{'width':>7}{'fit, s':>9}{'1 row, ms':>11}{'batch, ms':>11}{'AUC':>14}")
+    for encoding in ENCODINGS:
+        X, preprocessing_objects = fit_preprocessing(X_raw, encoding=encoding)
+
+        model, fit_params = apply_balancing(make_model(encoding), y)
+        start = time.perf_counter()
+        model.fit(X, y, **fit_params)
+        fit_time = time.perf_counter() - start
+
+        # Задержка инференса включает кодирование входа, как в api.py
+        one = latency_ms(lambda: model.predict_proba(encode_features(single_row, preprocessing_objects)), args.repeats)
+        many = latency_ms(lambda: model.predict_proba(encode_features(batch, preprocessing_objects)), args.repeats // 10 or 1)
+
+        cv_model, cv_fit_params = apply_balancing(make_model(encoding), y)
+        scores = cross_val_score(cv_model, X, y, cv=cv, scoring="roc_auc", fit_params=cv_fit_params)
+        print(f"{encoding:<10}{X.shape[1]:>7}{fit_time:>9.2f}{one:>11.2f}{many:>11.2f}"
+              f"{np.mean(scores):>8.3f}±{np.std(scores):.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Scoring latency of a bootstrap ensemble: member-by-member XGBoost predict_proba
+vs one vectorized pass over the packed forest, and the agreement of both
+
+Usage: python -m benchmarks.ensemble_latency [--members 20] [--budget-ms 5]
+"""
+import argparse
+import sys
+import time
+
+import numpy as np
+
+from XGBoost_ensemble import train_member
+from utils.packed_trees import stack_boosters
+from utils.training import fit_preprocessing, load_training_data
+
+
+def latency_ms(func, repeats: int) -> float:
+    """
+    Returns the median latency of func in milliseconds
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Packed-forest vs per-member ensemble scoring")
+    parser.add_argument("--data", default="processed/transplant_data.csv")
+    parser.add_argument("--members", type=int, default=20)
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=30)
+    parser.add_argument("--budget-ms", type=float, default=5.0,
+                        help="Latency budget of a single-row packed evaluation (exit code 1 if exceeded)")
+    args = parser.parse_args()
+
+    X, y = load_training_data(args.data)
+    X, _ = fit_preprocessing(X, encoding="onehot")
+    params = {"n_estimators": 100, "max_depth": 4, "learning_rate": 0.1}
+    members = [train_member(X, y, seed, params) for seed in range(args.members)]
+    forest = stack_boosters(members)
+    print(f"{args.members} members, {forest.n_trees} trees, depth {forest.max_depth}")
+
+    rows = X.sample(max(args.batch_sizes), replace=True, random_state=0).to_numpy(dtype=np.float32)
+    loop_probs = np.column_stack([member.predict_proba(rows)[:, 1] for member in members])
+    print(f"Max |packed - xgboost| probability: {np.abs(forest.predict_proba(rows) - loop_probs).max():.2e}")
+
+    print(f"\n{'batch':>7} {'per-member ms':>14} {'packed ms':>10} {'speedup':>8}")
+    single_row_ms = None
+    for batch_size in args.batch_sizes:
+        batch = rows[:batch_size]
+        loop = latency_ms(lambda: [member.predict_proba(batch) for member in members], args.repeats)
+        packed = latency_ms(lambda: forest.predict_proba(batch), args.repeats)
+        if batch_size == 1:
+            single_row_ms = packed
+        print(f"{batch_size:>7} {loop:>14.2f} {packed:>10.2f} {loop / packed:>7.1f}x")
+
+    if single_row_ms is not None:
+        within = single_row_ms <= args.budget_ms
+        print(f"\nSingle row: {single_row_ms:.2f} ms (budget {args.budget_ms} ms) - {'OK' if within else 'EXCEEDED'}")
+        if not within:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
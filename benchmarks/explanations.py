@@ -0,0 +1,76 @@
+"""
+Latency cost of per-prediction explanations (TreeSHAP pred_contribs folded to the original fields):
+model-level for several batch sizes and end-to-end for /predict and /predict/batch
+
+Usage: python -m benchmarks.explanations [--batch-sizes 1 10 100 1000 10000]
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+from fastapi.testclient import TestClient
+
+from benchmarks.payloads import synthetic_payloads
+from utils.scoring import fill_default_fields
+
+
+def latency_ms(func, repeats: int) -> float:
+    """
+    Returns the median latency of func in milliseconds
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Latency of TreeSHAP explanations")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 10, 100, 1000, 10000])
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+
+    import api
+
+    payloads = synthetic_payloads(api.TransplantData, max(args.batch_sizes))
+    frame = fill_default_fields(pd.DataFrame(payloads))
+    bundle = api.bundle
+
+    print("=== Model level (encode + predict [+ explain]) ===")
+    print(f"{'batch':>7} {'predict ms':>11} {'+explain ms':>12} {'overhead':>9} {'explain us/row':>15}")
+    for batch_size in args.batch_sizes:
+        X_raw = frame.iloc[:batch_size]
+        repeats = max(3, args.repeats * 100 // max(batch_size, 100))
+
+        def predict():
+            return bundle.predict_proba(bundle.encode(X_raw))
+
+        def predict_explain():
+            X = bundle.encode(X_raw)
+            return bundle.predict_proba(X), bundle.explain(X)
+
+        base = latency_ms(predict, repeats)
+        explained = latency_ms(predict_explain, repeats)
+        print(f"{batch_size:>7} {base:>11.2f} {explained:>12.2f} {explained / base:>8.2f}x "
+              f"{(explained - base) * 1000 / batch_size:>15.1f}")
+
+    print("\n=== API (in-process) ===")
+    client = TestClient(api.app)
+    batch = payloads[:100]
+    cases = [
+        ("/predict", payloads[0]),
+        ("/predict?explain=true", payloads[0]),
+        ("/predict/batch (100)", batch),
+        ("/predict/batch?explain=true (100)", batch),
+    ]
+    for name, body in cases:
+        url = name.split(" ")[0]
+        client.post(url, json=body)
+        print(f"- {name:<36} {latency_ms(lambda: client.post(url, json=body), args.repeats):8.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""
+Donor search over a synthetic HLA registry: inverted-index search vs a vectorized full scan
+of all typings (results are checked to be identical), and end-to-end /donors/search latency
+
+Usage: python -m benchmarks.hla_search [--donors 1000000] [--write donors.parquet] [--api]
+"""
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from utils.hla import HLA_COLUMNS, DonorRegistry
+
+# Частые аллели каждого локуса (по убыванию частоты), дальше - длинный хвост редких
+COMMON_ALLELES = {
+    "A": ["02:01", "01:01", "03:01", "24:02", "11:01", "68:01", "29:02", "32:01", "26:01", "31:01",
+          "23:01", "25:01", "30:01", "33:01", "02:05"],
+    "B": ["07:02", "08:01", "44:02", "35:01", "15:01", "51:01", "18:01", "40:01", "44:03", "57:01",
+          "14:02", "27:05", "13:02", "38:01", "52:01"],
+    "C": ["07:01", "07:02", "04:01", "06:02", "05:01", "03:04", "12:03", "02:02", "03:03", "08:02",
+          "16:01", "15:02", "01:02", "14:02", "17:01"],
+    "DRB1": ["15:01", "07:01", "03:01", "04:01", "01:01", "13:01", "11:01", "13:02", "14:01", "12:01",
+             "16:01", "08:01", "04:04", "11:04", "10:01"],
+    "DQB1": ["03:01", "06:02", "02:01", "05:01", "03:02", "02:02", "06:03", "06:04", "05:03", "03:03",
+             "04:02", "05:02", "06:09", "03:19", "06:01"],
+}
+RARE_ALLELES_PER_LOCUS = 60
+
+
+def synthetic_registry(n: int, seed: int = 42) -> pd.DataFrame:
+    """
+    Donor registry with Zipf-distributed alleles drawn independently per locus
+    (no haplotype linkage), donor ages and sexes, and 10% of donors untyped at DQB1
+    """
+    rng = np.random.default_rng(seed)
+    donors = {
+        "donor_id": [f"D{i:08d}" for i in range(n)],
+        "donor_age": rng.integers(18, 61, n),
+        "donor_sex": rng.choice(["M", "F"], n),
+    }
+    for locus, (first_col, second_col) in HLA_COLUMNS.items():
+        alleles = COMMON_ALLELES[locus] + [f"{90 + i // 10}:{i % 10 + 1:02d}" for i in range(RARE_ALLELES_PER_LOCUS)]
+        weights = 1 / np.arange(1, len(alleles) + 1) ** 1.1
+        names = np.array([f"{locus}*{allele}" for allele in alleles], dtype=object)
+        donors[first_col] = names[rng.choice(len(names), n, p=weights / weights.sum())]
+        donors[second_col] = names[rng.choice(len(names), n, p=weights / weights.sum())]
+    frame = pd.DataFrame(donors)
+    untyped = rng.random(n) < 0.1
+    frame.loc[untyped, list(HLA_COLUMNS["DQB1"])] = None
+    return frame
+
+
+def latency_ms(func, repeats: int) -> float:
+    """
+    Returns the median latency of func in milliseconds
+    """
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - start)
+    return float(np.median(timings) * 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inverted-index HLA donor search benchmark")
+    parser.add_argument("--donors", type=int, default=1_000_000)
+    parser.add_argument("--patients", type=int, default=20, help="Patients (typings of random donors) to search for")
+    parser.add_argument("--min-matches", nargs="+", type=int, default=[6, 8, 9, 10])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--write", help="Also save the registry (CSV or Parquet) for GENOMATCH_DONOR_REGISTRY")
+    parser.add_argument("--api", action="store_true", help="Measure /donors/search in-process")
+    args = parser.parse_args()
+
+    donors = synthetic_registry(args.donors)
+    if args.write:
+        if args.write.endswith(".parquet"):
+            donors.to_parquet(args.write, index=False)
+        else:
+            donors.to_csv(args.write, index=False)
+        print(f"Registry written to {args.write}")
+
+    start = time.perf_counter()
+    registry = DonorRegistry(donors)
+    print(f"{len(registry)} donors, index built in {time.perf_counter() - start:.2f}s "
+          f"({len(registry.index.postings)} posting lists)")
+
+    rng = np.random.default_rng(0)
+    patients = [registry.index.typing(int(p)) for p in rng.integers(0, len(registry), args.patients)]
+
+    print(f"\n{'min matches':>11} {'candidates':>11} {'index ms':>9} {'scan ms':>8} {'speedup':>8}")
+    for min_matches in args.min_matches:
+        found, index_ms, scan_ms = [], [], []
+        for patient in patients:
+            positions, counts = registry.index.search(patient, min_matches)
+            scan_positions, scan_counts = registry.index.scan(patient, min_matches)
+            if not (np.array_equal(positions, scan_positions) and np.array_equal(counts, scan_counts)):
+                raise AssertionError(f"Index and scan disagree at min_matches={min_matches}")
+            found.append(len(positions))
+            index_ms.append(latency_ms(lambda: registry.index.search(patient, min_matches), args.repeats))
+            scan_ms.append(latency_ms(lambda: registry.index.scan(patient, min_matches), args.repeats))
+        index, scan = np.median(index_ms), np.median(scan_ms)
+        print(f"{min_matches:>11} {np.median(found):>11.0f} {index:>9.2f} {scan:>8.2f} {scan / index:>7.1f}x")
+
+    if args.api:
+        path = os.path.join(tempfile.mkdtemp(prefix="donors_"), "donors.parquet")
+        donors.to_parquet(path, index=False)
+        os.environ["GENOMATCH_DONOR_REGISTRY"] = path
+        from fastapi.testclient import TestClient
+        import api
+
+        client = TestClient(api.app)
+        print("\n=== /donors/search (in-process) ===")
+        for min_matches in args.min_matches:
+            bodies = [{
+                "patient_hla": {locus: list(alleles) for locus, alleles in patient.items()},
+                "patient_age": 35, "patient_sex": "F", "diagnosis": "AML", "conditioning_regimen": "myeloablative",
+                "source_of_cells": "PBSC", "days_from_diagnosis_to_hct": 45, "cd34_dose": 6.7,
+                "min_matches": min_matches,
+            } for patient in patients]
+            timings = [latency_ms(lambda: client.post("/donors/search", json=body), args.repeats) for body in bodies]
+            scored = [client.post("/donors/search", json=body).json()["scored"] for body in bodies]
+            print(f"- min_matches={min_matches:<3} {np.median(timings):8.2f} ms (median {np.median(scored):.0f} donors scored)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+"""
+Times and memory-profiles the ingestion stages on synthetic raw data:
+preprocess_data of every source, combine_datasets (with record linkage) and validate_dataframe.
+Rows are split evenly between the four sources, so the combined frame has --rows rows.
+--shared of the P5303 rows are replaced by UAE patients as P5303 reports them, and the share of
+these pairs that record linkage merges is reported as the linkage recall
+
+Usage: python -m benchmarks.ingestion [--rows 10000 100000 1000000] [--shared 0.05] [--output results.json]
+"""
+import argparse
+import contextlib
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from typing import Callable, Dict, Tuple
+
+import numpy as np
+import pandas as pd
+
+from benchmarks.synthetic_sources import SOURCES, generate_source
+from data_sources.bone_marrow import preprocess_data as bone_marrow_preprocess
+from data_sources.p5191 import preprocess_data as p5191_preprocess
+from data_sources.p5303 import preprocess_data as p5303_preprocess
+from data_sources.uae import preprocess_data as uae_preprocess
+from pipeline import combine_datasets
+from utils.linkage import CLUSTER_COLUMN, LABEL_COLUMNS, SOURCE_COLUMN
+from utils.validate_dataframe import validate_dataframe
+
+PREPROCESSORS = {
+    'UAE': uae_preprocess,
+    'Bone Marrow': bone_marrow_preprocess,
+    'P5191': p5191_preprocess,
+    'P5303': p5303_preprocess,
+}
+
+# Пара источников, у которой достаточно общих идентифицирующих полей для связывания:
+# пациенты первого подсаживаются во второй
+SHARED_SOURCES = ('UAE', 'P5303')
+
+
+def plant_shared_patients(frames: Dict[str, pd.DataFrame], share: float, seed: int) -> pd.DataFrame:
+    """
+    Replaces the identifying fields filled in both SHARED_SOURCES of `share` of the second source's rows
+    by those of random patients of the first source, re-encoded the way the second source reports them
+    (age in whole years, time to HCT after a unit conversion within 5%); labels and the second source's
+    own fields keep their values. Returns the planted pairs (index in the first source, index in the second)
+    """
+    first, second = (frames[name] for name in SHARED_SOURCES)
+    fields = [col for col in first.columns if col in second.columns and col not in (*LABEL_COLUMNS, SOURCE_COLUMN)
+              and first[col].notna().any() and second[col].notna().any()]
+    rng = np.random.default_rng(seed)
+    n_pairs = int(min(len(first), len(second)) * share)
+    pairs = pd.DataFrame({
+        'first': rng.choice(first.index.to_numpy(), n_pairs, replace=False),
+        'second': rng.choice(second.index.to_numpy(), n_pairs, replace=False),
+    })
+    patients = first.loc[pairs['first'], fields].reset_index(drop=True)
+    if 'patient_age' in patients:
+        patients['patient_age'] = np.floor(patients['patient_age'])
+    if 'days_from_diagnosis_to_hct' in patients:
+        patients['days_from_diagnosis_to_hct'] *= rng.uniform(0.95, 1.05, n_pairs)
+    patients.index = pairs['second'].to_numpy()
+    second = second.copy()
+    second.loc[patients.index, fields] = patients
+    frames[SHARED_SOURCES[1]] = second
+    return pairs
+
+
+def linkage_recall(pairs: pd.DataFrame, linkage_path: str) -> float:
+    """
+    Share of the planted pairs whose records ended up in the same cluster
+    """
+    linkage = pd.read_csv(linkage_path).set_index([SOURCE_COLUMN, 'source_row'])[CLUSTER_COLUMN]
+    first = linkage.loc[[(SHARED_SOURCES[0], row) for row in pairs['first']]].to_numpy()
+    second = linkage.loc[[(SHARED_SOURCES[1], row) for row in pairs['second']]].to_numpy()
+    return float(np.mean(first == second)) if len(pairs) else float('nan')
+
+
+def measure(func: Callable, profile_memory: bool) -> Tuple[object, Dict]:
+    """
+    Runs func with its (verbose) output silenced
+    Returns the result and the wall time; with profile_memory the call is repeated
+    under tracemalloc to get the peak of allocations, so tracing does not distort the timing
+    """
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        start = time.perf_counter()
+        result = func()
+        stats = {'seconds': time.perf_counter() - start}
+        if profile_memory:
+            del result
+            tracemalloc.start()
+            try:
+                result = func()
+                stats['peak_mb'] = tracemalloc.get_traced_memory()[1] / 2 ** 20
+            finally:
+                tracemalloc.stop()
+    return result, stats
+
+
+def run(total_rows: int, profile_memory: bool, seed: int, shared: float) -> Dict[str, Dict]:
+    rows_per_source = total_rows // len(SOURCES)
+    results = {}
+    frames = {}
+    for i, source_name in enumerate(SOURCES):
+        raw_df = generate_source(source_name, rows_per_source, seed=seed + i)
+        df, stats = measure(lambda: PREPROCESSORS[source_name](raw_df), profile_memory)
+        results[f"preprocess {source_name}"] = {'rows': len(raw_df), **stats}
+        frames[source_name] = df.assign(source=source_name)
+        del raw_df
+    pairs = plant_shared_patients(frames, shared, seed)
+    processed = list(frames.values())
+    del frames
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        linkage_path = os.path.join(tmp_dir, 'linkage.csv')
+        combined, stats = measure(lambda: combine_datasets(processed, report, linkage_path), profile_memory)
+        recall = linkage_recall(pairs, linkage_path)
+    results['combine_datasets'] = {'rows': sum(len(df) for df in processed), **stats,
+                                   'comparisons': report['linkage']['comparisons'],
+                                   'removed': report['linkage']['removed'],
+                                   'planted': len(pairs), 'recall': recall}
+    del processed
+
+    _, stats = measure(lambda: validate_dataframe(combined), profile_memory)
+    results['validate_dataframe'] = {'rows': len(combined), **stats}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Ingestion benchmark on synthetic raw sources")
+    parser.add_argument("--rows", nargs="+", type=int, default=[10_000, 100_000, 1_000_000],
+                        help="Total raw rows per run, split evenly between the sources")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--shared", type=float, default=0.05,
+                        help=f"Share of {SHARED_SOURCES[1]} rows replaced by {SHARED_SOURCES[0]} patients")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    args = parser.parse_args()
+
+    all_results = {}
+    for total_rows in args.rows:
+        print(f"\n=== {total_rows} rows ===")
+        results = run(total_rows, not args.no_memory, args.seed, args.shared)
+        for stage, stats in results.items():
+            line = f"- {stage:<24} {stats['rows']:>9} rows  {stats['seconds']:8.2f} s  {stats['rows'] / stats['seconds']:>12,.0f} rows/s"
+            if 'peak_mb' in stats:
+                line += f"  peak {stats['peak_mb']:8.1f} MB"
+            if 'comparisons' in stats:
+                line += (f"  ({stats['comparisons']:,} pair comparisons, {stats['removed']} merged, "
+                         f"recall {stats['recall']:.1%} of {stats['planted']} shared patients)")
+            print(line)
+        all_results[str(total_rows)] = results
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(all_results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+"""
+Latency of scoring every transplant outcome: one model per outcome with its own encoding
+(N separate services), one shared encoding with per-model predict_proba, and one shared encoding
+with a single pass over the packed forest of all outcome models
+
+Usage: python -m benchmarks.outcome_latency [--batch-sizes 1 10 100 1000]
+"""
+import argparse
+
+import numpy as np
+
+from benchmarks.ensemble_latency import latency_ms
+from XGBoost_multioutcome import train_outcome
+from utils.encoding import encode_features
+from utils.outcomes import OUTCOMES, load_outcome_data
+from utils.packed_trees import stack_boosters
+from utils.scoring import fill_default_fields
+from utils.training import fit_preprocessing
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Per-outcome vs packed multi-outcome scoring")
+    parser.add_argument("--data", default="processed/transplant_data.csv")
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 10, 100, 1000])
+    parser.add_argument("--repeats", type=int, default=30)
+    args = parser.parse_args()
+
+    raw, labels = load_outcome_data(args.data)
+    X, preprocessing_objects = fit_preprocessing(raw, encoding="onehot")
+    params = {"n_estimators": 100, "max_depth": 4, "learning_rate": 0.1}
+    models = []
+    for outcome in OUTCOMES:
+        labelled = labels[outcome].notna().to_numpy()
+        models.append(train_outcome(X[labelled], labels[outcome][labelled].astype(int), params))
+    forest = stack_boosters(models)
+    print(f"{len(models)} outcomes, {forest.n_trees} trees, depth {forest.max_depth}, {X.shape[1]} features")
+
+    # Сырые строки запросов: поля API плюс значения по умолчанию
+    requests = fill_default_fields(raw.sample(max(args.batch_sizes), replace=True, random_state=0).reset_index(drop=True))
+    encoded = encode_features(requests, preprocessing_objects).to_numpy(dtype=np.float32)
+    loop_probs = np.column_stack([model.predict_proba(encoded)[:, 1] for model in models])
+    print(f"Max |packed - xgboost| probability: {np.abs(forest.predict_proba(encoded) - loop_probs).max():.2e}")
+
+    def separate(batch):
+        # Каждый исход как отдельный сервис: своя предобработка и свой вызов модели
+        return [model.predict_proba(encode_features(batch, preprocessing_objects))[:, 1] for model in models]
+
+    def shared_loop(batch):
+        features = encode_features(batch, preprocessing_objects)
+        return [model.predict_proba(features)[:, 1] for model in models]
+
+    def packed(batch):
+        return forest.predict_proba(encode_features(batch, preprocessing_objects))
+
+    print(f"\n{'batch':>7} {'separate ms':>12} {'shared enc ms':>14} {'packed ms':>10} {'speedup':>8}")
+    for batch_size in args.batch_sizes:
+        batch = requests.iloc[:batch_size]
+        separate_ms = latency_ms(lambda: separate(batch), args.repeats)
+        shared_ms = latency_ms(lambda: shared_loop(batch), args.repeats)
+        packed_ms = latency_ms(lambda: packed(batch), args.repeats)
+        print(f"{batch_size:>7} {separate_ms:>12.2f} {shared_ms:>14.2f} {packed_ms:>10.2f} "
+              f"{separate_ms / packed_ms:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Synthetic API payloads drawn from the empirical distributions of the harmonized dataset
+"""
+from typing import Dict, List, Type
+
+import numpy as np
+import pandas as pd
+from pydantic import BaseModel
+
+from utils.constants import CATEGORY_SETS
+from utils.validate_dataframe import NUMERIC_RANGES
+
+
+def synthetic_payloads(model_cls: Type[BaseModel], n: int, data_path: str = "processed/transplant_data.csv",
+                       seed: int = 42) -> List[Dict]:
+    """
+    Generates n request bodies for a pydantic model.
+    Every field is sampled independently from the observed (non-missing) values of the same column;
+    fields absent from the dataset fall back to the vocabulary or the validated numeric range
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.read_csv(data_path, low_memory=False)
+
+    columns = {}
+    for name, field in model_cls.model_fields.items():
+        is_str = field.annotation is str
+        observed = df[name].dropna() if name in df.columns else pd.Series(dtype=object)
+        if is_str:
+            observed = observed.astype(str)
+        else:
+            observed = pd.to_numeric(observed, errors='coerce').dropna()
+
+        if len(observed):
+            frequencies = observed.value_counts(normalize=True)
+            values = rng.choice(frequencies.index.to_numpy(), size=n, p=frequencies.to_numpy())
+        elif is_str:
+            values = rng.choice(CATEGORY_SETS.get(name, ["unknown"]), size=n)
+        else:
+            low, high = NUMERIC_RANGES.get(name, (0, 100))
+            values = rng.uniform(low, high, size=n)
+
+        if field.annotation is int:
+            values = np.rint(values.astype(float)).astype(int)
+        columns[name] = values.tolist()
+
+    return [{name: columns[name][i] for name in columns} for i in range(n)]
@@ -0,0 +1,196 @@
+"""
+Memory and startup time of N API workers: `uvicorn api:app --workers N` (every worker imports
+the stack and loads the models itself) against serve.py (one preloaded master, forked workers
+sharing its pages copy-on-write). Memory is read from /proc/<pid>/smaps_rollup after the workers
+have served traffic: RSS counts shared pages in every process, PSS splits them between the
+processes sharing them, so the sum of PSS is the real footprint. For serve.py it also sends
+SIGHUP under load and reports the rolling restart time and failed requests
+
+Usage: python -m benchmarks.serving_memory [--workers 4] [--requests 2000]
+"""
+import argparse
+import asyncio
+import os
+import re
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+
+import httpx
+
+from benchmarks.api_load import drive, free_port
+from benchmarks.payloads import synthetic_payloads
+
+READY_LINE = "Application startup complete"
+RESTART_LINE = re.compile(r"rolling restart finished in ([\d.]+)s")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Per-worker memory and startup time of uvicorn --workers vs serve.py")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests served before memory is measured")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--data", default="processed/transplant_data.csv")
+    parser.add_argument("--timeout", type=float, default=120, help="Seconds to wait for the workers")
+    return parser.parse_args()
+
+
+def memory_kb(pid: int) -> Optional[Dict[str, int]]:
+    """
+    RSS, PSS and private (unshared) memory of a process in kB (Linux 4.14+), None where unavailable
+    """
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            fields = dict(line.split(":", 1) for line in f.read().splitlines()[1:])
+    except OSError:
+        return None
+    kb = {name: int(value.split()[0]) for name, value in fields.items()}
+    return {"rss": kb["Rss"], "pss": kb["Pss"], "private": kb["Private_Clean"] + kb["Private_Dirty"]}
+
+
+def child_pids(pid: int) -> List[int]:
+    """
+    Direct children of a process, without multiprocessing's resource tracker
+    """
+    children = []
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read()
+        except (OSError, ValueError, IndexError):
+            continue
+        if ppid == pid and b"resource_tracker" not in cmdline:
+            children.append(int(entry))
+    return sorted(children)
+
+
+def read_log(path: str) -> str:
+    with open(path, errors="replace") as f:
+        return f.read()
+
+
+def wait_for(predicate, server: subprocess.Popen, log_path: str, timeout: float) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"Server exited with code {server.returncode}:\n{read_log(log_path)}")
+        if predicate(read_log(log_path)):
+            return
+        time.sleep(0.05)
+    raise RuntimeError(f"Timed out waiting for the server:\n{read_log(log_path)}")
+
+
+async def rolling_restart_under_load(base_url: str, server: subprocess.Popen, log_path: str, payloads: List[Dict],
+                                     args) -> Dict:
+    """
+    Sends SIGHUP while requests are running. A keep-alive connection that a stopping worker closes
+    just as a request is sent on it fails on the client; /predict is a pure function,
+    so such requests are retried once, like HTTP clients do on a reset idle connection
+    """
+    counts = {"requests": 0, "resets": 0, "errors": 0}
+    pending = iter(range(args.requests))
+
+    async def worker(client: httpx.AsyncClient):
+        for i in pending:
+            counts["requests"] += 1
+            for _ in range(2):
+                try:
+                    response = await client.post("/predict", json=payloads[i % len(payloads)])
+                except httpx.TransportError:
+                    counts["resets"] += 1
+                    continue
+                if response.status_code != 200:
+                    counts["errors"] += 1
+                break
+            else:
+                counts["errors"] += 1
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+        load = asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        await asyncio.sleep(0.2)
+        server.send_signal(signal.SIGHUP)
+        await load
+    wait_for(lambda text: RESTART_LINE.search(text), server, log_path, args.timeout)
+    return {"seconds": float(RESTART_LINE.search(read_log(log_path)).group(1)), **counts}
+
+
+def run_mode(mode: str, payloads: List[Dict], args) -> Dict:
+    port = free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    if mode == "uvicorn":
+        command = [sys.executable, "-m", "uvicorn", "api:app", "--workers", str(args.workers)]
+    else:
+        command = [sys.executable, "serve.py", "--workers", str(args.workers)]
+    command += ["--host", "127.0.0.1", "--port", str(port), "--log-level", "info"]
+
+    with tempfile.NamedTemporaryFile(prefix=f"serving_{mode}_", suffix=".log", delete=False) as log_file:
+        log_path = log_file.name
+    with open(log_path, "w") as log:
+        start = time.perf_counter()
+        server = subprocess.Popen(command, stdout=log, stderr=subprocess.STDOUT)
+    try:
+        # Сервер готов, когда все N воркеров завершили startup
+        wait_for(lambda text: text.count(READY_LINE) >= args.workers, server, log_path, args.timeout)
+        result = {"startup_s": time.perf_counter() - start}
+
+        async def serve_traffic():
+            limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+            async with httpx.AsyncClient(base_url=base_url, limits=limits) as client:
+                return await drive(client, payloads, args.concurrency, args.requests)
+
+        # Память меряется после трафика: страницы, записанные воркерами, уже скопированы
+        traffic = asyncio.run(serve_traffic())
+        result["rps"] = traffic["rps"]
+        result["errors"] = traffic["errors"]
+        result["master"] = memory_kb(server.pid)
+        result["workers"] = [memory for memory in map(memory_kb, child_pids(server.pid)) if memory is not None]
+
+        if mode == "prefork":
+            result["restart"] = asyncio.run(rolling_restart_under_load(base_url, server, log_path, payloads, args))
+        return result
+    finally:
+        server.terminate()
+        try:
+            server.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            server.kill()
+        os.remove(log_path)
+
+
+def main():
+    args = parse_args()
+
+    from api import TransplantData
+    payloads = synthetic_payloads(TransplantData, 1000, args.data)
+
+    results = {}
+    for mode in ("uvicorn", "prefork"):
+        print(f"Starting {mode} with {args.workers} workers...")
+        results[mode] = run_mode(mode, payloads, args)
+
+    print(f"\n{'mode':<9} {'startup s':>10} {'rps':>8} {'worker RSS MB':>14} {'worker PSS MB':>14} "
+          f"{'worker private MB':>18} {'total PSS MB':>13}")
+    for mode, result in results.items():
+        workers = result["workers"]
+        processes = workers + ([result["master"]] if result["master"] else [])
+        mean = {key: sum(w[key] for w in workers) / len(workers) / 1024 for key in ("rss", "pss", "private")}
+        total_pss = sum(p["pss"] for p in processes) / 1024
+        print(f"{mode:<9} {result['startup_s']:>10.2f} {result['rps']:>8.1f} {mean['rss']:>14.1f} {mean['pss']:>14.1f} "
+              f"{mean['private']:>18.1f} {total_pss:>13.1f}")
+
+    restart = results["prefork"]["restart"]
+    print(f"\nRolling restart (SIGHUP) of {args.workers} prefork workers under load: {restart['seconds']:.2f}s, "
+          f"{restart['errors']} failed of {restart['requests']} requests "
+          f"({restart['resets']} closed keep-alive connections retried)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+Synthetic raw datasets in the layout of every source (column names, dtypes, value codes).
+Mapped columns are drawn from the keys of the maps in utils/constants.py (text keys for the UAE
+and bone-marrow files, numeric codes for the SAS exports); the other columns are resampled
+from the checked-in raw file of the same source
+
+Usage: python -m benchmarks.synthetic_sources --rows 100000 --out-dir synthetic_datasets
+"""
+import argparse
+import contextlib
+import os
+from typing import Callable, Dict, NamedTuple, Optional
+
+import numpy as np
+import pandas as pd
+
+from data_sources.bone_marrow import load_raw_data as bone_marrow_load
+from data_sources.p5191 import load_raw as p5191_load
+from data_sources.p5303 import load_raw as p5303_load
+from data_sources.uae import load_raw as uae_load
+from utils.constants import (
+    ACUTE_GVHD_GRADE_MAP,
+    CONDITIONING_REGIMEN_MAP,
+    DIAGNOSIS_MAP,
+    DISEASE_STATUS_MAP,
+    DONOR_RELATION_MAP,
+    GVHD_PROPHYLAXIS_MAP,
+    PATIENT_ETHNICITY_MAP,
+    SEX_MAP,
+    SOURCE_OF_CELLS_MAP,
+)
+
+
+class SourceSpec(NamedTuple):
+    load_template: Callable[[], pd.DataFrame]
+    # Сырая колонка -> словарь из utils/constants.py, ключи которого служат значениями
+    mapped_columns: Dict[str, dict]
+    # Коды SAS хранятся числами, в xlsx/csv - текстом
+    numeric_codes: bool
+    file_name: str
+    # Идентификаторы пациентов генерируются уникальными, а не пересэмплируются
+    id_columns: tuple = ()
+
+
+SOURCES = {
+    'UAE': SourceSpec(
+        uae_load,
+        {
+            'R_Sex': SEX_MAP,
+            'Nationality': PATIENT_ETHNICITY_MAP,
+            'Hemaological Diagnosis': DIAGNOSIS_MAP,
+            'D_relation': DONOR_RELATION_MAP,
+            'D_sex': SEX_MAP,
+            'GVHD Prophylaxis': GVHD_PROPHYLAXIS_MAP,
+            'GVHD severity ': ACUTE_GVHD_GRADE_MAP,
+        },
+        numeric_codes=False,
+        file_name='uae.xlsx',
+    ),
+    'Bone Marrow': SourceSpec(
+        bone_marrow_load,
+        {
+            'recipient_gender': SEX_MAP,
+            'disease': DIAGNOSIS_MAP,
+            'stem_cell_source': SOURCE_OF_CELLS_MAP,
+        },
+        numeric_codes=False,
+        file_name='bone-marrow-dataset.csv',
+    ),
+    'P5191': SourceSpec(
+        p5191_load,
+        {
+            'sex': SEX_MAP,
+            'graftype': SOURCE_OF_CELLS_MAP,
+            'condint': CONDITIONING_REGIMEN_MAP,
+            'donorgp': DONOR_RELATION_MAP,
+            'gvhdgp': GVHD_PROPHYLAXIS_MAP,
+            'genotype': DIAGNOSIS_MAP,
+        },
+        numeric_codes=True,
+        file_name='p5191.parquet',
+        id_columns=('dummyid',),
+    ),
+    'P5303': SourceSpec(
+        p5303_load,
+        {
+            'sex': SEX_MAP,
+            'disease': DIAGNOSIS_MAP,
+            'graftype': SOURCE_OF_CELLS_MAP,
+            'gvhdgp': GVHD_PROPHYLAXIS_MAP,
+            'ethgp': PATIENT_ETHNICITY_MAP,
+            'condint': CONDITIONING_REGIMEN_MAP,
+            'disgrade': DISEASE_STATUS_MAP,
+        },
+        numeric_codes=True,
+        file_name='p5303.parquet',
+        id_columns=('pseudoid',),
+    ),
+}
+
+# Лимит строк листа Excel (включая заголовок)
+XLSX_MAX_ROWS = 1_048_576
+
+_templates: Dict[str, pd.DataFrame] = {}
+
+
+def load_template(source_name: str) -> pd.DataFrame:
+    """
+    Loads (once) the checked-in raw file of a source, silencing the loader output
+    """
+    if source_name not in _templates:
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            _templates[source_name] = SOURCES[source_name].load_template()
+    return _templates[source_name]
+
+
+def map_keys(mapping: dict, numeric_codes: bool) -> np.ndarray:
+    """
+    Raw values a map accepts, in the representation the source uses
+    """
+    keys = [str(key) for key in mapping]
+    if numeric_codes:
+        return np.array([float(key) for key in keys if key.replace('.', '').isdigit()])
+    return np.array([key for key in keys if not key.replace('.', '').isdigit()], dtype=object)
+
+
+def generate_source(source_name: str, n_rows: int, seed: int = 42, noise: float = 0.05) -> pd.DataFrame:
+    """
+    Generates n_rows raw rows of a source.
+    noise - share of mapped cells taken from the real file instead of the map keys,
+    so unmapped codes and unknown markers (99, 'UNKNOWN') keep reaching the validation rules
+    """
+    spec = SOURCES[source_name]
+    template = load_template(source_name)
+    rng = np.random.default_rng(seed)
+
+    columns = {}
+    for col in template.columns:
+        observed = template[col].to_numpy()
+        values = observed[rng.integers(0, len(observed), n_rows)]
+        if col in spec.mapped_columns:
+            keys = map_keys(spec.mapped_columns[col], spec.numeric_codes)
+            from_map = rng.random(n_rows) >= noise
+            values = values.astype(float if spec.numeric_codes else object)
+            values[from_map] = rng.choice(keys, size=int(from_map.sum()))
+        elif col in spec.id_columns:
+            values = np.arange(n_rows, dtype=float) + 1_000_000
+        columns[col] = values
+
+    # Ресэмплинг через to_numpy сохраняет dtypes исходного файла
+    return pd.DataFrame(columns, columns=template.columns)
+
+
+def write_source(source_name: str, df: pd.DataFrame, out_dir: str) -> str:
+    """
+    Writes a generated source in its file format: xlsx (sheet "Origional Data") for UAE, CSV for bone marrow.
+    SAS exports cannot be written without SAS, so P5191/P5303 are saved as Parquet with the same variable codes
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    path = os.path.join(out_dir, SOURCES[source_name].file_name)
+    if path.endswith('.xlsx'):
+        if len(df) >= XLSX_MAX_ROWS:
+            raise ValueError(f"xlsx sheets hold at most {XLSX_MAX_ROWS - 1} data rows, got {len(df)}")
+        df.to_excel(path, sheet_name="Origional Data", index=False)
+    elif path.endswith('.csv'):
+        df.to_csv(path, index=False)
+    else:
+        df.rename(columns=str).to_parquet(path, index=False)
+    return path
+
+
+def main(argv: Optional[list] = None):
+    parser = argparse.ArgumentParser(description="Generate synthetic raw datasets in the layout of every source")
+    parser.add_argument("--rows", type=int, default=10_000, help="Rows per source")
+    parser.add_argument("--out-dir", default="synthetic_datasets")
+    parser.add_argument("--sources", nargs="+", choices=list(SOURCES), default=list(SOURCES))
+    parser.add_argument("--noise", type=float, default=0.05)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    for i, source_name in enumerate(args.sources):
+        df = generate_source(source_name, args.rows, seed=args.seed + i, noise=args.noise)
+        path = write_source(source_name, df, args.out_dir)
+        print(f"{source_name}: {len(df)} rows -> {path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""
+Serialization cost of /predict/batch per format. Requests: JSON rows parsed and validated into
+TransplantData objects the way the FastAPI body parameter did (json.loads, .dict() merge) and the
+way the endpoint does now (orjson, model_dump), against Arrow IPC and msgpack columns validated
+column-wise. Responses: PredictionResponse objects serialized by FastAPI with json.dumps, dicts
+built from score_frame columns with orjson, and columnar Arrow/msgpack. Also measures end-to-end
+/predict/batch in-process
+
+Usage: python -m benchmarks.wire_formats [--rows 10000]
+"""
+import argparse
+import json
+
+import orjson
+import pandas as pd
+import pyarrow as pa
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+from benchmarks.ensemble_latency import latency_ms
+from benchmarks.payloads import synthetic_payloads
+from utils.wire import ARROW_STREAM, JSON, MSGPACK, msgpack, write_columns
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Request/response serialization cost of /predict/batch per format")
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--repeats", type=int, default=10)
+    parser.add_argument("--data", default="processed/transplant_data.csv")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    import api
+
+    rows = synthetic_payloads(api.TransplantData, args.rows, args.data)
+    frame = pd.DataFrame(rows)
+    formats = [ARROW_STREAM] + ([MSGPACK] if msgpack is not None else [])
+    if msgpack is None:
+        print("msgpack is not installed, skipping it")
+
+    # Тела запросов: JSON-список объектов и колоночные форматы
+    bodies = {JSON: orjson.dumps(rows)}
+    for fmt in formats:
+        bodies[fmt] = write_columns(frame, fmt)
+
+    def fastapi_body():
+        items = api.BATCH_ADAPTER.validate_python(json.loads(bodies[JSON]))
+        return pd.DataFrame([{**item.dict(), **api.DEFAULT_FIELDS} for item in items])
+
+    # Разбор и валидация тела до DataFrame, который получает кодировщик признаков
+    decoders = [
+        ("json: FastAPI body parameter", JSON, fastapi_body),
+        ("json: orjson + TransplantData objects", JSON,
+         lambda: api.merge_items(api.read_batch(bodies[JSON], JSON, "benchmark"), "benchmark")),
+    ]
+    for fmt in formats:
+        decoders.append((f"{fmt}: column-wise", fmt, lambda fmt=fmt: api.read_batch(bodies[fmt], fmt, "benchmark")))
+
+    input_data = fastapi_body()
+    model_ms = latency_ms(lambda: api.bundle.predict_proba(api.bundle.encode(input_data)), args.repeats)
+    result = api.score_frame(input_data, False, "benchmark")
+    response_adapter = TypeAdapter(list[api.PredictionResponse])
+
+    def fastapi_response():
+        # Как FastAPI с response_model: объекты ответа, их сериализация в dict и json.dumps
+        responses = [api.PredictionResponse(**record) for record in api.response_records(result)]
+        content = response_adapter.dump_python(responses, mode="json", exclude_none=True)
+        return json.dumps(content, ensure_ascii=False).encode()
+
+    encoders = {
+        "json: PredictionResponse objects + json.dumps": fastapi_response,
+        "json: dicts from columns + orjson": lambda: orjson.dumps(api.response_records(result)),
+    }
+    for fmt in formats:
+        encoders[f"{fmt}: columns"] = lambda fmt=fmt: write_columns(result, fmt)
+
+    print(f"{args.rows} rows; encode + predict of the model: {model_ms:.1f} ms\n")
+    print(f"{'request decode + validation':<58} {'KB':>8} {'ms':>8} {'x model':>8}")
+    for name, fmt, decode in decoders:
+        decode_ms = latency_ms(decode, args.repeats)
+        print(f"{name:<58} {len(bodies[fmt]) / 1024:>8.0f} {decode_ms:>8.1f} {decode_ms / model_ms:>8.2f}")
+
+    print(f"\n{'response build + serialization':<58} {'KB':>8} {'ms':>8} {'x model':>8}")
+    for name, encode in encoders.items():
+        encode_ms = latency_ms(encode, args.repeats)
+        print(f"{name:<58} {len(encode()) / 1024:>8.0f} {encode_ms:>8.1f} {encode_ms / model_ms:>8.2f}")
+
+    client = TestClient(api.app)
+    print(f"\n{'end-to-end /predict/batch (in-process)':<58} {'ms':>8}")
+    for fmt in [JSON] + formats:
+        headers = {"content-type": fmt, "accept": fmt}
+
+        def post():
+            response = client.post("/predict/batch", content=bodies[fmt], headers=headers)
+            assert response.status_code == 200, response.text
+
+        print(f"{fmt:<58} {latency_ms(post, args.repeats):>8.1f}")
+
+    # Проверка: колоночный ответ совпадает с JSON
+    table = pa.ipc.open_stream(client.post("/predict/batch", content=bodies[ARROW_STREAM],
+                                           headers={"content-type": ARROW_STREAM}).content).read_all()
+    expected = [record["success_probability"] for record in api.response_records(result)]
+    actual = [f"{p * 100:.2f}%" for p in table.column("success_probability").to_pylist()]
+    print(f"\nArrow and JSON responses agree: {actual == expected}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+import argparse
+import os
+import time
+
+import pandas as pd
+
+from utils.cohort import STORE_PATH, build_store, explain_cohort, is_store, parse_filter, read_cohort
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Select a cohort of the harmonized dataset from the indexed store (or build the store)"
+    )
+    parser.add_argument("conditions", nargs="*", metavar="CONDITION",
+                        help='Conditions joined with AND: diagnosis=AML source_of_cells=PBSC "patient_age>50"; '
+                             'a comma list means IN (diagnosis=AML,ALL), != with a list means NOT IN')
+    parser.add_argument("--data", default=STORE_PATH, help="Cohort store (or the CSV, filtered in pandas)")
+    parser.add_argument("--columns", nargs="+", help="Columns to read (default: all)")
+    parser.add_argument("--output", help="Write the cohort to a .csv or .parquet file instead of printing it")
+    parser.add_argument("--explain", action="store_true", help="Print the query plan (index used) of the store")
+    parser.add_argument("--build", action="store_true",
+                        help="(Re)build the store from --csv first (pipeline.py does it on every run)")
+    parser.add_argument("--csv", default="processed/transplant_data.csv", help="Harmonized CSV for --build")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.build:
+        start = time.perf_counter()
+        build_store(pd.read_csv(args.csv), args.data)
+        print(f"Cohort store {args.data} built from {args.csv} in {time.perf_counter() - start:.2f}s")
+    if not os.path.exists(args.data):
+        raise SystemExit(f"{args.data} does not exist; run python pipeline.py or python cohort.py --build")
+
+    filters = [parse_filter(condition) for condition in args.conditions]
+    if args.explain and is_store(args.data):
+        for step in explain_cohort(args.data, args.columns, filters):
+            print(f"plan: {step}")
+
+    start = time.perf_counter()
+    df = read_cohort(args.data, args.columns, filters)
+    elapsed = time.perf_counter() - start
+    print(f"{len(df)} rows, {len(df.columns)} columns in {elapsed * 1000:.1f} ms")
+
+    if args.output:
+        if args.output.endswith(".parquet"):
+            df.to_parquet(args.output, index=False)
+        else:
+            df.to_csv(args.output, index=False)
+        print(f"Cohort saved to: {args.output}")
+    elif not df.empty:
+        with pd.option_context("display.width", 160, "display.max_columns", 30):
+            print(df.head(20).to_string())
+
+
+if __name__ == "__main__":
+    main()
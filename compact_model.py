@@ -0,0 +1,230 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import joblib
+import numpy as np
+from sklearn.metrics import log_loss, roc_auc_score
+from xgboost import XGBClassifier
+
+from utils.calibration import PROBABILITY_CALIBRATION_FILE, calibration_artifacts, fit_calibration
+from utils.compaction import (
+    PACKED_MODEL_FILE,
+    compact_preprocessing,
+    drop_unused_features,
+    load_classifier,
+    model_json,
+    select_iterations,
+    truncate_trees,
+)
+from utils.drift import DRIFT_SKETCHES_FILE
+from utils.packed_trees import PackedForest, stack_boosters
+from utils.registry import MODEL_FILE, PREPROCESSING_FILE, RUNS_DIR, get_run, promote_run, register_run
+from utils.serving import ModelBundle, load_bundle
+from utils.training import TARGET, holdout_mask, load_split, load_training_data, row_keys
+
+# Файлы исходного запуска, которые переносятся в сжатый без изменений
+CARRIED_ARTIFACTS = (DRIFT_SKETCHES_FILE,)
+
+# Допустимое ухудшение AUC и log-loss на отчетной выборке для --promote (листья float16 и т.п.)
+PROMOTE_TOLERANCE = 1e-3
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Compact a trained model: truncate to the best iteration, drop unused features, pack the trees"
+    )
+    parser.add_argument("--run", help="Registry run to compact (default: the promoted run of --kind, or models/)")
+    parser.add_argument("--kind", default=TARGET)
+    parser.add_argument("--data", default="processed/transplant_data.csv")
+    parser.add_argument("--iterations", type=int,
+                        help="Keep this many trees instead of the best iteration on validation log-loss")
+    parser.add_argument("--selection-share", type=float, default=0.6,
+                        help="Share of the test rows used with the calibration rows to choose the number of trees; "
+                             "the rest is the report split")
+    parser.add_argument("--leaf-precision", choices=("float32", "float16"), default="float32",
+                        help="Leaf values of the packed forest (float16: about 1e-4 of probability)")
+    parser.add_argument("--repeats", type=int, default=50, help="Repetitions of the latency measurements")
+    parser.add_argument("--promote", action="store_true", help="Promote the compacted run so that api.py serves it")
+    parser.add_argument("--allow-worse", action="store_true",
+                        help="Promote even if the compacted model has a lower AUC or higher log-loss on the report split")
+    return parser.parse_args()
+
+
+def median_ms(func, repeats: int) -> float:
+    func()
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times)) * 1000
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+
+    if args.run:
+        source = ModelBundle(os.path.join(RUNS_DIR, args.run), run_id=args.run)
+        source_params = get_run(args.run)["params"]
+    else:
+        source = load_bundle(args.kind)
+        source_params = get_run(source.run_id)["params"] if source.run_id else {}
+    native = source.preprocessing_objects.get('encoding') == 'native'
+    print(f"Model: {source.version} ({source.model_dir})")
+
+    # Строки, которых модель не видела: тестовые и калибровочные из разбиения запуска. Число деревьев
+    # выбирается на калибровочных строках и доле тестовых, отчет - на остальных тестовых
+    X, y = load_training_data(args.data)
+    split = load_split(source.model_dir)
+    if split is not None:
+        keys = row_keys(X, y)
+        trained = np.isin(keys, split['train'])
+        test = ~trained & np.isin(keys, split['test'])
+        calibration_rows = ~trained & ~test & np.isin(keys, split['calibration'])
+    else:
+        # Разбиение XGBoost.py (calibration_size до его записи в параметры был 0.2)
+        print("Warning: the run has no recorded split, the rows are split as XGBoost.py splits them")
+        test = holdout_mask(y, 0.2)
+        calibration_rows = np.zeros(len(y), dtype=bool)
+        if source.calibration is not None:
+            calibration_rows[~test] = holdout_mask(y[~test], source_params.get('calibration_size', 0.2))
+    report_rows = test.copy()
+    report_rows[test] = ~holdout_mask(y[test], args.selection_share)
+    selection_rows = (test | calibration_rows) & ~report_rows
+    X_val, y_val = X[selection_rows], y[selection_rows]
+    X_report, y_report = X[report_rows], y[report_rows]
+    print(f"Held-out rows: {selection_rows.sum()} to choose the number of trees "
+          f"({calibration_rows.sum()} of them calibration rows), {report_rows.sum()} for the report")
+
+    model = model_json(source.model)
+    n_trees = len(model["learner"]["gradient_booster"]["model"]["trees"])
+    if args.iterations:
+        best = min(args.iterations, n_trees)
+    else:
+        best, losses = select_iterations(model, source.model.get_booster(), source.encode(X_val), y_val.to_numpy(),
+                                         native)
+        print(f"Validation log-loss: {losses[-1]:.4f} with {n_trees} trees, {losses[best - 1]:.4f} with {best}")
+
+    compacted, kept = drop_unused_features(truncate_trees(model, best))
+    feature_names = [source.preprocessing_objects['feature_names'][i] for i in kept]
+    dropped = sorted(set(source.preprocessing_objects['feature_names']) - set(feature_names))
+    print(f"Trees: {n_trees} -> {best}; features: {len(source.preprocessing_objects['feature_names'])} -> "
+          f"{len(feature_names)}" + (f" (dropped {', '.join(dropped)})" if dropped else ""))
+
+    classifier = load_classifier(compacted, enable_categorical=native)
+    preprocessing_objects = compact_preprocessing(source.preprocessing_objects, feature_names)
+
+    staging_dir = tempfile.mkdtemp(prefix="compact_")
+    try:
+        classifier.save_model(os.path.join(staging_dir, MODEL_FILE))
+        joblib.dump(preprocessing_objects, os.path.join(staging_dir, PREPROCESSING_FILE))
+        artifacts = {}
+        if native:
+            print("Native categorical encoding: the trees are not packed (packed forests need one-hot features)")
+        else:
+            forest = stack_boosters([classifier]).compact(np.dtype(args.leaf_precision))
+            forest.save(os.path.join(staging_dir, PACKED_MODEL_FILE))
+            artifacts[PACKED_MODEL_FILE] = os.path.join(staging_dir, PACKED_MODEL_FILE)
+        for name in CARRIED_ARTIFACTS:
+            if os.path.exists(os.path.join(source.model_dir, name)):
+                shutil.copyfile(os.path.join(source.model_dir, name), os.path.join(staging_dir, name))
+                artifacts[name] = os.path.join(staging_dir, name)
+        # Таблица калибровки подобрана под вероятности всех деревьев: после усечения она обучается
+        # заново на калибровочных строках, а без них не переносится
+        calibration = source.calibration["method"] if source.calibration is not None else "none"
+        if calibration != "none" and best == n_trees:
+            shutil.copyfile(os.path.join(source.model_dir, PROBABILITY_CALIBRATION_FILE),
+                            os.path.join(staging_dir, PROBABILITY_CALIBRATION_FILE))
+            artifacts[PROBABILITY_CALIBRATION_FILE] = os.path.join(staging_dir, PROBABILITY_CALIBRATION_FILE)
+        elif calibration != "none" and calibration_rows.any():
+            truncated = ModelBundle(staging_dir)
+            raw = truncated.predict_proba(truncated.encode(X[calibration_rows]), calibrated=False)
+            table = fit_calibration(raw, y[calibration_rows].to_numpy(), calibration)
+            artifacts.update(calibration_artifacts(table, staging_dir))
+            print(f"Calibration ({calibration}) refitted for {best} trees on {calibration_rows.sum()} rows")
+        elif calibration != "none":
+            print("Calibration rows of the run are unknown, the compacted run is registered without calibration")
+            calibration = "none"
+        target = ModelBundle(staging_dir)
+        timings = {"compaction": time.perf_counter() - start}
+
+        # Отчет: размер, загрузка, задержка encode + predict, AUC и log-loss на отчетных строках
+        report, probabilities = {}, {}
+        rows = X.iloc[:1000]
+        for name, bundle in (("before", source), ("after", target)):
+            model_path = os.path.join(bundle.model_dir, MODEL_FILE)
+            probabilities[name] = bundle.predict_proba(bundle.encode(X_report))
+            report[name] = {
+                "trees": len(model_json(bundle.model)["learner"]["gradient_booster"]["model"]["trees"]),
+                "features": len(bundle.preprocessing_objects['feature_names']),
+                "model KB": os.path.getsize(model_path) / 1024,
+                "model load ms": median_ms(lambda: XGBClassifier().load_model(model_path), 10),
+                "1 row ms": median_ms(lambda: bundle.predict_proba(bundle.encode(rows.iloc[:1])), args.repeats),
+                "100 rows ms": median_ms(lambda: bundle.predict_proba(bundle.encode(rows.iloc[:100])), args.repeats),
+                "1000 rows ms": median_ms(lambda: bundle.predict_proba(bundle.encode(rows)), args.repeats // 5 or 1),
+                "holdout AUC": roc_auc_score(y_report, probabilities[name]),
+                "holdout logloss": log_loss(y_report, probabilities[name]),
+            }
+        if target.forest is not None:
+            packed_path = os.path.join(staging_dir, PACKED_MODEL_FILE)
+            report["after"]["packed KB"] = os.path.getsize(packed_path) / 1024
+            report["after"]["packed load ms"] = median_ms(lambda: PackedForest.load(packed_path), 10)
+
+        print(f"\n{'':<16} {'before':>10} {'after':>10}")
+        for key in report["after"]:
+            values = [report[name].get(key) for name in ("before", "after")]
+            print(f"{key:<16} " + " ".join(f"{value:>10.4f}" if isinstance(value, float) else
+                                          f"{'' if value is None else value:>10}" for value in values))
+
+        # Изменение вероятностей на отчетной выборке: усечение деревьев и точность листьев
+        delta = np.abs(probabilities["before"] - probabilities["after"])
+        print(f"\nMax |probability change| on the report split: {delta.max():.5f} (mean {delta.mean():.5f})")
+        if target.forest is not None:
+            X_after = target.encode(X_report)
+            packed_delta = np.abs(target.forest.predict_proba(X_after)[:, 0]
+                                  - target.model.predict_proba(X_after)[:, 1]).max()
+            print(f"Packed forest vs XGBoost predictor: max |difference| {packed_delta:.2e}")
+
+        params = {
+            **source_params,
+            "compacted_from": source.version,
+            "n_estimators_used": best,
+            "leaf_precision": args.leaf_precision,
+            "calibration": calibration,
+        }
+        metrics = {
+            "holdout_auc_before": report["before"]["holdout AUC"],
+            "holdout_auc": report["after"]["holdout AUC"],
+            "holdout_logloss_before": report["before"]["holdout logloss"],
+            "holdout_logloss": report["after"]["holdout logloss"],
+            "max_probability_change": float(delta.max()),
+            "n_features": len(feature_names),
+        }
+        run_id = register_run(classifier, preprocessing_objects, params, metrics, args.data, timings,
+                              kind=get_run(source.run_id)["kind"] if source.run_id else args.kind, artifacts=artifacts)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    print(f"\nЗапуск {run_id} сохранен в models/runs/{run_id}")
+
+    worse = []
+    if metrics["holdout_auc"] < metrics["holdout_auc_before"] - PROMOTE_TOLERANCE:
+        worse.append(f"AUC {metrics['holdout_auc_before']:.4f} -> {metrics['holdout_auc']:.4f}")
+    if metrics["holdout_logloss"] > metrics["holdout_logloss_before"] + PROMOTE_TOLERANCE:
+        worse.append(f"log-loss {metrics['holdout_logloss_before']:.4f} -> {metrics['holdout_logloss']:.4f}")
+    if worse:
+        print(f"The compacted model is worse than the source on the report split: {', '.join(worse)}")
+    if args.promote and worse and not args.allow_worse:
+        print("Not promoted; check the report or pass --allow-worse")
+        sys.exit(1)
+    if args.promote:
+        promote_run(run_id)
+        print(f"Запуск {run_id} отмечен как promoted и будет использоваться API")
+
+
+if __name__ == "__main__":
+    main()
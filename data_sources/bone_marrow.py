@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from typing import Optional
 from utils.preprocessing import rename_columns
 from utils.converters import yes_no_to_numbers, convert_hla_match
 from utils.constants import (
@@ -22,13 +23,15 @@ def load_raw_data() -> pd.DataFrame:
     return df
 
 
-def preprocess_data() -> pd.DataFrame:
+def preprocess_data(df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Preprocesses the Bone Marrow dataset
+    df - raw rows to process (e.g. quarantined rows), by default the whole file is loaded
     """
     try:
         # Load raw data
-        df = pd.read_csv('raw_datasets/bone-marrow-dataset.csv')
+        if df is None:
+            df = load_raw_data()
 
         # Replace unknown values with NaN
         df = df.replace(['Unknown', 'unknown', 'UNKNOWN', '99', 99, '99.', 99., 'N/A', 'NA', 'Not Available', 'Not Specified'], np.nan)
@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from typing import Optional
 from utils.preprocessing import rename_columns
 from utils.converters import yes_no_to_numbers, convert_hla_match
 from utils.constants import (
@@ -14,13 +15,22 @@ from utils.constants import (
     ACUTE_GVHD_GRADE_MAP,
 )
 
-def preprocess_data() -> pd.DataFrame:
+def load_raw() -> pd.DataFrame:
+    """
+    Loads data from the SAS file
+    """
+    return pd.read_sas('raw_datasets/p5191.sas7bdat')
+
+
+def preprocess_data(df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Preprocesses the P5191 dataset
+    df - raw rows to process (e.g. quarantined rows), by default the whole file is loaded
     """
     try:
         # Load raw data
-        df = pd.read_sas('raw_datasets/p5191.sas7bdat')
+        if df is None:
+            df = load_raw()
 
         # Replace unknown values with NaN
         df = df.replace([99, 99., '99', '99.', 'Unknown', 'unknown', 'UNKNOWN', 'N/A', 'NA', 'Not Available', 'Not Specified'], np.nan)
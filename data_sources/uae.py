@@ -1,5 +1,6 @@
 import pandas as pd
 import numpy as np
+from typing import Optional
 from utils.preprocessing import rename_columns
 from utils.converters import yes_no_to_numbers, convert_hla_match
 from utils.constants import (
@@ -30,13 +31,16 @@ def load_raw() -> pd.DataFrame:
         raise Exception(f"Error loading UAE dataset: {str(e)}")
 
 
-def preprocess_data() -> pd.DataFrame:
+def preprocess_data(df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
     """
     Preprocesses the UAE dataset
+    df - raw rows to process (e.g. quarantined rows), by default the whole file is loaded
     """
     try:
         # Load raw data
-        df = load_raw()
+        if df is None:
+            df = load_raw()
+        df = df.copy()
 
         # Clean column names - remove extra whitespace
         print("\nCleaning column names...")
@@ -0,0 +1,139 @@
+import argparse
+import json
+import os
+import time
+
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.model_selection import train_test_split
+from sklearn.utils.class_weight import compute_sample_weight
+from xgboost import XGBClassifier
+
+from utils.cohort import parse_filter
+from utils.encoding import encode_features
+from utils.evaluation import SCORERS, fold_metrics, load_sources, permutation_importance, source_folds
+from utils.explain import contribution_groups
+from utils.training import fit_preprocessing, load_training_data
+
+# Строка отчета со случайным разбиением XGBoost.py для сравнения с оценкой по источникам
+RANDOM_SPLIT = "random split"
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Leave-one-source-out evaluation and permutation importance of the engraftment model"
+    )
+    parser.add_argument("--data", default="processed/transplant_data.csv",
+                        help="Harmonized CSV or the cohort store (processed/transplant_data.sqlite)")
+    parser.add_argument("--cohort", nargs="+", default=[], metavar="CONDITION",
+                        help='Evaluate on a cohort only, e.g. diagnosis=AML "patient_age>50" (see cohort.py)')
+    parser.add_argument("--output", default="processed/source_evaluation.json")
+    parser.add_argument("--n-jobs", type=int, default=-1, help="Folds evaluated in parallel (-1: all cores)")
+    parser.add_argument("--repeats", type=int, default=10, help="Permutations per column")
+    parser.add_argument("--scoring", choices=sorted(SCORERS), default="logloss",
+                        help="Metric of the permutation importance (auc is undefined on single-class sources)")
+    parser.add_argument("--top", type=int, default=15, help="Columns shown in the importance table")
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument("--max-depth", type=int, default=4)
+    parser.add_argument("--learning-rate", type=float, default=0.1)
+    return parser.parse_args()
+
+
+def evaluate_fold(name: str, X_train, y_train, X_test, y_test, params: dict, repeats: int, scoring: str) -> dict:
+    """
+    Trains on the training rows (preprocessing fitted on them only), scores the held-out rows
+    and computes the permutation importance of the original columns on them
+    """
+    start = time.perf_counter()
+    # Перестановки делаются в числовой матрице, поэтому one-hot
+    X_encoded, preprocessing_objects = fit_preprocessing(X_train, encoding="onehot")
+    model = XGBClassifier(
+        objective="binary:logistic",
+        eval_metric="logloss",
+        random_state=42,
+        tree_method="hist",
+        # Параллелизм - по фолдам, каждая модель обучается в один поток
+        n_jobs=1,
+        **params
+    )
+    model.fit(X_encoded, y_train, sample_weight=compute_sample_weight('balanced', y_train))
+    booster = model.get_booster()
+
+    X_test = encode_features(X_test, preprocessing_objects).to_numpy()
+    y_test = y_test.to_numpy()
+    result = {"fold": name, "train_rows": int(len(y_train)),
+              **fold_metrics(y_test, booster.inplace_predict(X_test))}
+    columns, matrix = contribution_groups(preprocessing_objects)
+    if scoring == "auc" and result["auc"] is None:
+        result["importance"] = None
+    else:
+        importance = permutation_importance(booster.inplace_predict, X_test, y_test, columns, matrix,
+                                            n_repeats=repeats, scoring=scoring)
+        result["importance"] = importance.to_dict(orient="index")
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+def main():
+    args = parse_args()
+
+    X, y = load_training_data(args.data, filters=[parse_filter(condition) for condition in args.cohort])
+    sources = load_sources(args.data, X.index)
+    print("Labelled rows by source:")
+    for source, counts in y.groupby(sources).agg(['count', 'mean']).iterrows():
+        print(f"- {source}: {int(counts['count'])} rows, positive rate {counts['mean']:.3f}")
+
+    folds = source_folds(sources, y)
+    skipped = sorted(set(sources.dropna().unique()) - set(folds))
+    if skipped:
+        print(f"Not held out (no labelled rows, or the other sources lack a class): {', '.join(skipped)}")
+
+    tasks = []
+    for source in folds:
+        held_out = (sources == source).to_numpy()
+        tasks.append((source, X[~held_out], y[~held_out], X[held_out], y[held_out]))
+    X_train, X_test, y_train, y_test = train_test_split(X, y, stratify=y, test_size=0.2, random_state=42)
+    tasks.append((RANDOM_SPLIT, X_train, y_train, X_test, y_test))
+
+    params = {"n_estimators": args.n_estimators, "max_depth": args.max_depth, "learning_rate": args.learning_rate}
+    start = time.perf_counter()
+    results = Parallel(n_jobs=args.n_jobs)(
+        delayed(evaluate_fold)(*task, params, args.repeats, args.scoring) for task in tasks
+    )
+    elapsed = time.perf_counter() - start
+    print(f"\nEvaluated {len(results)} folds in {elapsed:.2f}s")
+
+    print(f"\n{'held out':<14} {'train':>6} {'test':>6} {'positive':>9} {'AUC':>7} {'logloss':>8} {'Brier':>7}")
+    for result in results:
+        auc = "-" if result["auc"] is None else f"{result['auc']:.3f}"
+        print(f"{result['fold']:<14} {result['train_rows']:>6} {result['rows']:>6} {result['positive_rate']:>9.3f} "
+              f"{auc:>7} {result['logloss']:>8.4f} {result['brier']:>7.4f}")
+
+    # Важность по фолдам: колонки, важные только на случайном разбиении, плохо переносятся между реестрами
+    importance = pd.DataFrame({
+        result["fold"]: {col: values["importance_mean"] for col, values in result["importance"].items()}
+        for result in results if result["importance"] is not None
+    })
+    importance = importance.reindex(importance.abs().max(axis=1).sort_values(ascending=False).index)
+    print(f"\nPermutation importance ({args.scoring} worsening, {args.repeats} permutations per column):")
+    with pd.option_context("display.float_format", "{:.4f}".format, "display.width", 160):
+        print(importance.head(args.top).to_string())
+
+    report = {
+        "data": args.data,
+        "cohort": args.cohort,
+        "params": params,
+        "scoring": args.scoring,
+        "repeats": args.repeats,
+        "skipped_sources": skipped,
+        "seconds": elapsed,
+        "folds": results,
+    }
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nReport saved to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
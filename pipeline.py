@@ -1,49 +1,155 @@
+import argparse
+import json
+import os
 import pandas as pd
 import numpy as np
 from typing import List, Optional
-from data_sources.uae import preprocess_data as uae_preprocess
-from data_sources.bone_marrow import preprocess_data as bone_marrow_preprocess
-from data_sources.p5191 import preprocess_data as p5191_preprocess
-from data_sources.p5303 import preprocess_data as p5303_preprocess
+from data_sources.uae import load_raw as uae_load, preprocess_data as uae_preprocess
+from data_sources.bone_marrow import load_raw_data as bone_marrow_load, preprocess_data as bone_marrow_preprocess
+from data_sources.p5191 import load_raw as p5191_load, preprocess_data as p5191_preprocess
+from data_sources.p5303 import load_raw as p5303_load, preprocess_data as p5303_preprocess
+from utils.cohort import STORE_PATH, build_store
 from utils.validate_dataframe import validate_dataframe, print_validation_results
+from utils.linkage import CLUSTER_COLUMN, MIN_LINK_WEIGHT, SOURCE_COLUMN, link_records, merge_clusters
 from utils.preprocessing import get_standard_columns
+from utils.quarantine import QUARANTINE_DIR, read_quarantine, split_rows, summarize, write_quarantine
 
-def load_and_preprocess_datasets() -> List[pd.DataFrame]:
+OUTPUT_PATH = "processed/transplant_data.csv"
+REPORT_PATH = "processed/ingestion_report.json"
+# Исходная запись -> строка итогового датасета (cluster_id)
+LINKAGE_PATH = "processed/linkage.csv"
+
+DATA_SOURCES = [
+    ('UAE', uae_load, uae_preprocess),
+    ('Bone Marrow', bone_marrow_load, bone_marrow_preprocess),
+    ('P5191', p5191_load, p5191_preprocess),
+    ('P5303', p5303_load, p5303_preprocess)
+]
+
+def ingest_source(source_name: str, raw_df: pd.DataFrame, preprocess_func, report: dict,
+                  quarantine_dir: str = QUARANTINE_DIR) -> pd.DataFrame:
+    """
+    Preprocesses raw rows of a source, quarantines rows failing validation rules
+    and records accept/reject counts in the report
+    Returns accepted rows tagged with the source name
+    """
+    df = preprocess_func(raw_df)
+    accepted_df, rejected_df = split_rows(raw_df, df)
+    path = write_quarantine(source_name, rejected_df, quarantine_dir)
+
+    report[source_name] = {
+        'status': 'ok',
+        'accepted': len(accepted_df),
+        'rejected': len(rejected_df),
+        'reasons': summarize(rejected_df),
+        'quarantine_file': path
+    }
+    print(f"{source_name}: accepted {len(accepted_df)}, rejected {len(rejected_df)}"
+          + (f" (quarantined to {path})" if path else ""))
+    for reason, count in report[source_name]['reasons'].items():
+        print(f"  - {reason}: {count}")
+    return accepted_df.assign(**{SOURCE_COLUMN: source_name})
+
+def load_and_preprocess_datasets(report: Optional[dict] = None, quarantine_dir: str = QUARANTINE_DIR) -> List[pd.DataFrame]:
     """
     Loads and preprocesses all available datasets
+    Rows failing validation rules are quarantined instead of dropping the whole source
     Returns a list of preprocessed dataframes
     """
+    report = {} if report is None else report
     dfs = []
-    data_sources = [
-        ('UAE', uae_preprocess),
-        ('Bone Marrow', bone_marrow_preprocess),
-        ('P5191', p5191_preprocess),
-        ('P5303', p5303_preprocess)
-    ]
-
-    for source_name, preprocess_func in data_sources:
+
+    for source_name, load_func, preprocess_func in DATA_SOURCES:
         try:
             print(f"\nProcessing {source_name} dataset...")
-            df = preprocess_func()
-
-            # Print column information
-            print(f"Columns in {source_name} dataset:")
-            for col in df.columns:
-                non_null = df[col].count()
-                total = len(df)
-                print(f"- {col}: {non_null}/{total} non-null values")
+            raw_df = load_func()
+        except Exception as e:
+            # Источник недоступен целиком (нет файла, не читается формат)
+            print(f"Warning: Failed to load {source_name} dataset: {str(e)}")
+            report[source_name] = {'status': 'failed', 'error': str(e)}
+            continue
 
-            dfs.append(df)
-            print(f"Successfully processed {source_name} dataset")
+        try:
+            df = ingest_source(source_name, raw_df, preprocess_func, report, quarantine_dir)
         except Exception as e:
             print(f"Warning: Failed to process {source_name} dataset: {str(e)}")
+            report[source_name] = {'status': 'failed', 'error': str(e)}
             continue
 
+        # Print column information
+        print(f"Columns in {source_name} dataset:")
+        for col in df.columns:
+            non_null = df[col].count()
+            total = len(df)
+            print(f"- {col}: {non_null}/{total} non-null values")
+
+        dfs.append(df)
+        print(f"Successfully processed {source_name} dataset")
+
     return dfs
 
-def combine_datasets(dfs: List[pd.DataFrame]) -> pd.DataFrame:
+def reprocess_quarantined(report: Optional[dict] = None, quarantine_dir: str = QUARANTINE_DIR) -> List[pd.DataFrame]:
+    """
+    Reprocesses only quarantined raw rows (e.g. after the mapping tables were fixed)
+    Rows that pass now are returned, the rest stay in quarantine
+    """
+    report = {} if report is None else report
+    dfs = []
+    for source_name, _, preprocess_func in DATA_SOURCES:
+        raw_df = read_quarantine(source_name, quarantine_dir)
+        if raw_df is None:
+            continue
+        print(f"\nReprocessing {len(raw_df)} quarantined {source_name} rows...")
+        df = ingest_source(source_name, raw_df, preprocess_func, report, quarantine_dir)
+        if not df.empty:
+            dfs.append(df)
+    return dfs
+
+def write_report(report: dict, path: str = REPORT_PATH) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+def read_report(path: str = REPORT_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def merge_report(previous: dict, update: dict) -> dict:
+    """
+    Merges the report of a quarantine reprocessing into the report of the dataset it appends to:
+    accepted counts of a reprocessed source are added up, its rejected counts, reasons and
+    quarantine file are those still in quarantine; other sources are kept, linkage is replaced
+    """
+    merged = dict(previous)
+    for name, entry in update.items():
+        before = previous.get(name)
+        if name != 'linkage' and before is not None and before.get('status') == 'ok' and entry.get('status') == 'ok':
+            merged[name] = {**entry, 'accepted': before['accepted'] + entry['accepted'],
+                            'reprocessed_accepted': before.get('reprocessed_accepted', 0) + entry['accepted']}
+        else:
+            merged[name] = entry
+    return merged
+
+def rebase_linkage(previous: pd.DataFrame, combined: pd.DataFrame, existing_rows: int) -> pd.DataFrame:
+    """
+    Linkage of a dataset with appended records: the first existing_rows records of the combined
+    input are the rows of the previous dataset, so a previous record's cluster_id is mapped through
+    the cluster of its old row; the appended records keep their own entries
+    """
+    clusters = combined[CLUSTER_COLUMN].to_numpy()[:existing_rows]
+    previous = previous.assign(**{CLUSTER_COLUMN: clusters[previous[CLUSTER_COLUMN].to_numpy()]})
+    return pd.concat([previous, combined.iloc[existing_rows:]], ignore_index=True)
+
+def combine_datasets(dfs: List[pd.DataFrame], report: Optional[dict] = None,
+                     linkage_path: Optional[str] = None) -> pd.DataFrame:
     """
     Combines multiple dataframes into a single dataset with standardized columns
+    Records of the same patient (exact duplicates and cross-source matches, see utils/linkage.py)
+    are merged into one row; the linkage report goes to report['linkage'] and, with linkage_path,
+    the cluster_id (row of the combined dataset) of every input record is written there.
+    Every row keeps the source column: the source of the record most of the merged row comes from
     """
     if not dfs:
         raise ValueError("No dataframes to combine")
@@ -72,31 +178,83 @@ def combine_datasets(dfs: List[pd.DataFrame]) -> pd.DataFrame:
                 new_df[col] = np.nan
                 print(f"- {col}: 0/{len(df)} non-null values (filled with NaN)")
 
+        # Источник нужен для связывания записей; кадры без него получают имя по номеру
+        new_df[SOURCE_COLUMN] = df[SOURCE_COLUMN] if SOURCE_COLUMN in df.columns else f"dataset_{i+1}"
+        new_df['source_row'] = df.index
         processed_dfs.append(new_df)
 
     # Combine all dataframes
     print("\nCombining dataframes...")
     combined_df = pd.concat(processed_dfs, ignore_index=True)
 
-    # Remove duplicate rows if any
-    initial_rows = len(combined_df)
-    combined_df = combined_df.drop_duplicates()
-    if len(combined_df) < initial_rows:
-        print(f"Removed {initial_rows - len(combined_df)} duplicate rows")
+    # Merge records of the same patient
+    cluster_ids, linkage_report = link_records(combined_df, standard_columns)
+    if report is not None:
+        report['linkage'] = linkage_report
+    if linkage_path:
+        linkage = combined_df[[SOURCE_COLUMN, 'source_row']].assign(**{CLUSTER_COLUMN: cluster_ids})
+        linkage.to_csv(linkage_path, index=False)
+    print(f"Linked {linkage_report['records']} records into {linkage_report['clusters']} patients "
+          f"({linkage_report['comparisons']} pair comparisons, {linkage_report['unblocked']} records without blocking keys)")
+    for source_pair, counts in linkage_report['source_pairs'].items():
+        print(f"- {source_pair}: {counts['exact_duplicates']} exact duplicates, {counts['linked_pairs']} linked pairs")
+    if linkage_report['max_pair_weights'] and not linkage_report['linkable_sources']:
+        # Связывание по полям выключено целиком: остается только удаление точных дубликатов
+        warning = (f"no source pair shares enough identifying fields to reach {MIN_LINK_WEIGHT:g} bits, "
+                   "cross-source record linkage compared 0 pairs and only exact duplicates were removed")
+        linkage_report['warning'] = warning
+        print("\n" + "!" * 80)
+        print(f"WARNING: {warning}")
+        for source_pair, weight in linkage_report['max_pair_weights'].items():
+            print(f"  - {source_pair}: at most {weight:.1f} bits")
+        print("!" * 80)
 
-    return combined_df
+    # Метка источника остается в датасете для оценки по реестрам (evaluate_sources.py), признаком она не является
+    return merge_clusters(combined_df[standard_columns + [SOURCE_COLUMN]], cluster_ids)
 
 def main():
+    parser = argparse.ArgumentParser(description="Harmonize and combine the transplant datasets")
+    parser.add_argument("--reprocess-quarantine", action="store_true",
+                        help="Reprocess only quarantined rows and append the ones that pass to the existing dataset")
+    args = parser.parse_args()
+
     try:
-        # Load and preprocess all datasets
-        dfs = load_and_preprocess_datasets()
+        report = {}
+        if args.reprocess_quarantine:
+            dfs = reprocess_quarantined(report)
+            if not dfs:
+                print("\nNo quarantined rows were accepted")
+                write_report(merge_report(read_report(), report))
+                return
+        else:
+            # Load and preprocess all datasets
+            dfs = load_and_preprocess_datasets(report)
 
-        if not dfs:
-            raise ValueError("No datasets were successfully processed")
+            if not dfs:
+                raise ValueError("No datasets were successfully processed")
 
         # Combine datasets
         print("\nCombining datasets...")
-        full_df = combine_datasets(dfs)
+        if args.reprocess_quarantine:
+            # Добавляем принятые строки к уже собранному датасету; строки датасетов,
+            # собранных до появления метки источника, помечаются как existing
+            existing_df = pd.read_csv(OUTPUT_PATH)
+            if SOURCE_COLUMN not in existing_df.columns:
+                existing_df[SOURCE_COLUMN] = 'existing'
+            previous_linkage = pd.read_csv(LINKAGE_PATH) if os.path.exists(LINKAGE_PATH) else None
+            full_df = combine_datasets([existing_df] + dfs, report, LINKAGE_PATH)
+            # Записи прежнего датасета переводятся в новые строки; без прежней связки (или если она
+            # от другого датасета) файл удаляется, чтобы не оставлять устаревшие cluster_id
+            if previous_linkage is not None and previous_linkage[CLUSTER_COLUMN].max() < len(existing_df):
+                linkage = rebase_linkage(previous_linkage, pd.read_csv(LINKAGE_PATH), len(existing_df))
+                linkage.to_csv(LINKAGE_PATH, index=False)
+            else:
+                os.remove(LINKAGE_PATH)
+                print(f"Warning: {LINKAGE_PATH} does not match {OUTPUT_PATH} and was removed, "
+                      "run python pipeline.py to rebuild it")
+            report = merge_report(read_report(), report)
+        else:
+            full_df = combine_datasets(dfs, report, LINKAGE_PATH)
 
         # Validate the combined dataset
         print("\nValidating combined dataset...")
@@ -104,9 +262,16 @@ def main():
         print_validation_results(validation_issues)
 
         # Save the combined dataset
-        output_path = "processed/transplant_data.csv"
+        output_path = OUTPUT_PATH
         full_df.to_csv(output_path, index=False)
+        # Индексированная копия для выборок когорт (utils/cohort.py)
+        build_store(full_df, STORE_PATH)
+        write_report(report)
         print(f"\nCombined dataset saved to: {output_path}")
+        print(f"Cohort store saved to: {STORE_PATH}")
+        print(f"Ingestion report saved to: {REPORT_PATH}")
+        if os.path.exists(LINKAGE_PATH):
+            print(f"Record linkage saved to: {LINKAGE_PATH}")
         print(f"Total rows: {len(full_df)}")
         print(f"Total columns: {len(full_df.columns)}")
         print("\nFinal column statistics:")
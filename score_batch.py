@@ -0,0 +1,132 @@
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+from collections import deque
+
+from utils.batch_scoring import MANIFEST_FILE, SUCCESS_FILE, init_worker, iter_tasks, score_chunk
+from utils.jobs import check_input
+from utils.scoring import INPUT_FIELDS
+from utils.serving import load_bundle
+from utils.training import TARGET
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(
+        description="Score a CSV/Parquet extract with the served model and write the results as a Parquet dataset"
+    )
+    parser.add_argument("input", help="CSV or Parquet file with one patient-donor pair per row")
+    parser.add_argument("--output", default="processed/scores",
+                        help="Output directory (one Parquet part per input chunk)")
+    parser.add_argument("--chunksize", type=int, default=100_000, help="Rows per chunk")
+    parser.add_argument("--workers", type=int, default=max(1, (os.cpu_count() or 1) - 1),
+                        help="Scoring processes (1 scores in the main process)")
+    parser.add_argument("--kind", default=TARGET, help="Registry kind of the promoted model")
+    parser.add_argument("--keep-columns", nargs="*", default=[],
+                        help="Input columns copied to the output (e.g. patient and donor ids)")
+    parser.add_argument("--explain", action="store_true",
+                        help="Add per-field TreeSHAP contributions (contribution_<field>, log-odds)")
+    parser.add_argument("--restart", action="store_true",
+                        help="Discard parts of a previous run instead of resuming it")
+    return parser.parse_args()
+
+
+def input_fingerprint(path: str) -> dict:
+    stat = os.stat(path)
+    return {"path": os.path.abspath(path), "size": stat.st_size, "mtime": stat.st_mtime}
+
+
+def prepare_output(output_dir: str, manifest: dict, restart: bool) -> None:
+    """
+    Creates the output directory or checks that an interrupted run was started
+    with the same input, chunking and model, so its finished parts can be reused
+    """
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path) and not restart:
+        with open(manifest_path) as f:
+            previous = json.load(f)
+        if previous != manifest:
+            raise SystemExit(
+                f"{output_dir} holds results of another run (input, chunksize, columns or model differ); "
+                "use --restart to overwrite them"
+            )
+        return
+
+    os.makedirs(output_dir, exist_ok=True)
+    for name in os.listdir(output_dir):
+        if name.startswith(("part-", ".part-")) or name in (MANIFEST_FILE, SUCCESS_FILE):
+            os.remove(os.path.join(output_dir, name))
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def main():
+    args = parse_args()
+    # Отсутствующие колонки проверяются по заголовку до загрузки модели и создания задач,
+    # иначе ошибка всплывает в воркере на первом чанке
+    try:
+        check_input(args.input, list(INPUT_FIELDS), args.keep_columns)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+
+    bundle = load_bundle(args.kind)
+    print(f"Model: {bundle.version} ({bundle.model_dir})")
+    manifest = {
+        "input": input_fingerprint(args.input),
+        "chunksize": args.chunksize,
+        "keep_columns": args.keep_columns,
+        "explain": args.explain,
+        "model_version": bundle.version,
+    }
+    prepare_output(args.output, manifest, args.restart)
+
+    scored_rows = 0
+    start = time.perf_counter()
+
+    def report(index: int, rows: int) -> None:
+        nonlocal scored_rows
+        scored_rows += rows
+        elapsed = time.perf_counter() - start
+        print(f"chunk {index}: {scored_rows} rows scored, {scored_rows / elapsed:,.0f} rows/s")
+
+    skipped = []
+    tasks = iter_tasks(args.input, args.chunksize, args.keep_columns, args.explain, args.output, skipped)
+
+    if args.workers <= 1:
+        init_worker(bundle.model_dir, bundle.run_id, threads=os.cpu_count() or 1)
+        for task in tasks:
+            report(*score_chunk(task))
+    else:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(args.workers, initializer=init_worker,
+                      initargs=(bundle.model_dir, bundle.run_id, 1)) as pool:
+            # Не больше двух чанков на воркер в очереди, чтобы чтение не опережало скоринг
+            pending = deque()
+            for task in tasks:
+                pending.append(pool.apply_async(score_chunk, (task,)))
+                if len(pending) >= 2 * args.workers:
+                    report(*pending.popleft().get())
+            while pending:
+                report(*pending.popleft().get())
+
+    elapsed = time.perf_counter() - start
+    skipped_chunks = len(skipped)
+    summary = {
+        "rows": scored_rows,
+        "skipped_chunks": skipped_chunks,
+        "seconds": elapsed,
+        "rows_per_second": scored_rows / elapsed if elapsed else 0.0,
+    }
+    with open(os.path.join(args.output, SUCCESS_FILE), "w") as f:
+        json.dump(summary, f, indent=2)
+
+    if skipped_chunks:
+        print(f"Resumed: {skipped_chunks} chunks were already scored")
+    print(f"Scored {scored_rows} rows in {elapsed:.1f}s ({summary['rows_per_second']:,.0f} rows/s)")
+    print(f"Results: {args.output} (read with pd.read_parquet)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+Prefork launcher of the GenoMatch API: the master process imports api.py once (model bundle,
+ensemble, outcome models, donor registry) and forks the workers, which share those pages
+copy-on-write instead of each loading its own copy like `uvicorn api:app --workers N`
+
+Usage: python serve.py --workers 4 [--host 127.0.0.1 --port 8002]
+       kill -HUP <master pid>   # rolling restart: reload the promoted models, replace workers one by one
+       kill -TERM <master pid>  # graceful shutdown
+"""
+import argparse
+import gc
+import importlib
+import os
+import select
+import signal
+import socket
+import sys
+import time
+import traceback
+from typing import List, Tuple
+
+import uvicorn
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Serve api.py from workers forked off one preloaded master")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8002)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--backlog", type=int, default=2048)
+    parser.add_argument("--log-level", default="info")
+    parser.add_argument("--ready-timeout", type=float, default=60, help="Seconds a new worker has to start serving")
+    parser.add_argument("--graceful-timeout", type=float, default=30,
+                        help="Seconds a stopping worker has to finish its in-flight requests")
+    parser.add_argument("--job-drain-timeout", type=float, default=30,
+                        help="Seconds a stopping worker then has to finish its running /jobs (see utils/jobs.py)")
+    return parser.parse_args()
+
+
+def log(message: str) -> None:
+    print(f"[master {os.getpid()}] {message}", file=sys.stderr, flush=True)
+
+
+def load_app(reload: bool = False):
+    """
+    Imports (or re-imports) api.py in the master and freezes the loaded objects for the GC
+    """
+    gc.unfreeze()
+    api = importlib.reload(sys.modules["api"]) if reload else importlib.import_module("api")
+    gc.collect()
+    # Объекты мастера уходят в постоянное поколение: сборщик мусора воркеров их не обходит
+    # и не пишет в их заголовки, поэтому общие страницы не копируются при первой же сборке
+    gc.freeze()
+    return api.app
+
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    # Один слушающий сокет на всех воркеров: соединения распределяет ядро
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class WorkerServer(uvicorn.Server):
+    """
+    uvicorn server of a forked worker that reports to the master once it accepts connections
+    """
+
+    def __init__(self, config: uvicorn.Config, ready_fd: int):
+        super().__init__(config)
+        self.ready_fd = ready_fd
+
+    async def startup(self, sockets=None) -> None:
+        await super().startup(sockets=sockets)
+        if not self.should_exit:
+            os.write(self.ready_fd, b"1")
+        os.close(self.ready_fd)
+
+
+def spawn_worker(app, sock: socket.socket, args) -> Tuple[int, int]:
+    """
+    Forks a worker; returns its pid and the pipe it writes to once it is ready
+    """
+    ready_read, ready_write = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(ready_read)
+        # Перезапуском управляет мастер; SIGINT/SIGTERM обрабатывает uvicorn (плавная остановка)
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        code = 0
+        try:
+            config = uvicorn.Config(app, log_level=args.log_level, backlog=args.backlog,
+                                    timeout_graceful_shutdown=args.graceful_timeout)
+            WorkerServer(config, ready_write).run(sockets=[sock])
+        except BaseException:
+            traceback.print_exc()
+            code = 1
+        finally:
+            os._exit(code)
+    os.close(ready_write)
+    return pid, ready_read
+
+
+def wait_ready(pid: int, ready_fd: int, timeout: float) -> bool:
+    try:
+        readable, _, _ = select.select([ready_fd], [], [], timeout)
+        # Пустое чтение - воркер завершился, не начав обслуживать запросы
+        return bool(readable) and os.read(ready_fd, 1) == b"1"
+    finally:
+        os.close(ready_fd)
+
+
+def stop_worker(pid: int, timeout: float) -> None:
+    """
+    SIGTERM: the worker stops accepting, finishes its in-flight requests and running jobs and exits
+    """
+    try:
+        os.kill(pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if os.waitpid(pid, os.WNOHANG)[0] == pid:
+            return
+        time.sleep(0.05)
+    os.kill(pid, signal.SIGKILL)
+    os.waitpid(pid, 0)
+
+
+def stop_timeout(args) -> float:
+    # Сначала запросы, затем выполняемые задачи /jobs; после этого воркер убивается
+    return args.graceful_timeout + args.job_drain_timeout
+
+
+def start_worker(app, sock: socket.socket, args) -> int:
+    start = time.perf_counter()
+    pid, ready_fd = spawn_worker(app, sock, args)
+    if not wait_ready(pid, ready_fd, args.ready_timeout):
+        stop_worker(pid, stop_timeout(args))
+        raise RuntimeError(f"Worker {pid} did not start within {args.ready_timeout:.0f}s")
+    log(f"worker {pid} ready in {time.perf_counter() - start:.2f}s")
+    return pid
+
+
+def rolling_restart(app, workers: List[int], sock: socket.socket, args):
+    """
+    Reloads api.py (newly promoted runs) and replaces the workers one at a time:
+    the new worker accepts connections before the old one is stopped, so capacity never drops.
+    Returns the app new workers are forked with
+    """
+    start = time.perf_counter()
+    try:
+        new_app = load_app(reload=True)
+    except Exception:
+        traceback.print_exc()
+        log("reload failed, keeping the current workers")
+        return app
+    log(f"models reloaded in {time.perf_counter() - start:.2f}s")
+    for old_pid in list(workers):
+        try:
+            new_pid = start_worker(new_app, sock, args)
+        except RuntimeError as e:
+            log(f"{e}; keeping the remaining old workers")
+            return new_app
+        workers[workers.index(old_pid)] = new_pid
+        stop_worker(old_pid, stop_timeout(args))
+    log(f"rolling restart finished in {time.perf_counter() - start:.2f}s")
+    return new_app
+
+
+def main():
+    args = parse_args()
+    start = time.perf_counter()
+    sock = bind_socket(args.host, args.port, args.backlog)
+    # Модели и данные загружаются один раз, до fork; предсказаний в мастере не делаем:
+    # пул потоков OpenMP, созданный до fork, в дочерних процессах не работает
+    # api.py читает время на завершение задач при импорте, в т.ч. при перезагрузке по SIGHUP
+    os.environ["GENOMATCH_JOB_DRAIN_SECONDS"] = str(args.job_drain_timeout)
+    app = load_app()
+    log(f"api loaded in {time.perf_counter() - start:.2f}s")
+
+    requests = {"stop": False, "restart": False}
+
+    def on_stop(signum, frame):
+        requests["stop"] = True
+
+    def on_hup(signum, frame):
+        requests["restart"] = True
+
+    signal.signal(signal.SIGTERM, on_stop)
+    signal.signal(signal.SIGINT, on_stop)
+    signal.signal(signal.SIGHUP, on_hup)
+
+    # Воркеры форкаются сразу все и стартуют параллельно
+    spawned = [spawn_worker(app, sock, args) for _ in range(args.workers)]
+    ready = [wait_ready(pid, ready_fd, args.ready_timeout) for pid, ready_fd in spawned]
+    workers = [pid for pid, _ in spawned]
+    if not all(ready):
+        for pid in workers:
+            stop_worker(pid, stop_timeout(args))
+        raise SystemExit(f"{ready.count(False)} of {args.workers} workers did not start within {args.ready_timeout:.0f}s")
+    log(f"{args.workers} workers serving http://{args.host}:{args.port} "
+        f"(started in {time.perf_counter() - start:.2f}s)")
+
+    while not requests["stop"]:
+        if requests["restart"]:
+            requests["restart"] = False
+            app = rolling_restart(app, workers, sock, args)
+        # Упавший воркер заменяется новым из того же образа мастера
+        for pid in list(workers):
+            if os.waitpid(pid, os.WNOHANG)[0] == pid:
+                log(f"worker {pid} exited, starting a replacement")
+                workers.remove(pid)
+                try:
+                    workers.append(start_worker(app, sock, args))
+                except RuntimeError as e:
+                    log(str(e))
+        time.sleep(0.2)
+
+    log("shutting down")
+    for pid in workers:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    for pid in workers:
+        stop_worker(pid, stop_timeout(args))
+    sock.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -21,7 +21,8 @@ def preprocess(df, target_column):
     df = df[df[target_column].notna()]
     df = df[df[target_column].isin([0, 1])]
     y = df[target_column]
-    X = df.drop(columns=targets)
+    # source - метка реестра из pipeline.py, не признак
+    X = df.drop(columns=[col for col in targets + ['source'] if col in df.columns])
 
     cat_cols = X.select_dtypes(include='object').columns.tolist()
     num_cols = X.select_dtypes(include=[np.number]).columns.tolist()
@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+from imblearn.over_sampling import RandomOverSampler
+from imblearn.pipeline import Pipeline
+from sklearn.utils.class_weight import compute_sample_weight
+from typing import Dict, Tuple
+
+# Стратегии балансировки классов:
+# weights          - веса объектов 'balanced', матрица не растет (по умолчанию)
+# scale_pos_weight - вес положительного класса внутри XGBoost
+# resample         - апсемплинг миноритарного класса только внутри обучающего фолда
+BALANCING_STRATEGIES = ('weights', 'scale_pos_weight', 'resample')
+DEFAULT_BALANCING = 'weights'
+
+# Имя шага модели внутри imblearn Pipeline для стратегии resample
+MODEL_STEP = 'model'
+
+
+def balanced_class_weights(class_counts: Dict[int, int]) -> Dict[int, float]:
+    """
+    Returns sklearn-style 'balanced' weights: n_samples / (n_classes * n_class_samples)
+    """
+    total = sum(class_counts.values())
+    return {label: total / (len(class_counts) * count) for label, count in class_counts.items()}
+
+
+def apply_balancing(estimator, y: pd.Series, strategy: str = DEFAULT_BALANCING) -> Tuple[object, dict]:
+    """
+    Configures class balancing for an XGBClassifier
+    Returns the estimator to fit and the keyword arguments for its fit method
+    """
+    if strategy == 'weights':
+        return estimator, {'sample_weight': compute_sample_weight('balanced', y)}
+    if strategy == 'scale_pos_weight':
+        n_negative = int(np.sum(y == 0))
+        n_positive = int(np.sum(y == 1))
+        return estimator.set_params(scale_pos_weight=n_negative / n_positive), {}
+    if strategy == 'resample':
+        # imblearn применяет сэмплер только в fit, поэтому дубликаты не попадают в валидационные фолды
+        sampler = RandomOverSampler(random_state=42)
+        return Pipeline([('oversample', sampler), (MODEL_STEP, estimator)]), {}
+    raise ValueError(f"Unknown balancing strategy: {strategy}")
+
+
+def balanced_param_grid(param_grid: dict, strategy: str = DEFAULT_BALANCING) -> dict:
+    """
+    Prefixes grid-search parameters with the model step name when the estimator is wrapped in a Pipeline
+    """
+    if strategy == 'resample':
+        return {f"{MODEL_STEP}__{name}": values for name, values in param_grid.items()}
+    return param_grid
+
+
+def model_fit_params(estimator, **params) -> dict:
+    """
+    Prefixes fit arguments of the model (e.g. xgb_model) with the model step name for a Pipeline
+    """
+    if isinstance(estimator, Pipeline):
+        return {f"{MODEL_STEP}__{name}": value for name, value in params.items()}
+    return params
+
+
+def unwrap_model(estimator):
+    """
+    Returns the underlying XGBClassifier of a (possibly pipelined) estimator
+    """
+    if isinstance(estimator, Pipeline):
+        return estimator.named_steps[MODEL_STEP]
+    return estimator
+
+
+def training_rows(y: pd.Series, strategy: str = DEFAULT_BALANCING) -> int:
+    """
+    Returns the number of rows the booster actually trains on for the given strategy
+    """
+    if strategy == 'resample':
+        return int(y.value_counts().max() * y.nunique())
+    return len(y)
@@ -0,0 +1,89 @@
+"""
+Chunked scoring shared by score_batch.py and the /jobs API: input files are read in deterministic
+chunks, and worker processes score each chunk with their own model bundle and write it
+as a Parquet part, so finished parts of an interrupted run can be reused
+"""
+import os
+from typing import Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+from utils.external_memory import iter_parquet_chunks
+from utils.scoring import fill_default_fields, risk_levels
+from utils.serving import ModelBundle
+
+MANIFEST_FILE = "_manifest.json"
+SUCCESS_FILE = "_SUCCESS"
+
+# Модель, загруженная в процессе-воркере
+_bundle: Optional[ModelBundle] = None
+
+
+def iter_chunks(path: str, chunksize: int) -> Iterator[pd.DataFrame]:
+    """
+    Yields the input in chunks; chunk boundaries are deterministic, so a run can be resumed
+    """
+    if path.endswith(".parquet"):
+        yield from iter_parquet_chunks(path, chunksize)
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, low_memory=False)
+
+
+def iter_tasks(path: str, chunksize: int, keep_columns: List[str], explain: bool, output_dir: str,
+               skipped: Optional[list] = None) -> Iterator[Tuple[int, pd.DataFrame, List[str], bool, str]]:
+    """
+    Yields score_chunk tasks for the chunks that have no part in output_dir yet;
+    the indexes and row counts of skipped chunks are appended to `skipped`
+    """
+    row_offset = 0
+    for index, chunk in enumerate(iter_chunks(path, chunksize)):
+        # Сквозной номер строки входного файла, в том числе для CSV
+        chunk.index = pd.RangeIndex(row_offset, row_offset + len(chunk))
+        row_offset += len(chunk)
+        if os.path.exists(part_path(output_dir, index)):
+            if skipped is not None:
+                skipped.append((index, len(chunk)))
+            continue
+        yield index, chunk, keep_columns, explain, output_dir
+
+
+def part_path(output_dir: str, index: int) -> str:
+    return os.path.join(output_dir, f"part-{index:05d}.parquet")
+
+
+def list_parts(output_dir: str) -> List[str]:
+    return sorted(os.path.join(output_dir, name) for name in os.listdir(output_dir)
+                  if name.startswith("part-") and name.endswith(".parquet"))
+
+
+def init_worker(model_dir: str, run_id: Optional[str], threads: int) -> None:
+    global _bundle
+    _bundle = ModelBundle(model_dir, run_id)
+    # Параллелизм обеспечивают процессы, потоки XGBoost в каждом ограничиваем
+    _bundle.model.set_params(n_jobs=threads)
+
+
+def score_chunk(task: Tuple[int, pd.DataFrame, List[str], bool, str]) -> Tuple[int, int]:
+    """
+    Encodes and scores one chunk and writes it as a Parquet part (atomically, via rename)
+    Returns the chunk index and its number of rows
+    """
+    index, chunk, keep_columns, explain, output_dir = task
+    X = _bundle.encode(fill_default_fields(chunk))
+    probabilities = _bundle.predict_proba(X)
+
+    result = chunk[keep_columns].copy()
+    result["row_id"] = chunk.index.to_numpy()
+    result["success_probability"] = probabilities.astype("float32")
+    result["risk_level"] = risk_levels(probabilities)
+    if explain:
+        contributions, bias = _bundle.explain(X)
+        result = pd.concat([result, contributions.add_prefix("contribution_").astype("float32")], axis=1)
+        result["contribution_bias"] = bias.astype("float32")
+
+    path = part_path(output_dir, index)
+    # Незавершенные файлы начинаются с точки и не читаются как часть датасета
+    tmp_path = os.path.join(output_dir, f".{os.path.basename(path)}.tmp")
+    result.to_parquet(tmp_path, index=False)
+    os.replace(tmp_path, path)
+    return index, len(chunk)
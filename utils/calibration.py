@@ -0,0 +1,111 @@
+"""
+Probability calibration of the classifier. Models are trained with balanced class weights
+(or oversampling), so their raw probabilities are shifted towards the minority class.
+A calibration map is fitted on a held-out fold and stored as a piecewise-linear table,
+so serving applies it with a single np.interp over the batch
+"""
+import json
+import os
+from typing import Dict, List, Optional
+
+import numpy as np
+from sklearn.isotonic import IsotonicRegression
+from sklearn.linear_model import LogisticRegression
+
+# Файл таблицы калибровки в каталоге запуска
+PROBABILITY_CALIBRATION_FILE = "probability_calibration.json"
+
+# isotonic - монотонная кусочно-постоянная регрессия, platt - сигмоида от log-odds модели
+CALIBRATION_METHODS = ('isotonic', 'platt', 'none')
+DEFAULT_CALIBRATION = 'isotonic'
+
+# Узлы таблицы для метода Платта: равномерная сетка в log-odds
+PLATT_KNOTS = np.linspace(-12, 12, 97)
+
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    p = np.clip(p, 1e-6, 1 - 1e-6)
+    return np.log(p / (1 - p))
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-x))
+
+
+def fit_calibration(probabilities: np.ndarray, y: np.ndarray, method: str = DEFAULT_CALIBRATION) -> Dict[str, List[float]]:
+    """
+    Fits a calibration map of raw probabilities to observed outcomes on held-out rows
+    Returns the table {"method", "x", "y"}: increasing raw probabilities and their calibrated values
+    """
+    probabilities = np.asarray(probabilities, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if method == 'isotonic':
+        isotonic = IsotonicRegression(y_min=0, y_max=1, out_of_bounds='clip').fit(probabilities, y)
+        # Между порогами изотоническая регрессия интерполирует линейно, как np.interp
+        x_table, y_table = isotonic.X_thresholds_, isotonic.y_thresholds_
+    elif method == 'platt':
+        platt = LogisticRegression(C=1e6).fit(_logit(probabilities).reshape(-1, 1), y)
+        x_table = _sigmoid(PLATT_KNOTS)
+        y_table = platt.predict_proba(PLATT_KNOTS.reshape(-1, 1))[:, 1]
+    else:
+        raise ValueError(f"Unknown calibration method: {method}")
+    return {"method": method, "x": np.round(x_table, 8).tolist(), "y": np.round(y_table, 8).tolist()}
+
+
+def apply_calibration(probabilities: np.ndarray, table: Dict[str, List[float]]) -> np.ndarray:
+    """
+    Maps raw probabilities through the table; values outside the table are clipped to its ends
+    """
+    return np.interp(probabilities, table["x"], table["y"])
+
+
+def expected_calibration_error(probabilities: np.ndarray, y: np.ndarray, n_bins: int = 10) -> float:
+    """
+    Weighted mean gap between predicted and observed rates over equal-width probability bins
+    """
+    probabilities = np.asarray(probabilities)
+    y = np.asarray(y)
+    bins = np.minimum((probabilities * n_bins).astype(int), n_bins - 1)
+    error = 0.0
+    for b in np.unique(bins):
+        mask = bins == b
+        error += mask.sum() * abs(probabilities[mask].mean() - y[mask].mean())
+    return float(error / len(y))
+
+
+def calibration_metrics(raw: np.ndarray, calibrated: np.ndarray, y: np.ndarray) -> Dict[str, float]:
+    """
+    Brier score and expected calibration error before and after calibration
+    """
+    y = np.asarray(y)
+    return {
+        'brier_raw': float(np.mean((raw - y) ** 2)),
+        'brier_calibrated': float(np.mean((calibrated - y) ** 2)),
+        'ece_raw': expected_calibration_error(raw, y),
+        'ece_calibrated': expected_calibration_error(calibrated, y),
+    }
+
+
+def save_calibration(table: Dict[str, List[float]], path: str) -> None:
+    with open(path, "w") as f:
+        json.dump(table, f)
+
+
+def calibration_artifacts(table: Optional[Dict[str, List[float]]], directory: str) -> Dict[str, str]:
+    """
+    Writes the table into directory and returns the artifacts mapping for register_run
+    (empty when the run is not calibrated)
+    """
+    if table is None:
+        return {}
+    path = os.path.join(directory, PROBABILITY_CALIBRATION_FILE)
+    save_calibration(table, path)
+    return {PROBABILITY_CALIBRATION_FILE: path}
+
+
+def load_calibration(path: str) -> Dict[str, List[float]]:
+    with open(path) as f:
+        table = json.load(f)
+    table["x"] = np.asarray(table["x"])
+    table["y"] = np.asarray(table["y"])
+    return table
@@ -0,0 +1,213 @@
+"""
+Embedded cohort store of the harmonized dataset: a SQLite file (standard library, no server)
+with B-tree indexes on the columns cohorts are usually selected by. read_cohort turns filters
+and the requested columns into one parameterized query, so only the matching rows and the needed
+columns leave the store; a CSV path is read with the same filter semantics applied in pandas
+"""
+import os
+import re
+import sqlite3
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+STORE_PATH = "processed/transplant_data.sqlite"
+TABLE = "transplants"
+# Номер строки в processed/transplant_data.csv: индекс кадров, как у pd.read_csv
+ROW_ID = "row_id"
+
+# Частые выборки аналитиков ("AML, PBSC, возраст > 50") и строки с известным исходом
+INDEXES = {
+    "cohort": ("diagnosis", "source_of_cells", "patient_age"),
+    "patient_age": ("patient_age",),
+    "conditioning_regimen": ("conditioning_regimen",),
+    "donor_relation": ("donor_relation",),
+    "source": ("source",),
+    "engraftment_success": ("engraftment_success",),
+    "overall_survival_1y": ("overall_survival_1y",),
+}
+
+# Фильтр - (колонка, оператор, значение), как filters у pd.read_parquet; условия объединяются через AND
+Filter = Tuple[str, str, Any]
+COMPARISONS = {"==": "=", "=": "=", "!=": "!=", "<": "<", "<=": "<=", ">": ">", ">=": ">="}
+OPERATORS = tuple(COMPARISONS) + ("in", "not in", "not null", "is null")
+FILTER_PATTERN = re.compile(r"^\s*(\w+)\s*(==|!=|>=|<=|=|>|<)\s*(.*?)\s*$")
+
+
+def is_store(path: str) -> bool:
+    return path.endswith((".sqlite", ".db"))
+
+
+def build_store(df: pd.DataFrame, path: str = STORE_PATH) -> str:
+    """
+    Writes the dataset into a new store file (replaced atomically), creates the indexes
+    of the columns present and collects planner statistics
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    df = df.reset_index(drop=True).rename_axis(ROW_ID).reset_index()
+    with sqlite3.connect(tmp_path) as connection:
+        # row_id - INTEGER PRIMARY KEY, т.е. rowid таблицы: ORDER BY row_id не требует сортировки
+        connection.execute(pd.io.sql.get_schema(df, TABLE, keys=ROW_ID, con=connection))
+        df.to_sql(TABLE, connection, if_exists="append", index=False)
+        for name, columns in INDEXES.items():
+            if all(col in df.columns for col in columns):
+                connection.execute(f'CREATE INDEX "idx_{name}" ON {TABLE} ({", ".join(_quote(columns))})')
+        connection.execute("ANALYZE")
+    connection.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def _quote(columns: Iterable[str]) -> List[str]:
+    return [f'"{col}"' for col in columns]
+
+
+def _schema(connection: sqlite3.Connection) -> dict:
+    """
+    Column -> declared type of the store table (TEXT, REAL, INTEGER)
+    """
+    return {row[1]: row[2].upper() for row in connection.execute(f"PRAGMA table_info({TABLE})")
+            if row[1] != ROW_ID}
+
+
+def _python_value(value: Any) -> Any:
+    # sqlite3 не принимает numpy-скаляры
+    return value.item() if hasattr(value, "item") else value
+
+
+def parse_filter(text: str) -> Filter:
+    """
+    Parses a command-line condition: "diagnosis=AML", "patient_age>50", "diagnosis=AML,ALL" (in),
+    "donor_relation!=related,unrelated" (not in); numbers are compared as numbers
+    """
+    match = FILTER_PATTERN.match(text)
+    if not match:
+        raise ValueError(f"Cannot parse cohort condition: {text!r} (expected <column><op><value>)")
+    column, op, raw = match.groups()
+
+    def value(item: str) -> Any:
+        try:
+            return float(item)
+        except ValueError:
+            return item
+
+    if "," in raw and op in ("=", "==", "!="):
+        return column, "in" if op != "!=" else "not in", [value(item.strip()) for item in raw.split(",")]
+    return column, op, value(raw)
+
+
+def check_filters(filters: Sequence[Filter], columns: Iterable[str]) -> None:
+    columns = set(columns)
+    for column, op, _ in filters:
+        if column not in columns:
+            raise ValueError(f"Unknown cohort column: {column}")
+        if op not in OPERATORS:
+            raise ValueError(f"Unknown cohort operator: {op} (expected one of {', '.join(OPERATORS)})")
+
+
+def cohort_query(filters: Sequence[Filter], columns: Sequence[str]) -> Tuple[str, list]:
+    """
+    SQL text and parameters of a cohort; values are always bound parameters, column names
+    are checked against the table beforehand
+    """
+    conditions, params = [], []
+    for column, op, value in filters:
+        if op in COMPARISONS:
+            conditions.append(f'"{column}" {COMPARISONS[op]} ?')
+            params.append(_python_value(value))
+        elif op in ("in", "not in"):
+            values = [_python_value(item) for item in value]
+            conditions.append(f'"{column}" {op.upper()} ({", ".join("?" * len(values))})')
+            params.extend(values)
+        else:
+            conditions.append(f'"{column}" IS {"NOT " if op == "not null" else ""}NULL')
+    sql = f'SELECT {", ".join(_quote([ROW_ID, *columns]))} FROM {TABLE}'
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    return sql + f' ORDER BY "{ROW_ID}"', params
+
+
+def cohort_columns(path: str) -> List[str]:
+    """
+    Columns of the dataset, from the store schema or the CSV header
+    """
+    if not is_store(path):
+        return pd.read_csv(path, nrows=0).columns.tolist()
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as connection:
+        columns = list(_schema(connection))
+    connection.close()
+    return columns
+
+
+def _filter_frame(df: pd.DataFrame, filters: Sequence[Filter]) -> pd.DataFrame:
+    mask = pd.Series(True, index=df.index)
+    for column, op, value in filters:
+        series = df[column]
+        if op in ("=", "=="):
+            mask &= series == value
+        elif op == "!=":
+            # Как в SQL: пропуск не проходит ни одно сравнение
+            mask &= series.notna() & (series != value)
+        elif op in COMPARISONS:
+            mask &= {"<": series.lt, "<=": series.le, ">": series.gt, ">=": series.ge}[op](value)
+        elif op == "in":
+            mask &= series.isin(value)
+        elif op == "not in":
+            mask &= series.notna() & ~series.isin(value)
+        else:
+            mask &= series.notna() if op == "not null" else series.isna()
+    return df[mask]
+
+
+def read_cohort(path: str, columns: Optional[Sequence[str]] = None,
+                filters: Optional[Sequence[Filter]] = None) -> pd.DataFrame:
+    """
+    Reads the rows matching all filters and only the given columns (all by default).
+    The frame is indexed by the row number of the dataset, as pd.read_csv would index it
+    """
+    filters = list(filters or [])
+    available = cohort_columns(path)
+    columns = list(columns) if columns is not None else available
+    check_filters(filters, available)
+    missing = [col for col in columns if col not in available]
+    if missing:
+        raise ValueError(f"Unknown cohort columns: {', '.join(missing)}")
+
+    if not is_store(path):
+        needed = list(dict.fromkeys([*columns, *(column for column, _, _ in filters)]))
+        df = pd.read_csv(path, usecols=needed)
+        return _filter_frame(df, filters)[columns]
+
+    sql, params = cohort_query(filters, columns)
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as connection:
+        schema = _schema(connection)
+        df = pd.read_sql_query(sql, connection, params=params, index_col=ROW_ID)
+    connection.close()
+    df.index = df.index.astype("int64").rename(None)
+    # Колонка без значений в выборке приходит как object; типы восстанавливаются по схеме таблицы,
+    # а NULL текстовых колонок становится NaN, как у pd.read_csv (SimpleImputer ищет np.nan)
+    for col in columns:
+        if schema[col] in ("REAL", "INTEGER") and df[col].dtype == object:
+            df[col] = pd.to_numeric(df[col]).astype("float64")
+        elif df[col].dtype == object:
+            df[col] = df[col].where(df[col].notna(), np.nan)
+    return df
+
+
+def explain_cohort(path: str, columns: Optional[Sequence[str]] = None,
+                   filters: Optional[Sequence[Filter]] = None) -> List[str]:
+    """
+    SQLite query plan of a cohort (shows which index is used)
+    """
+    filters = list(filters or [])
+    columns = list(columns) if columns is not None else cohort_columns(path)
+    check_filters(filters, cohort_columns(path))
+    sql, params = cohort_query(filters, columns)
+    with sqlite3.connect(f"file:{path}?mode=ro", uri=True) as connection:
+        plan = [row[-1] for row in connection.execute(f"EXPLAIN QUERY PLAN {sql}", params)]
+    connection.close()
+    return plan
@@ -0,0 +1,113 @@
+"""
+Post-training compaction of a served XGBoost model: trees past the best iteration are dropped,
+features no remaining tree splits on are removed from the model and from the feature layout
+(so encode_features builds a narrower matrix), and the forest is packed into flat arrays
+with the narrowest index types for the request-sized batches of the API
+"""
+import copy
+import json
+from typing import List, Tuple
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from xgboost import XGBClassifier
+
+# Файл упакованного леса в каталоге запуска
+PACKED_MODEL_FILE = "packed_model.npz"
+
+
+def model_json(model: XGBClassifier) -> dict:
+    return json.loads(model.get_booster().save_raw(raw_format="json"))
+
+
+def load_classifier(model: dict, enable_categorical: bool = False) -> XGBClassifier:
+    classifier = XGBClassifier(enable_categorical=enable_categorical)
+    classifier.load_model(bytearray(json.dumps(model).encode()))
+    return classifier
+
+
+def _trees(model: dict) -> List[dict]:
+    return model["learner"]["gradient_booster"]["model"]["trees"]
+
+
+def used_features(model: dict) -> List[int]:
+    """
+    Indices of the features at least one split of the model uses
+    """
+    used = set()
+    for tree in _trees(model):
+        internal = np.asarray(tree["left_children"]) != -1
+        used.update(np.asarray(tree["split_indices"])[internal].tolist())
+    return sorted(used)
+
+
+def prefix_loglosses(model: dict, booster: xgb.Booster, dmatrix: xgb.DMatrix, y: np.ndarray) -> np.ndarray:
+    """
+    Log-loss of the first 1..n trees on a labelled set, from one pred_leaf pass:
+    the margin of a prefix is the cumulative sum of its trees' leaf values
+    """
+    learner = model["learner"]
+    if learner["objective"]["name"] != "binary:logistic":
+        raise ValueError(f"Unsupported objective: {learner['objective']['name']}")
+    if learner["gradient_booster"]["model"]["gbtree_model_param"]["num_parallel_tree"] != "1":
+        raise ValueError("Random-forest boosters (num_parallel_tree > 1) are not supported")
+    leaves = booster.predict(dmatrix, pred_leaf=True).astype(np.int64).reshape(dmatrix.num_row(), -1)
+    leaf_values = np.stack([np.asarray(tree["split_conditions"], dtype=np.float64)[leaves[:, i]]
+                            for i, tree in enumerate(_trees(model))], axis=1)
+    base_score = float(learner["learner_model_param"]["base_score"])
+    margins = np.log(base_score / (1 - base_score)) + np.cumsum(leaf_values, axis=1)
+    probabilities = np.clip(1 / (1 + np.exp(-margins)), 1e-15, 1 - 1e-15)
+    y = np.asarray(y, dtype=np.float64)[:, None]
+    return -(y * np.log(probabilities) + (1 - y) * np.log(1 - probabilities)).mean(axis=0)
+
+
+def truncate_trees(model: dict, n_trees: int) -> dict:
+    model = copy.deepcopy(model)
+    gbtree = model["learner"]["gradient_booster"]["model"]
+    gbtree["trees"] = gbtree["trees"][:n_trees]
+    gbtree["tree_info"] = gbtree["tree_info"][:n_trees]
+    gbtree["iteration_indptr"] = gbtree["iteration_indptr"][:n_trees + 1]
+    gbtree["gbtree_model_param"]["num_trees"] = str(n_trees)
+    return model
+
+
+def drop_unused_features(model: dict) -> Tuple[dict, List[int]]:
+    """
+    Removes the features no split uses and renumbers the splits
+    Returns the model and the kept feature indices (positions in the old layout)
+    """
+    model = copy.deepcopy(model)
+    learner = model["learner"]
+    kept = used_features(model)
+    remap = np.full(int(learner["learner_model_param"]["num_feature"]), -1, dtype=np.int64)
+    remap[kept] = np.arange(len(kept))
+    for tree in _trees(model):
+        internal = np.asarray(tree["left_children"]) != -1
+        # У листьев split_indices не используется, XGBoost хранит там 0
+        tree["split_indices"] = np.where(internal, remap[np.asarray(tree["split_indices"])], 0).tolist()
+        tree["tree_param"]["num_feature"] = str(len(kept))
+    for key in ("feature_names", "feature_types"):
+        if learner.get(key):
+            learner[key] = [learner[key][i] for i in kept]
+    learner["learner_model_param"]["num_feature"] = str(len(kept))
+    return model, kept
+
+
+def compact_preprocessing(preprocessing_objects: dict, feature_names: List[str]) -> dict:
+    """
+    Preprocessing objects with the feature layout reduced to the kept features; imputers and the scaler
+    stay fitted on all input columns, one-hot levels without a kept column are no longer built
+    """
+    compacted = dict(preprocessing_objects)
+    compacted["feature_names"] = list(feature_names)
+    return compacted
+
+
+def select_iterations(model: dict, booster: xgb.Booster, X: pd.DataFrame, y: np.ndarray,
+                      enable_categorical: bool = False) -> Tuple[int, np.ndarray]:
+    """
+    Number of trees with the lowest validation log-loss, and the log-loss of every prefix
+    """
+    losses = prefix_loglosses(model, booster, xgb.DMatrix(X, enable_categorical=enable_categorical), y)
+    return int(np.argmin(losses)) + 1, losses
@@ -93,3 +93,30 @@ ACUTE_GVHD_GRADE_MAP = {
     'MODERATE': 3,
     'SEVERE': 4
 }
+
+# Категориальные колонки унифицированного датасета
+CATEGORICAL_COLUMNS = [
+    'conditioning_regimen',
+    'diagnosis',
+    'disease_status',
+    'donor_relation',
+    'donor_sex',
+    'gvhd_prophylaxis',
+    'patient_ethnicity',
+    'patient_sex',
+    'source_of_cells',
+]
+
+# Фиксированные наборы категорий для нативной поддержки категориальных признаков в XGBoost.
+# Значения вне набора становятся пропусками, порядок категорий не зависит от состава датасета
+CATEGORY_SETS = {
+    'conditioning_regimen': sorted(set(CONDITIONING_REGIMEN_MAP.values())),
+    'diagnosis': sorted(set(DIAGNOSIS_MAP.values())),
+    'disease_status': sorted(set(DISEASE_STATUS_MAP.values())),
+    'donor_relation': sorted(set(DONOR_RELATION_MAP.values())),
+    'donor_sex': sorted(set(SEX_MAP.values())),
+    'gvhd_prophylaxis': sorted(set(GVHD_PROPHYLAXIS_MAP.values())),
+    'patient_ethnicity': sorted(set(PATIENT_ETHNICITY_MAP.values())),
+    'patient_sex': sorted(set(SEX_MAP.values())),
+    'source_of_cells': sorted(set(SOURCE_OF_CELLS_MAP.values())),
+}
@@ -0,0 +1,208 @@
+"""
+Input drift monitoring. Training runs store compact per-feature sketches of the raw inputs
+(quantile bins of numeric columns, category frequencies); the API keeps fixed-size
+streaming counts of the same bins and compares them with PSI and a binned KS statistic
+"""
+import json
+import os
+import threading
+from typing import Dict, Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Файл скетчей распределений признаков в каталоге запуска
+DRIFT_SKETCHES_FILE = "drift_sketches.json"
+
+# Квантильных бинов на числовой признак
+SKETCH_BINS = 10
+
+# Пороги PSI: < 0.1 - стабильно, 0.1-0.25 - умеренный сдвиг, > 0.25 - дрейф
+PSI_WARNING = 0.1
+PSI_DRIFT = 0.25
+
+# Живые счетчики делятся пополам, когда в окне больше строк (экспоненциальное забывание)
+DEFAULT_WINDOW = 10_000
+# Меньше строк в окне - оценки PSI/KS слишком шумные
+MIN_SAMPLES = 100
+# Сколько новых категорий запоминать для отчета
+MAX_UNSEEN_EXAMPLES = 20
+
+_EPS = 1e-4
+
+
+def fit_drift_sketches(X: pd.DataFrame, n_bins: int = SKETCH_BINS) -> Dict[str, dict]:
+    """
+    Sketches of the raw (not encoded) training features: interior quantile edges with bin shares
+    and the observed range for numeric columns, category shares for categorical ones
+    """
+    sketches = {}
+    for col in X.select_dtypes(include=[np.number]).columns:
+        values = X[col].to_numpy(dtype=np.float64)
+        observed = values[~np.isnan(values)]
+        if len(observed) == 0:
+            continue
+        edges = np.unique(np.quantile(observed, np.linspace(0, 1, n_bins + 1)[1:-1]))
+        counts = np.bincount(np.searchsorted(edges, observed, side="right"), minlength=len(edges) + 1)
+        sketches[col] = {
+            "type": "numeric",
+            "edges": edges.tolist(),
+            "shares": (counts / len(observed)).tolist(),
+            "min": float(observed.min()),
+            "max": float(observed.max()),
+            "missing": float(1 - len(observed) / len(values)),
+        }
+    for col in X.select_dtypes(include=["object", "category"]).columns:
+        frequencies = X[col].value_counts(normalize=True, dropna=True)
+        if frequencies.empty:
+            continue
+        sketches[col] = {
+            "type": "categorical",
+            "categories": [str(value) for value in frequencies.index],
+            "shares": frequencies.tolist(),
+            "missing": float(X[col].isna().mean()),
+        }
+    return sketches
+
+
+def drift_artifacts(sketches: Optional[Dict[str, dict]], directory: str) -> Dict[str, str]:
+    """
+    Writes the sketches into directory and returns the artifacts mapping for register_run
+    """
+    if not sketches:
+        return {}
+    path = os.path.join(directory, DRIFT_SKETCHES_FILE)
+    with open(path, "w") as f:
+        json.dump(sketches, f)
+    return {DRIFT_SKETCHES_FILE: path}
+
+
+def load_drift_sketches(path: str) -> Dict[str, dict]:
+    with open(path) as f:
+        return json.load(f)
+
+
+def psi(expected: np.ndarray, actual: np.ndarray) -> float:
+    """
+    Population stability index of two share vectors over the same bins
+    """
+    expected = np.clip(expected, _EPS, None)
+    actual = np.clip(actual, _EPS, None)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+def binned_ks(expected: np.ndarray, actual: np.ndarray) -> float:
+    """
+    Largest gap between the cumulative shares of ordered bins (a lower bound of the exact KS statistic)
+    """
+    return float(np.max(np.abs(np.cumsum(actual) - np.cumsum(expected))))
+
+
+def _as_float(values: np.ndarray) -> np.ndarray:
+    try:
+        return values.astype(np.float64)
+    except (TypeError, ValueError):
+        # Строки и прочие нечисловые значения считаются пропусками
+        return pd.to_numeric(pd.Series(values), errors="coerce").to_numpy(dtype=np.float64)
+
+
+def drift_status(value: float) -> str:
+    if value >= PSI_DRIFT:
+        return "drift"
+    if value >= PSI_WARNING:
+        return "warning"
+    return "ok"
+
+
+class DriftMonitor:
+    """
+    Streaming counts of live inputs in the bins of the training sketches.
+    Memory is fixed by the sketches (plus at most MAX_UNSEEN_EXAMPLES new categories per column),
+    and counts are halved whenever the window is exceeded, so recent traffic dominates
+    """
+
+    def __init__(self, sketches: Dict[str, dict], columns: Optional[Iterable[str]] = None,
+                 window: int = DEFAULT_WINDOW):
+        if columns is not None:
+            sketches = {col: sketch for col, sketch in sketches.items() if col in set(columns)}
+        self.sketches = sketches
+        self.window = window
+        self._lock = threading.Lock()
+        self._edges = {}
+        self._positions = {}
+        self._counts = {}
+        self._outside = {}
+        self._unseen = {}
+        for col, sketch in sketches.items():
+            if sketch["type"] == "numeric":
+                self._edges[col] = np.asarray(sketch["edges"])
+                self._counts[col] = np.zeros(len(sketch["edges"]) + 1)
+                self._outside[col] = 0.0
+            else:
+                self._positions[col] = {value: i for i, value in enumerate(sketch["categories"])}
+                # Последний бин - категории, которых не было при обучении
+                self._counts[col] = np.zeros(len(sketch["categories"]) + 1)
+                self._unseen[col] = {}
+
+    def update(self, df: pd.DataFrame) -> None:
+        """
+        Adds a batch of raw input rows; cost depends on the batch size and the number of bins only
+        """
+        with self._lock:
+            for col, counts in self._counts.items():
+                if col not in df.columns:
+                    continue
+                column = df[col].to_numpy()
+                if col in self._edges:
+                    values = _as_float(column)
+                    values = values[~np.isnan(values)]
+                    sketch = self.sketches[col]
+                    counts += np.bincount(np.searchsorted(self._edges[col], values, side="right"),
+                                          minlength=len(counts))
+                    self._outside[col] += np.count_nonzero((values < sketch["min"]) | (values > sketch["max"]))
+                else:
+                    positions = self._positions[col]
+                    unseen = self._unseen[col]
+                    for value in column:
+                        if value is None or value != value:
+                            continue
+                        value = str(value)
+                        position = positions.get(value)
+                        if position is None:
+                            counts[-1] += 1
+                            if value in unseen or len(unseen) < MAX_UNSEEN_EXAMPLES:
+                                unseen[value] = unseen.get(value, 0) + 1
+                        else:
+                            counts[position] += 1
+                if counts.sum() > self.window:
+                    counts *= 0.5
+                    if col in self._outside:
+                        self._outside[col] *= 0.5
+
+    def report(self) -> Dict[str, dict]:
+        """
+        PSI (and binned KS for numeric columns) of the live window against the training sketch
+        """
+        features = {}
+        with self._lock:
+            for col, counts in self._counts.items():
+                sketch = self.sketches[col]
+                n = float(counts.sum())
+                entry = {"type": sketch["type"], "n": round(n, 1)}
+                if n < MIN_SAMPLES:
+                    entry["status"] = "insufficient_data"
+                    features[col] = entry
+                    continue
+                actual = counts / n
+                if sketch["type"] == "numeric":
+                    expected = np.asarray(sketch["shares"])
+                    entry["ks"] = round(binned_ks(expected, actual), 4)
+                    entry["out_of_range"] = round(self._outside[col] / n, 4)
+                else:
+                    expected = np.append(sketch["shares"], 0.0)
+                    entry["unseen"] = round(float(actual[-1]), 4)
+                    entry["unseen_values"] = dict(self._unseen[col])
+                entry["psi"] = round(psi(expected, actual), 4)
+                entry["status"] = drift_status(entry["psi"])
+                features[col] = entry
+        return features
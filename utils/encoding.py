@@ -0,0 +1,104 @@
+import time
+
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+
+
+def get_dummy_levels(preprocessing_objects: dict) -> Dict[str, List[str]]:
+    """
+    Returns the one-hot levels kept for every categorical column.
+    Older bundles don't store 'categories', so levels are recovered from feature_names
+    """
+    feature_names = preprocessing_objects['feature_names']
+    num_cols = set(preprocessing_objects['num_cols'])
+    categories = preprocessing_objects.get('categories')
+
+    levels = {}
+    for col in preprocessing_objects['cat_cols']:
+        if categories is not None:
+            # drop_first=True: первая категория не получает собственной колонки
+            levels[col] = [value for value in categories[col][1:] if f"{col}_{value}" in feature_names]
+        else:
+            prefix = f"{col}_"
+            levels[col] = [
+                name[len(prefix):] for name in feature_names
+                if name.startswith(prefix) and name not in num_cols
+            ]
+    return levels
+
+
+def scale_numeric(df: pd.DataFrame, preprocessing_objects: dict) -> np.ndarray:
+    """
+    Imputes and standardizes the numeric columns of a batch
+    """
+    num_cols = preprocessing_objects['num_cols']
+    num_data = df.reindex(columns=num_cols).apply(pd.to_numeric, errors='coerce')
+    num_data = pd.DataFrame(
+        preprocessing_objects['num_imputer'].transform(num_data),
+        columns=num_cols
+    )
+    return preprocessing_objects['scaler'].transform(num_data)
+
+
+def encode_native(df: pd.DataFrame, preprocessing_objects: dict) -> pd.DataFrame:
+    """
+    Builds the frame for a model trained with enable_categorical=True:
+    scaled numeric columns plus pandas categories with the categories fixed at training time
+    """
+    num_cols = preprocessing_objects['num_cols']
+    columns = {}
+    if num_cols:
+        num_data = scale_numeric(df, preprocessing_objects).astype(np.float32)
+        for j, col in enumerate(num_cols):
+            columns[col] = num_data[:, j]
+    cat_cols = preprocessing_objects['cat_cols']
+    cat_data = df.reindex(columns=cat_cols)
+    for col in cat_cols:
+        # Значения вне фиксированного набора становятся пропусками
+        columns[col] = pd.Categorical(cat_data[col].to_numpy(), categories=preprocessing_objects['categories'][col])
+
+    return pd.DataFrame(columns, index=df.index)[preprocessing_objects['feature_names']]
+
+
+def encode_features(df: pd.DataFrame, preprocessing_objects: dict, timings: Optional[dict] = None) -> pd.DataFrame:
+    """
+    Applies imputation, scaling and one-hot (or native categorical) encoding to a batch of rows
+    Returns a frame with columns ordered as feature_names
+    If timings is given, seconds spent on the numeric and categorical stages are stored in it
+    """
+    if preprocessing_objects.get('encoding') == 'native':
+        start = time.perf_counter()
+        X = encode_native(df, preprocessing_objects)
+        if timings is not None:
+            timings['encode_native'] = time.perf_counter() - start
+        return X
+
+    start = time.perf_counter()
+    feature_names = preprocessing_objects['feature_names']
+    positions = {name: i for i, name in enumerate(feature_names)}
+    X = np.zeros((len(df), len(feature_names)), dtype=np.float32)
+
+    num_cols = preprocessing_objects['num_cols']
+    if num_cols:
+        num_data = scale_numeric(df, preprocessing_objects)
+        for j, col in enumerate(num_cols):
+            if col in positions:
+                X[:, positions[col]] = num_data[:, j]
+    if timings is not None:
+        timings['impute_scale'] = time.perf_counter() - start
+        start = time.perf_counter()
+
+    cat_cols = preprocessing_objects['cat_cols']
+    if cat_cols:
+        cat_data = df.reindex(columns=cat_cols).astype(object)
+        cat_data = cat_data.where(cat_data.notna(), np.nan)
+        cat_data = preprocessing_objects['cat_imputer'].transform(cat_data)
+        for col, levels in get_dummy_levels(preprocessing_objects).items():
+            values = cat_data[:, cat_cols.index(col)]
+            for level in levels:
+                X[:, positions[f"{col}_{level}"]] = values == level
+    if timings is not None:
+        timings['one_hot'] = time.perf_counter() - start
+
+    return pd.DataFrame(X, columns=feature_names, index=df.index)
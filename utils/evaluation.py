@@ -0,0 +1,114 @@
+"""
+Evaluation across the source registries: leave-one-source-out folds and permutation importance.
+All permutations of one original column are stacked into a single matrix and scored with one
+prediction call; the metric of every permutation is then computed in vectorized form
+"""
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from scipy.stats import rankdata
+
+from utils.cohort import cohort_columns, read_cohort
+from utils.linkage import SOURCE_COLUMN
+
+# Вероятности обрезаются, чтобы log-loss оставался конечным
+EPSILON = 1e-15
+
+
+def load_sources(path: str, index: pd.Index) -> pd.Series:
+    """
+    Source registry of every row of load_training_data (aligned on its index)
+    """
+    if SOURCE_COLUMN not in cohort_columns(path):
+        raise ValueError(f"{path} has no {SOURCE_COLUMN} column; rebuild it with python pipeline.py")
+    return read_cohort(path, [SOURCE_COLUMN])[SOURCE_COLUMN].loc[index]
+
+
+def logloss_rows(y: np.ndarray, probabilities: np.ndarray) -> np.ndarray:
+    """
+    Log-loss of every row of an (n_repeats, n_rows) probability matrix
+    """
+    p = np.clip(probabilities, EPSILON, 1 - EPSILON)
+    return -(y * np.log(p) + (1 - y) * np.log(1 - p)).mean(axis=1)
+
+
+def auc_rows(y: np.ndarray, probabilities: np.ndarray) -> np.ndarray:
+    """
+    ROC AUC of every row of an (n_repeats, n_rows) probability matrix (Mann-Whitney with tied ranks,
+    equal to roc_auc_score); NaN if y has one class only
+    """
+    positive = y == 1
+    n_positive, n_negative = positive.sum(), (~positive).sum()
+    if not n_positive or not n_negative:
+        return np.full(len(probabilities), np.nan)
+    ranks = rankdata(probabilities, axis=1)
+    return (ranks[:, positive].sum(axis=1) - n_positive * (n_positive + 1) / 2) / (n_positive * n_negative)
+
+
+# Метрика и знак: важность - ухудшение метрики при перестановке
+SCORERS: Dict[str, Callable[[np.ndarray, np.ndarray], np.ndarray]] = {
+    "logloss": logloss_rows,
+    "auc": auc_rows,
+}
+GREATER_IS_BETTER = {"logloss": False, "auc": True}
+
+
+def permutation_importance(predict: Callable[[np.ndarray], np.ndarray], X: np.ndarray, y: np.ndarray,
+                           columns: List[str], matrix: np.ndarray, n_repeats: int = 10,
+                           scoring: str = "logloss", seed: int = 42) -> pd.DataFrame:
+    """
+    Permutation importance of the original columns (columns/matrix from contribution_groups:
+    the dummies of a one-hot column are permuted together). predict maps an encoded matrix
+    to probabilities; it is called once per column on n_repeats stacked permuted copies of X
+    Returns importance_mean/importance_std per column (metric worsening, higher is more important)
+    """
+    X = np.ascontiguousarray(X, dtype=np.float32)
+    y = np.asarray(y, dtype=np.float64)
+    n_rows = len(X)
+    score = SCORERS[scoring]
+    sign = 1.0 if GREATER_IS_BETTER[scoring] else -1.0
+    baseline = score(y, predict(X)[None, :])[0]
+    rng = np.random.default_rng(seed)
+
+    # Один буфер на все колонки: перед каждой колонкой восстанавливаются только ее признаки
+    stacked = np.tile(X, (n_repeats, 1))
+    rows = np.empty(n_repeats * n_rows, dtype=np.int64)
+    importances = np.empty((len(columns), n_repeats))
+    for j in range(len(columns)):
+        features = np.flatnonzero(matrix[:, j])
+        for r in range(n_repeats):
+            rows[r * n_rows:(r + 1) * n_rows] = rng.permutation(n_rows)
+        stacked[:, features] = X[rows[:, None], features]
+        probabilities = predict(stacked).reshape(n_repeats, n_rows)
+        importances[j] = sign * (baseline - score(y, probabilities))
+        stacked[:, features] = np.tile(X[:, features], (n_repeats, 1))
+
+    return pd.DataFrame({
+        "importance_mean": importances.mean(axis=1),
+        "importance_std": importances.std(axis=1),
+    }, index=pd.Index(columns, name="column"))
+
+
+def source_folds(sources: pd.Series, y: pd.Series) -> List[str]:
+    """
+    Sources that can be held out: labelled rows in the source and both classes in the other sources
+    """
+    folds = []
+    for source in sorted(sources.dropna().unique()):
+        held_out = (sources == source).to_numpy()
+        if held_out.any() and y[~held_out].nunique() == 2:
+            folds.append(source)
+    return folds
+
+
+def fold_metrics(y: np.ndarray, probabilities: np.ndarray) -> Dict[str, Optional[float]]:
+    y = np.asarray(y, dtype=np.float64)
+    auc = auc_rows(y, probabilities[None, :])[0]
+    return {
+        "rows": int(len(y)),
+        "positive_rate": float(y.mean()),
+        "auc": None if np.isnan(auc) else float(auc),
+        "logloss": float(logloss_rows(y, probabilities[None, :])[0]),
+        "brier": float(np.mean((probabilities - y) ** 2)),
+    }
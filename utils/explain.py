@@ -0,0 +1,52 @@
+from typing import Iterable, List, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.encoding import get_dummy_levels
+
+# Общая группа колонок, которые не приходят во входных данных, а заполняются значениями по умолчанию
+DEFAULTS_GROUP = "defaults"
+
+
+def contribution_groups(preprocessing_objects: dict, defaults: Iterable[str] = ()) -> Tuple[List[str], np.ndarray]:
+    """
+    Maps model features back to the original columns.
+    Returns the original column names and a (n_features, n_columns) 0/1 matrix:
+    a numeric column or a native categorical column is one feature, a one-hot column is the sum of its dummies;
+    the columns listed in `defaults` are merged into one DEFAULTS_GROUP column
+    """
+    feature_names = preprocessing_objects['feature_names']
+    positions = {name: i for i, name in enumerate(feature_names)}
+
+    groups = {}
+    for col in preprocessing_objects['num_cols']:
+        if col in positions:
+            groups[col] = [positions[col]]
+    if preprocessing_objects.get('encoding') == 'native':
+        for col in preprocessing_objects['cat_cols']:
+            if col in positions:
+                groups[col] = [positions[col]]
+    else:
+        for col, levels in get_dummy_levels(preprocessing_objects).items():
+            groups[col] = [positions[f"{col}_{level}"] for level in levels]
+
+    # Вклады заполненных по умолчанию колонок не объясняют запрос по отдельности, но остаются в сумме
+    merged = [position for col in defaults if col in groups for position in groups.pop(col)]
+    if merged:
+        groups[DEFAULTS_GROUP] = merged
+
+    columns = sorted(groups)
+    matrix = np.zeros((len(feature_names), len(columns)), dtype=np.float32)
+    for j, col in enumerate(columns):
+        matrix[groups[col], j] = 1
+    return columns, matrix
+
+
+def fold_contributions(contributions: np.ndarray, columns: List[str], matrix: np.ndarray) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Folds XGBoost pred_contribs output (n_rows, n_features + 1) to the original columns
+    Returns per-column contributions (log-odds) and the bias term of every row
+    """
+    folded = contributions[:, :-1] @ matrix
+    return pd.DataFrame(folded, columns=columns), contributions[:, -1]
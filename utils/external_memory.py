@@ -0,0 +1,169 @@
+import os
+from typing import Dict, Iterator, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import xgboost as xgb
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+
+from utils.balancing import balanced_class_weights
+from utils.constants import CATEGORICAL_COLUMNS
+from utils.linkage import SOURCE_COLUMN
+from utils.encoding import encode_features
+
+
+def csv_to_parquet(csv_path: str, parquet_path: str, chunksize: int = 100_000) -> str:
+    """
+    Converts the processed CSV into a Parquet file chunk by chunk.
+    Every chunk becomes a separate row group, so the whole CSV is never held in memory
+    """
+    header = pd.read_csv(csv_path, nrows=0).columns.tolist()
+    cat_cols = [col for col in header if col in CATEGORICAL_COLUMNS or col == SOURCE_COLUMN]
+    schema = pa.schema([
+        (col, pa.string() if col in cat_cols else pa.float64()) for col in header
+    ])
+
+    os.makedirs(os.path.dirname(parquet_path) or '.', exist_ok=True)
+    with pq.ParquetWriter(parquet_path, schema) as writer:
+        for chunk in pd.read_csv(csv_path, chunksize=chunksize, dtype={col: str for col in cat_cols}):
+            for col in header:
+                if col not in cat_cols:
+                    chunk[col] = chunk[col].astype('float64')
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+    return parquet_path
+
+
+def iter_parquet_chunks(path: str, batch_size: int, columns: Optional[List[str]] = None) -> Iterator[pd.DataFrame]:
+    """
+    Yields the Parquet file as pandas chunks of at most batch_size rows
+    """
+    parquet_file = pq.ParquetFile(path)
+    for batch in parquet_file.iter_batches(batch_size=batch_size, columns=columns):
+        yield batch.to_pandas()
+
+
+def split_columns(path: str, target: str, drop_columns: List[str]) -> Dict[str, List[str]]:
+    """
+    Splits Parquet columns into categorical and numeric ones using the file schema
+    """
+    schema = pq.read_schema(path)
+    cat_cols, num_cols = [], []
+    for field in schema:
+        if field.name == target or field.name in drop_columns:
+            continue
+        if pa.types.is_string(field.type) or pa.types.is_large_string(field.type):
+            cat_cols.append(field.name)
+        else:
+            num_cols.append(field.name)
+    return {'cat_cols': cat_cols, 'num_cols': num_cols}
+
+
+def fit_streaming_preprocessing(path: str, target: str, drop_columns: List[str], batch_size: int) -> dict:
+    """
+    Fits the same preprocessing objects as XGBoost.py in two streaming passes:
+    the first collects means, modes and class counts, the second fits the scaler on imputed chunks
+    """
+    columns = split_columns(path, target, drop_columns)
+    cat_cols, num_cols = columns['cat_cols'], columns['num_cols']
+
+    sums = pd.Series(0.0, index=num_cols)
+    counts = pd.Series(0, index=num_cols)
+    value_counts = {col: pd.Series(dtype='int64') for col in cat_cols}
+    class_counts = pd.Series(dtype='int64')
+
+    # Проход 1: средние, моды и количество объектов каждого класса
+    for chunk in iter_parquet_chunks(path, batch_size, columns=num_cols + cat_cols + [target]):
+        chunk = chunk[chunk[target].notna()]
+        sums += chunk[num_cols].sum()
+        counts += chunk[num_cols].count()
+        for col in cat_cols:
+            value_counts[col] = value_counts[col].add(chunk[col].value_counts(), fill_value=0)
+        class_counts = class_counts.add(chunk[target].value_counts(), fill_value=0)
+
+    # Удаляем пустые категориальные колонки
+    empty_cat_cols = [col for col in cat_cols if value_counts[col].empty]
+    if empty_cat_cols:
+        print(f"Removing empty categorical columns: {empty_cat_cols}")
+        cat_cols = [col for col in cat_cols if col not in empty_cat_cols]
+
+    # Импутеры обучаются на одной строке с уже посчитанными статистиками,
+    # поэтому их statistics_ совпадают с обучением на полном датасете
+    num_imputer = SimpleImputer(strategy='mean').fit(pd.DataFrame([sums / counts]))
+    categories = {col: sorted(value_counts[col].index) for col in cat_cols}
+    # SimpleImputer(most_frequent) при равенстве частот выбирает наименьшее значение
+    modes = {
+        col: min(value_counts[col][value_counts[col] == value_counts[col].max()].index)
+        for col in cat_cols
+    }
+    cat_imputer = SimpleImputer(strategy='most_frequent').fit(pd.DataFrame([modes], columns=cat_cols))
+
+    # Проход 2: стандартизация по импутированным данным
+    scaler = StandardScaler()
+    for chunk in iter_parquet_chunks(path, batch_size, columns=num_cols + [target]):
+        chunk = chunk[chunk[target].notna()]
+        if len(chunk):
+            scaler.partial_fit(pd.DataFrame(num_imputer.transform(chunk[num_cols]), columns=num_cols))
+
+    dummy_names = [f"{col}_{value}" for col in cat_cols for value in categories[col][1:]]
+    return {
+        'cat_imputer': cat_imputer if cat_cols else None,
+        'num_imputer': num_imputer if num_cols else None,
+        'scaler': scaler if num_cols else None,
+        'cat_cols': cat_cols,
+        'num_cols': num_cols,
+        'categories': categories,
+        'encoding': 'onehot',
+        'feature_names': num_cols + dummy_names,
+        'class_counts': {int(label): int(count) for label, count in class_counts.items()},
+    }
+
+
+class ParquetBatchIter(xgb.DataIter):
+    """
+    XGBoost external-memory iterator over a Parquet file.
+    Each chunk is encoded with the fitted preprocessing objects right before it is handed to XGBoost,
+    rows are balanced with class weights instead of being duplicated.
+    Every holdout_every-th row goes to the validation subset
+    """
+
+    def __init__(self, path: str, preprocessing_objects: dict, target: str, batch_size: int,
+                 cache_prefix: str, subset: str = 'train', holdout_every: int = 5):
+        self._path = path
+        self._preprocessing_objects = preprocessing_objects
+        self._target = target
+        self._batch_size = batch_size
+        self._subset = subset
+        self._holdout_every = holdout_every
+        class_weights = balanced_class_weights(preprocessing_objects['class_counts'])
+        self._class_weights = np.array([class_weights.get(0, 1.0), class_weights.get(1, 1.0)], dtype=np.float32)
+        self._columns = preprocessing_objects['num_cols'] + preprocessing_objects['cat_cols'] + [target]
+        self._chunks = None
+        self._offset = 0
+        super().__init__(cache_prefix=cache_prefix)
+
+    def reset(self) -> None:
+        self._chunks = iter_parquet_chunks(self._path, self._batch_size, columns=self._columns)
+        self._offset = 0
+
+    def next(self, input_data) -> int:
+        if self._chunks is None:
+            self.reset()
+        for chunk in self._chunks:
+            row_numbers = np.arange(self._offset, self._offset + len(chunk))
+            self._offset += len(chunk)
+
+            is_holdout = row_numbers % self._holdout_every == 0 if self._holdout_every else np.zeros(len(chunk), bool)
+            mask = chunk[self._target].notna().to_numpy() & (is_holdout if self._subset == 'valid' else ~is_holdout)
+            chunk = chunk[mask]
+            if chunk.empty:
+                continue
+
+            y = chunk[self._target].to_numpy(dtype=np.float32)
+            weight = self._class_weights[y.astype(int)]
+            X = encode_features(chunk, self._preprocessing_objects)
+            input_data(data=X, label=y, weight=weight)
+            return 1
+        return 0
@@ -0,0 +1,259 @@
+"""
+Allele-level HLA matching. Patient and donor typings (two alleles at each of A, B, C, DRB1, DQB1)
+are compared per locus, and donor registries are indexed by (locus, allele) in an inverted index,
+so a search for >= N/10 matched donors only reads the posting lists of the patient's alleles
+
+Typings are dicts {locus: [allele, allele]} or strings like "A*02:01 A*24:02 B*07:02 ...";
+a single allele at a locus means a homozygous typing
+"""
+import re
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+LOCI = ("A", "B", "C", "DRB1", "DQB1")
+MAX_MATCHES = 2 * len(LOCI)
+
+# allele - два поля (A*02:01), antigen - первое поле (A*02)
+RESOLUTIONS = ('allele', 'antigen')
+
+# Колонки типирования в файле регистра доноров
+HLA_COLUMNS = {locus: (f"hla_{locus.lower()}_1", f"hla_{locus.lower()}_2") for locus in LOCI}
+
+_ALLELE_PATTERN = re.compile(r"^(?:HLA-)?(?:([A-Z]+[0-9]?)\*)?(\d+)(?::(\d+))?")
+
+Typing = Dict[str, Tuple[str, ...]]
+
+
+def normalize_allele(allele: str, locus: Optional[str] = None, resolution: str = 'allele') -> Optional[str]:
+    """
+    Reduces an allele name to LOCUS*field1:field2 (or LOCUS*field1 for antigen resolution).
+    Low-resolution typings (one field) stay at antigen level
+    """
+    if allele is None or (isinstance(allele, float) and np.isnan(allele)):
+        return None
+    match = _ALLELE_PATTERN.match(str(allele).strip().upper())
+    if match is None:
+        raise ValueError(f"Unrecognized HLA allele: {allele}")
+    allele_locus = match.group(1) or locus
+    if allele_locus not in LOCI:
+        raise ValueError(f"Unknown HLA locus in {allele}")
+    if locus is not None and allele_locus != locus:
+        raise ValueError(f"Allele {allele} typed at locus {locus}")
+    if resolution == 'antigen' or match.group(3) is None:
+        return f"{allele_locus}*{match.group(2)}"
+    return f"{allele_locus}*{match.group(2)}:{match.group(3)}"
+
+
+def parse_typing(typing, resolution: str = 'allele') -> Typing:
+    """
+    Parses a typing into {locus: (allele, allele)}; untyped loci are absent
+    """
+    if isinstance(typing, str):
+        alleles = {}
+        for token in re.split(r"[\s,;/]+", typing.strip()):
+            if token:
+                allele = normalize_allele(token, resolution=resolution)
+                alleles.setdefault(allele.split("*")[0], []).append(allele)
+    else:
+        alleles = {
+            locus.upper(): [normalize_allele(a, locus.upper(), resolution) for a in
+                            (values.split("/") if isinstance(values, str) else values)]
+            for locus, values in typing.items()
+        }
+    parsed = {}
+    for locus, values in alleles.items():
+        values = [value for value in values if value is not None]
+        if len(values) > 2:
+            raise ValueError(f"More than two alleles at locus {locus}")
+        if values:
+            # Одна аллель - гомозигота
+            parsed[locus] = tuple(values) if len(values) == 2 else (values[0], values[0])
+    return parsed
+
+
+def locus_matches(patient: Tuple[str, ...], donor: Tuple[str, ...]) -> int:
+    """
+    Matched alleles at one locus (0-2): the size of the multiset intersection of both typings
+    """
+    return sum((Counter(patient) & Counter(donor)).values())
+
+
+def match_grade(patient: Typing, donor: Typing) -> dict:
+    """
+    Per-locus and total matches; loci untyped on either side count as mismatched
+    """
+    loci = {locus: locus_matches(patient.get(locus, ()), donor.get(locus, ())) for locus in LOCI}
+    matches = sum(loci.values())
+    return {
+        "matches": matches,
+        "grade": f"{matches}/{MAX_MATCHES}",
+        "loci": loci,
+        "mismatched_loci": [locus for locus, n in loci.items() if n < 2],
+    }
+
+
+def normalize_allele_column(values: pd.Series, locus: str, resolution: str = 'allele') -> np.ndarray:
+    """
+    Vectorized normalize_allele for a registry column; missing values stay None
+    """
+    # Уникальных аллелей в регистре сотни, поэтому разбираем только их
+    codes, uniques = pd.factorize(values)
+    normalized = np.array([normalize_allele(value, locus, resolution) for value in uniques] + [None], dtype=object)
+    return normalized[codes]
+
+
+class DonorIndex:
+    """
+    Inverted index (locus, allele) -> sorted donor positions. Homozygous donors get a second
+    posting list, so the count of lists a donor appears in equals its number of matched alleles
+    """
+
+    def __init__(self, typings: pd.DataFrame, resolution: str = 'allele'):
+        """
+        typings has the HLA_COLUMNS of every locus, one row per donor (row position = donor position)
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution: {resolution}")
+        self.resolution = resolution
+        self.n_donors = len(typings)
+        self.alleles = {}
+        self.postings: Dict[Tuple[str, str], np.ndarray] = {}
+        self.homozygous: Dict[Tuple[str, str], np.ndarray] = {}
+        positions = np.arange(self.n_donors, dtype=np.int32)
+
+        for locus, (first_col, second_col) in HLA_COLUMNS.items():
+            if first_col not in typings.columns:
+                continue
+            first = normalize_allele_column(typings[first_col], locus, resolution)
+            second = normalize_allele_column(typings[second_col], locus, resolution) \
+                if second_col in typings.columns else np.full(self.n_donors, None, dtype=object)
+            # Одна аллель - гомозигота
+            second = np.where(pd.isna(second), first, second)
+            self.alleles[locus] = (first, second)
+
+            homozygous = first == second
+            # Каждый донор входит в список аллели один раз, гомозиготы - еще и в отдельный список
+            alleles = np.concatenate([first, second[~homozygous]])
+            donors = np.concatenate([positions, positions[~homozygous]])
+            self._add_postings(self.postings, locus, alleles, donors)
+            self._add_postings(self.homozygous, locus, first[homozygous], positions[homozygous])
+
+    @staticmethod
+    def _add_postings(postings: dict, locus: str, alleles: np.ndarray, donors: np.ndarray) -> None:
+        typed = ~pd.isna(alleles)
+        codes, uniques = pd.factorize(alleles[typed])
+        donors = donors[typed]
+        order = np.lexsort((donors, codes))
+        boundaries = np.flatnonzero(np.diff(codes[order])) + 1
+        for group in np.split(order, boundaries):
+            if len(group):
+                postings[(locus, uniques[codes[group[0]]])] = donors[group]
+
+    def typing(self, position: int) -> Typing:
+        return {locus: (first[position], second[position]) for locus, (first, second) in self.alleles.items()
+                if first[position] is not None}
+
+    def _patient_lists(self, patient: Typing) -> List[np.ndarray]:
+        lists = []
+        for locus, alleles in patient.items():
+            for allele, count in Counter(alleles).items():
+                lists.append(self.postings.get((locus, allele), np.empty(0, dtype=np.int32)))
+                if count == 2:
+                    lists.append(self.homozygous.get((locus, allele), np.empty(0, dtype=np.int32)))
+        return lists
+
+    def search(self, patient: Typing, min_matches: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Donor positions with at least min_matches matched alleles and their match counts.
+        A donor matching N of the patient's L posting lists must appear in one of the
+        L - N + 1 shortest lists, so only those are merged into candidates; the remaining
+        lists are probed with binary search for the candidates alone
+        """
+        if min_matches <= 0:
+            positions = np.arange(self.n_donors, dtype=np.int32)
+            return positions, self.count_matches(patient, positions)
+        lists = sorted(self._patient_lists(patient), key=len)
+        n_seed = len(lists) - min_matches + 1
+        if n_seed <= 0:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.int32)
+
+        candidates = np.unique(np.concatenate(lists[:n_seed]))
+        counts = self._count_in_lists(candidates, lists)
+        keep = counts >= min_matches
+        return candidates[keep], counts[keep]
+
+    def count_matches(self, patient: Typing, positions: np.ndarray) -> np.ndarray:
+        """
+        Matched alleles of the given donors (sorted positions)
+        """
+        return self._count_in_lists(np.asarray(positions, dtype=np.int32), self._patient_lists(patient))
+
+    @staticmethod
+    def _count_in_lists(candidates: np.ndarray, lists: Iterable[np.ndarray]) -> np.ndarray:
+        counts = np.zeros(len(candidates), dtype=np.int32)
+        for postings in lists:
+            if len(postings) == 0:
+                continue
+            found = np.searchsorted(postings, candidates)
+            counts += postings[np.minimum(found, len(postings) - 1)] == candidates
+        return counts
+
+    def scan(self, patient: Typing, min_matches: int = 8) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Reference full scan over all typings (used to check and benchmark search)
+        """
+        counts = np.zeros(self.n_donors, dtype=np.int32)
+        for locus, (first, second) in self.alleles.items():
+            patient_alleles = patient.get(locus)
+            if patient_alleles is None:
+                continue
+            p1, p2 = patient_alleles
+            straight = (first == p1).astype(np.int32) + (second == p2)
+            crossed = (first == p2).astype(np.int32) + (second == p1)
+            counts += np.maximum(straight, crossed)
+        positions = np.flatnonzero(counts >= min_matches).astype(np.int32)
+        return positions, counts[positions]
+
+
+class DonorRegistry:
+    """
+    Donor records (donor_id, donor_age, donor_sex, HLA columns) with the inverted index of their typings
+    """
+
+    def __init__(self, donors: pd.DataFrame, resolution: str = 'allele'):
+        if "donor_id" not in donors.columns:
+            raise ValueError("Donor registry needs a donor_id column")
+        self.donors = donors.reset_index(drop=True)
+        self.index = DonorIndex(self.donors, resolution)
+
+    def __len__(self) -> int:
+        return len(self.donors)
+
+    def search(self, patient: Typing, min_matches: int = 8, limit: Optional[int] = None) -> pd.DataFrame:
+        """
+        Donors with at least min_matches matched alleles, best matched first
+        Returns their registry rows (indexed by registry position) with hla_matches,
+        matched alleles out of 10 as in the model's hla_match_score
+        """
+        positions, counts = self.index.search(patient, min_matches)
+        # Стабильная сортировка: при равном числе совпадений - порядок регистра
+        order = np.argsort(-counts, kind="stable")
+        if limit is not None:
+            order = order[:limit]
+        result = self.donors.iloc[positions[order]].copy()
+        result["hla_matches"] = counts[order]
+        return result
+
+    def grade(self, patient: Typing, position: int) -> dict:
+        return match_grade(patient, self.index.typing(position))
+
+
+def load_donor_registry(path: str, resolution: str = 'allele') -> DonorRegistry:
+    """
+    Loads a donor registry from CSV or Parquet
+    """
+    donors = pd.read_parquet(path) if path.endswith(".parquet") else pd.read_csv(path, dtype={"donor_id": str})
+    return DonorRegistry(donors, resolution)
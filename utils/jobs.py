@@ -0,0 +1,483 @@
+"""
+Asynchronous batch-scoring jobs of the API (/jobs): an uploaded or referenced CSV/Parquet file
+is scored chunk by chunk in a local process pool and spooled to the job directory as Parquet
+parts, like score_batch.py does. Whatever the input size, a running job holds only a few chunks
+in memory. Job state is kept in files, so any serve.py worker can report or cancel a job
+started by another one; the limits on running and queued jobs hold across all processes
+sharing the jobs directory (lock files, fcntl.flock)
+"""
+import fcntl
+import io
+import json
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Callable, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from utils.batch_scoring import SUCCESS_FILE, init_worker, iter_tasks, list_parts, score_chunk
+from utils.wire import ARROW_STREAM, media_type
+
+CSV = "text/csv"
+PARQUET = "application/vnd.apache.parquet"
+INPUT_FILES = {CSV: "input.csv", PARQUET: "input.parquet"}
+RESULT_FORMATS = (CSV, ARROW_STREAM)
+
+JOB_FILE = "_job.json"
+STATUS_FILE = "_status.json"
+CANCEL_FILE = "_cancel"
+# Блокировка очереди и слоты выполняемых задач, общие для всех процессов API с этим каталогом
+QUEUE_LOCK_FILE = "_queue.lock"
+SLOTS_DIR = "_slots"
+# Как часто задача в очереди проверяет, освободился ли слот
+SLOT_POLL_SECONDS = 0.2
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+CANCELLED = "cancelled"
+INTERRUPTED = "interrupted"
+ACTIVE_STATES = (QUEUED, RUNNING)
+
+# Сколько задач все процессы API вместе принимают сверх выполняемых, дальше - 429
+MAX_QUEUED_JOBS = 16
+JOB_ID = re.compile(r"^[0-9a-f]{32}$")
+
+
+class JobNotFound(Exception):
+    pass
+
+
+class JobConflict(Exception):
+    """
+    The job is in a state that does not allow the operation (results of an unfinished job, resume of a running one)
+    """
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+
+def read_json(path: str) -> dict:
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path: str, data: dict) -> None:
+    # Запись через rename: читатели из других процессов не видят наполовину записанный файл
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(data, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def input_columns(path: str) -> List[str]:
+    if path.endswith(".parquet"):
+        return pq.read_schema(path).names
+    return list(pd.read_csv(path, nrows=0).columns)
+
+
+def count_input_rows(path: str) -> int:
+    """
+    Rows of a Parquet file from its metadata; rows of a CSV file counted as line breaks
+    (an estimate for the progress, quoted values with line breaks are counted twice)
+    """
+    if path.endswith(".parquet"):
+        return pq.ParquetFile(path).metadata.num_rows
+    lines = 0
+    last = b"\n"
+    with open(path, "rb") as f:
+        while block := f.read(1 << 20):
+            lines += block.count(b"\n")
+            last = block[-1:]
+    # Строка без завершающего перевода строки и заголовок
+    return max(lines + (last != b"\n") - 1, 0)
+
+
+def rows_in_parts(output_dir: str) -> int:
+    return sum(pq.ParquetFile(part).metadata.num_rows for part in list_parts(output_dir))
+
+
+def check_input(path: str, required: List[str], keep_columns: List[str]) -> None:
+    columns = set(input_columns(path))
+    missing = [name for name in required if name not in columns]
+    if missing:
+        raise ValueError(f"Input has no columns {missing}")
+    missing = [name for name in keep_columns if name not in columns]
+    if missing:
+        raise ValueError(f"keep_columns not in the input: {missing}")
+
+
+def result_format(accept: Optional[str]) -> str:
+    """
+    First result format named in an Accept header; CSV for a missing header or */*
+    """
+    for part in (accept or "").split(","):
+        value = media_type(part)
+        if value in RESULT_FORMATS:
+            return value
+    return CSV
+
+
+def iter_results(parts: List[str], fmt: str) -> Iterator[bytes]:
+    """
+    Streams the parts of a job as one CSV file or one Arrow IPC stream, reading one part at a time
+    """
+    if fmt == CSV:
+        for i, part in enumerate(parts):
+            yield pd.read_parquet(part).to_csv(index=False, header=i == 0).encode()
+        return
+
+    sink = io.BytesIO()
+
+    def drain() -> bytes:
+        data = sink.getvalue()
+        sink.seek(0)
+        sink.truncate()
+        return data
+
+    writer = schema = None
+    for part in parts:
+        table = pq.read_table(part)
+        if writer is None:
+            schema = table.schema
+            writer = pa.ipc.new_stream(sink, schema)
+        # Типы частей совпадают, кроме колонок из одних пропусков (null) - они приводятся к типам первой части
+        writer.write_table(table.cast(schema))
+        yield drain()
+    if writer is None:
+        writer = pa.ipc.new_stream(sink, pa.schema([]))
+    writer.close()
+    yield drain()
+
+
+class JobManager:
+    """
+    Jobs of one API process: one driver thread per job that waits for a running slot, feeds chunks
+    to a pool of scoring processes and records the progress. Slots are lock files held with flock,
+    so max_running holds for all processes sharing the root (serve.py workers), and a lock dies with
+    its process. The pool exists only while this process runs a job
+    """
+
+    def __init__(self, root: str, model_dir: str, run_id: Optional[str], model_version: str, workers: int,
+                 max_running: int = 1, on_finish: Optional[Callable[[str, int], None]] = None):
+        self.root = root
+        self.model_dir = model_dir
+        self.run_id = run_id
+        self.model_version = model_version
+        self.workers = workers
+        self.max_running = max_running
+        self.on_finish = on_finish
+        self._lock = threading.Lock()
+        self._active = set()
+        self._running = set()
+        self._pool = None
+        self._draining = False
+        self._closing = False
+
+    def path(self, job_id: str) -> str:
+        path = os.path.join(self.root, job_id)
+        if not JOB_ID.match(job_id) or not os.path.exists(os.path.join(path, STATUS_FILE)):
+            raise JobNotFound(f"No job {job_id}")
+        return path
+
+    def active_jobs(self) -> int:
+        """
+        Queued and running jobs of all processes (jobs of exited processes are not counted)
+        """
+        count = 0
+        for job_id in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            try:
+                count += self.status(job_id)["state"] in ACTIVE_STATES
+            except (JobNotFound, FileNotFoundError):
+                continue
+        return count
+
+    def check_capacity(self) -> None:
+        active = self.active_jobs()
+        if active >= self.max_running + MAX_QUEUED_JOBS:
+            raise JobQueueFull(f"{active} jobs are queued or running, try again later")
+
+    @contextmanager
+    def _queue_lock(self):
+        # flock разных open() исключают друг друга и между потоками одного процесса
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, QUEUE_LOCK_FILE), "w") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            yield
+
+    def new_job(self) -> str:
+        """
+        Creates the directory of a job; its input is then written there (input_path) or referenced
+        """
+        job_id = uuid.uuid4().hex
+        os.makedirs(os.path.join(self.root, job_id))
+        return job_id
+
+    def input_path(self, job_id: str, fmt: str) -> str:
+        return os.path.join(self.root, job_id, INPUT_FILES[fmt])
+
+    def discard(self, job_id: str) -> None:
+        shutil.rmtree(os.path.join(self.root, job_id), ignore_errors=True)
+
+    def submit(self, job_id: str, input_path: str, required: List[str], keep_columns: List[str], explain: bool,
+               chunksize: int) -> dict:
+        """
+        Checks the input columns and queues the job; raises ValueError for an unusable input
+        """
+        path = os.path.join(self.root, job_id)
+        check_input(input_path, required, keep_columns)
+        job = {
+            "job_id": job_id,
+            "input": os.path.abspath(input_path),
+            "keep_columns": keep_columns,
+            "explain": explain,
+            "chunksize": chunksize,
+            "model_version": self.model_version,
+        }
+        write_json(os.path.join(path, JOB_FILE), job)
+        status = {
+            "job_id": job_id,
+            "state": QUEUED,
+            "model_version": self.model_version,
+            "rows_total": count_input_rows(input_path),
+            "rows_scored": 0,
+            "chunks_scored": 0,
+            "created_at": now(),
+            "started_at": None,
+            "finished_at": None,
+            "rows_per_second": None,
+            "error": None,
+            "pid": os.getpid(),
+        }
+        self._start(job_id, status)
+        return self.status(job_id)
+
+    def resume(self, job_id: str) -> dict:
+        """
+        Restarts an interrupted or failed job; chunks that already have a part are not scored again
+        """
+        path = self.path(job_id)
+        status = self.status(job_id)
+        if status["state"] not in (INTERRUPTED, FAILED):
+            raise JobConflict(f"Job {job_id} is {status['state']}, only interrupted or failed jobs can be resumed")
+        job = read_json(os.path.join(path, JOB_FILE))
+        if job["model_version"] != self.model_version and not list_parts(path):
+            # Ни одна часть еще не посчитана: задача целиком оценивается текущей моделью
+            job["model_version"] = status["model_version"] = self.model_version
+            write_json(os.path.join(path, JOB_FILE), job)
+        if job["model_version"] != self.model_version:
+            raise JobConflict(f"Job {job_id} was scored by model {job['model_version']}, "
+                              f"the API now serves {self.model_version}; submit it again")
+        status.update(state=QUEUED, finished_at=None, rows_per_second=None, error=None, pid=os.getpid())
+        del status["progress"]
+        self._start(job_id, status)
+        return self.status(job_id)
+
+    def _start(self, job_id: str, status: dict) -> None:
+        # Подсчет и запись статуса под одной блокировкой: два процесса не займут последнее место вместе
+        with self._queue_lock():
+            self.check_capacity()
+            write_json(os.path.join(self.root, job_id, STATUS_FILE), status)
+        with self._lock:
+            self._active.add(job_id)
+        threading.Thread(target=self._run, args=(job_id,), name=f"job-{job_id[:8]}", daemon=True).start()
+
+    def status(self, job_id: str) -> dict:
+        status = read_json(os.path.join(self.path(job_id), STATUS_FILE))
+        # Процесс API, который вел задачу, завершился (перезапуск воркера, сбой)
+        if status["state"] in ACTIVE_STATES and not pid_alive(status["pid"]):
+            status.update(state=INTERRUPTED, error="The API process running the job exited")
+        total = status["rows_total"]
+        status["progress"] = min(status["rows_scored"] / total, 1.0) if total else None
+        return status
+
+    def list_jobs(self, limit: int = 100) -> List[dict]:
+        statuses = []
+        for job_id in os.listdir(self.root) if os.path.isdir(self.root) else []:
+            try:
+                statuses.append(self.status(job_id))
+            except (JobNotFound, FileNotFoundError):
+                continue
+        return sorted(statuses, key=lambda status: status["created_at"], reverse=True)[:limit]
+
+    def cancel(self, job_id: str) -> str:
+        """
+        Deletes a finished job; a queued or running one is stopped by its driver thread (possibly in
+        another worker), which deletes it once the chunks in flight are written. Returns the new state
+        """
+        path = self.path(job_id)
+        if self.status(job_id)["state"] in ACTIVE_STATES:
+            open(os.path.join(path, CANCEL_FILE), "w").close()
+            return "cancelling"
+        shutil.rmtree(path)
+        return "deleted"
+
+    def parts(self, job_id: str) -> List[str]:
+        status = self.status(job_id)
+        if status["state"] != SUCCEEDED:
+            raise JobConflict(f"Job {job_id} is {status['state']}, results are available once it has succeeded")
+        return list_parts(self.path(job_id))
+
+    def _acquire_slot(self, path: str) -> Optional[int]:
+        """
+        Waits for a free running slot (a lock file nobody holds); returns its descriptor, or None
+        if the job was cancelled or the process started stopping while it waited
+        """
+        slots_dir = os.path.join(self.root, SLOTS_DIR)
+        os.makedirs(slots_dir, exist_ok=True)
+        while not self._draining and not os.path.exists(os.path.join(path, CANCEL_FILE)):
+            for i in range(self.max_running):
+                fd = os.open(os.path.join(slots_dir, f"{i}.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except BlockingIOError:
+                    os.close(fd)
+            time.sleep(SLOT_POLL_SECONDS)
+        return None
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                # spawn: воркеры не наследуют потоки процесса API (OpenMP, event loop)
+                ctx = multiprocessing.get_context("spawn")
+                self._pool = ctx.Pool(self.workers, initializer=init_worker,
+                                      initargs=(self.model_dir, self.run_id, 1))
+            return self._pool
+
+    def _release_pool(self) -> None:
+        # Без выполняемых задач процессы скоринга останавливаются: каждый воркер serve.py держит пул,
+        # только пока занимает слот
+        with self._lock:
+            if self._running or self._pool is None or self._closing:
+                return
+            pool, self._pool = self._pool, None
+        pool.close()
+        pool.join()
+
+    def _run(self, job_id: str) -> None:
+        path = os.path.join(self.root, job_id)
+        status_path = os.path.join(path, STATUS_FILE)
+        status = read_json(status_path)
+        slot = None
+        try:
+            slot = self._acquire_slot(path)
+            if os.path.exists(os.path.join(path, CANCEL_FILE)):
+                shutil.rmtree(path)
+                return
+            if slot is None:
+                status.update(state=INTERRUPTED, error="The API process was stopped before the job started")
+                write_json(status_path, status)
+                return
+            with self._lock:
+                self._running.add(job_id)
+            status.update(state=RUNNING, started_at=now(), rows_scored=rows_in_parts(path),
+                          chunks_scored=len(list_parts(path)))
+            write_json(status_path, status)
+            self._score(job_id, path, status)
+        except Exception as e:
+            if not self._closing:
+                status.update(state=FAILED, finished_at=now(), error=f"{type(e).__name__}: {e}")
+                write_json(status_path, status)
+                if self.on_finish is not None:
+                    self.on_finish(FAILED, status["rows_scored"])
+        finally:
+            with self._lock:
+                self._running.discard(job_id)
+                self._active.discard(job_id)
+            if slot is not None:
+                os.close(slot)
+                self._release_pool()
+
+    def _score(self, job_id: str, path: str, status: dict) -> None:
+        job = read_json(os.path.join(path, JOB_FILE))
+        status_path = os.path.join(path, STATUS_FILE)
+        pool = self._get_pool()
+        start = time.perf_counter()
+        rows = 0
+
+        def report(index: int, chunk_rows: int) -> None:
+            nonlocal rows
+            rows += chunk_rows
+            status["rows_scored"] += chunk_rows
+            status["chunks_scored"] += 1
+            if not self._closing:
+                write_json(status_path, status)
+
+        cancelled = False
+        pending = deque()
+        for task in iter_tasks(job["input"], job["chunksize"], job["keep_columns"], job["explain"], path):
+            if os.path.exists(os.path.join(path, CANCEL_FILE)):
+                cancelled = True
+                break
+            pending.append(pool.apply_async(score_chunk, (task,)))
+            # Не больше двух чанков на воркер в очереди: память не растет с размером входа
+            if len(pending) >= 2 * self.workers:
+                report(*pending.popleft().get())
+        while pending:
+            report(*pending.popleft().get())
+
+        if cancelled or os.path.exists(os.path.join(path, CANCEL_FILE)):
+            shutil.rmtree(path)
+            if self.on_finish is not None:
+                self.on_finish(CANCELLED, rows)
+            return
+
+        elapsed = time.perf_counter() - start
+        summary = {"rows": status["rows_scored"], "seconds": elapsed, "rows_per_second": rows / elapsed if elapsed else 0.0}
+        write_json(os.path.join(path, SUCCESS_FILE), summary)
+        status.update(state=SUCCEEDED, finished_at=now(), rows_total=status["rows_scored"],
+                      rows_per_second=summary["rows_per_second"])
+        write_json(status_path, status)
+        if self.on_finish is not None:
+            self.on_finish(SUCCEEDED, rows)
+
+    def shutdown(self, timeout: float = 0.0) -> None:
+        """
+        Lets the running jobs of this process finish within timeout seconds, then stops the scoring
+        processes. Queued jobs that have not started and jobs still running at the deadline are left
+        as interrupted and can be resumed
+        """
+        self._draining = True
+        deadline = time.monotonic() + timeout
+        while self._active and time.monotonic() < deadline:
+            time.sleep(SLOT_POLL_SECONDS)
+        self._closing = True
+        with self._lock:
+            if self._pool is not None:
+                self._pool.terminate()
+                self._pool = None
+            for job_id in self._active:
+                status_path = os.path.join(self.root, job_id, STATUS_FILE)
+                try:
+                    status = read_json(status_path)
+                except FileNotFoundError:
+                    continue
+                status.update(state=INTERRUPTED, error="The API process running the job was stopped")
+                write_json(status_path, status)
@@ -0,0 +1,315 @@
+"""
+Record linkage of the combined registries. The same patient reported by two sources rarely gives
+identical rows after harmonization (missing fields, rounded ages, months converted to days),
+so exact row deduplication misses them. Records are blocked on cheap keys (diagnosis, sex,
+one-year age bucket compared with the next bucket too), candidate pairs from different sources
+are scored field by field with vectorized comparisons, and linked records are merged into clusters
+"""
+from collections import Counter
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+SOURCE_COLUMN = "source"
+CLUSTER_COLUMN = "cluster_id"
+
+# Точные ключи блокировки; возраст блокируется отдельно бакетами по годам.
+# Записи без какого-либо ключа не блокируются и ищутся только среди точных дубликатов
+BLOCKING_KEYS = ("diagnosis", "patient_sex")
+AGE_COLUMN = "patient_age"
+
+# Допуски числовых полей: (абсолютный, относительный); остальные поля сравниваются точно
+TOLERANCES = {
+    "patient_age": (1.0, 0.0),
+    "days_from_diagnosis_to_hct": (0.0, 0.1),
+    "cd34_dose": (0.0, 0.05),
+    "engraftment_days": (1.0, 0.0),
+}
+
+# Веса Феллеги-Сантера: совпадение поля дает log2(m/u) бит, расхождение - log2((1-m)/(1-u)),
+# где u - доля случайных пар, совпадающих по полю, m - доля совпадений у записей одного пациента
+M_PROBABILITY = 0.95
+U_SAMPLE_PAIRS = 200_000
+# Порог связывания задается для каждой пары источников: доля наибольшего веса, который пара может
+# набрать при совпадении всех общих полей, но не ниже минимального веса (в битах).
+# Пары источников, у которых наибольший вес ниже минимального, не сравниваются
+LINK_SHARE = 0.75
+MIN_LINK_WEIGHT = 4.0
+
+# Исходы и метки не идентифицируют пациента: их совпадение не говорит о том, что записи одного человека
+LABEL_COLUMNS = ("engraftment_success", "engraftment_days", "overall_survival_1y", "acute_gvhd_grade",
+                 "chronic_gvhd", "relapse", "trm")
+
+# Пар за один векторизованный шаг сравнения
+PAIR_CHUNK = 1_000_000
+
+
+class FieldComparator:
+    """
+    One compared field: integer codes for categories, floats with a tolerance for numeric columns.
+    A value missing on either side is neutral
+    """
+
+    def __init__(self, name: str, values: pd.Series):
+        self.name = name
+        if name in TOLERANCES:
+            self.values = pd.to_numeric(values, errors="coerce").to_numpy(dtype=np.float64)
+            self.missing = np.isnan(self.values)
+            self.absolute, self.relative = TOLERANCES[name]
+        else:
+            self.values = pd.factorize(values)[0].astype(np.int32)
+            self.missing = self.values < 0
+            self.absolute = self.relative = None
+        self.u = 1.0
+        self.agree_weight = 0.0
+        self.disagree_weight = 0.0
+
+    def compare(self, left: np.ndarray, right: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the (present, agree) masks of the pairs
+        """
+        present = ~(self.missing[left] | self.missing[right])
+        a, b = self.values[left], self.values[right]
+        if self.absolute is None:
+            return present, present & (a == b)
+        tolerance = self.absolute + self.relative * np.maximum(np.abs(a), np.abs(b))
+        return present, present & (np.abs(a - b) <= tolerance)
+
+    def fit_weights(self, left: np.ndarray, right: np.ndarray) -> None:
+        """
+        Estimates u on random record pairs (almost all of them are different patients).
+        u is capped below m: a field random pairs agree on as often as true matches carries no evidence
+        """
+        present, agree = self.compare(left, right)
+        self.u = float(np.clip(agree.sum() / max(present.sum(), 1), 1e-3, M_PROBABILITY))
+        self.agree_weight = float(np.log2(M_PROBABILITY / self.u))
+        self.disagree_weight = float(np.log2((1 - M_PROBABILITY) / (1 - self.u)))
+
+
+def fit_comparators(df: pd.DataFrame, columns: List[str], seed: int = 0) -> List[FieldComparator]:
+    """
+    Comparators of the non-empty identifying fields with fitted weights, most discriminating first.
+    Label columns and fields that random pairs agree on at least as often as m are left out
+    """
+    rng = np.random.default_rng(seed)
+    left = rng.integers(0, len(df), U_SAMPLE_PAIRS)
+    right = rng.integers(0, len(df), U_SAMPLE_PAIRS)
+    left, right = left[left != right], right[left != right]
+    comparators = []
+    for col in columns:
+        if col in LABEL_COLUMNS:
+            continue
+        comparator = FieldComparator(col, df[col])
+        if comparator.missing.all():
+            continue
+        comparator.fit_weights(left, right)
+        if comparator.u >= M_PROBABILITY:
+            continue
+        if col == AGE_COLUMN:
+            # Близость возраста уже обеспечена блокировкой, учитываем только расхождение
+            comparator.agree_weight = 0.0
+        comparators.append(comparator)
+    return sorted(comparators, key=lambda c: -c.agree_weight)
+
+
+def link_threshold(max_weight: float) -> float:
+    """
+    Linkage threshold (bits) of a source pair whose shared fields give at most max_weight bits
+    """
+    return max(LINK_SHARE * max_weight, MIN_LINK_WEIGHT)
+
+
+def score_pairs(comparators: List[FieldComparator], left: np.ndarray, right: np.ndarray,
+                threshold: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Linkage weights of record pairs, accumulated field by field (most discriminating first).
+    After each field the pairs that cannot reach the threshold even if all remaining fields
+    agree are dropped, so most candidate pairs are compared on a few fields only
+    Returns the pairs reaching the threshold and their weights
+    """
+    weights = np.zeros(len(left))
+    remaining = sum(c.agree_weight for c in comparators)
+    for comparator in comparators:
+        present, agree = comparator.compare(left, right)
+        weights += np.where(agree, comparator.agree_weight, np.where(present, comparator.disagree_weight, 0.0))
+        remaining -= comparator.agree_weight
+        alive = weights + remaining >= threshold
+        if not alive.all():
+            left, right, weights = left[alive], right[alive], weights[alive]
+    return left, right, weights
+
+
+def shared_comparators(comparators: List[FieldComparator], sources: np.ndarray,
+                       threshold: float = MIN_LINK_WEIGHT) -> Dict[Tuple[int, int], List[FieldComparator]]:
+    """
+    Comparators of the fields filled in both sources, per pair of different source codes (i < j).
+    Missing values are mostly missing columns of a source, so the other fields are never compared;
+    source pairs that cannot reach the threshold even if all shared fields agree are left out
+    """
+    n_sources = sources.max() + 1 if len(sources) else 0
+    filled = np.array([[np.any(~c.missing[sources == s]) for c in comparators] for s in range(n_sources)])
+    shared = {}
+    for i in range(n_sources):
+        for j in range(i + 1, n_sources):
+            pair_comparators = [c for c, both in zip(comparators, filled[i] & filled[j]) if both]
+            if sum(c.agree_weight for c in pair_comparators) >= threshold:
+                shared[(i, j)] = pair_comparators
+    return shared
+
+
+def blocking_keys(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Integer blocking keys and age bucket of the records that have all of them, indexed by position
+    """
+    keys = pd.DataFrame({key: pd.factorize(df[key])[0] for key in BLOCKING_KEYS})
+    bucket = np.floor(pd.to_numeric(df[AGE_COLUMN], errors="coerce").to_numpy(dtype=np.float64))
+    blocked = (keys.to_numpy() >= 0).all(axis=1) & ~np.isnan(bucket)
+    keys["bucket"] = np.where(blocked, bucket, -1).astype(np.int64)
+    return keys[blocked]
+
+
+def candidate_pairs(keys: pd.DataFrame, sources: np.ndarray, linkable: np.ndarray):
+    """
+    Yields chunks of candidate pairs (left, right) of linkable sources (a boolean source x source
+    matrix): records with equal keys in the same or the next age bucket, so no pair within
+    the age tolerance is missed
+    """
+    blocks = {key: group.index.to_numpy() for key, group in keys.groupby(list(keys.columns))}
+    left_chunks, right_chunks, size = [], [], 0
+    for key, members in blocks.items():
+        rows, cols = np.triu_indices(len(members), k=1)
+        pairs = [(members[rows], members[cols])]
+        neighbour = blocks.get(key[:-1] + (key[-1] + 1,))
+        if neighbour is not None:
+            pairs.append((np.repeat(members, len(neighbour)), np.tile(neighbour, len(members))))
+        for left, right in pairs:
+            selected = linkable[sources[left], sources[right]]
+            left_chunks.append(left[selected])
+            right_chunks.append(right[selected])
+            size += len(left_chunks[-1])
+        if size >= PAIR_CHUNK:
+            yield np.concatenate(left_chunks), np.concatenate(right_chunks)
+            left_chunks, right_chunks, size = [], [], 0
+    if left_chunks:
+        yield np.concatenate(left_chunks), np.concatenate(right_chunks)
+
+
+def _count_source_pairs(pair_counts: Counter, kind: str, left: np.ndarray, right: np.ndarray) -> None:
+    if len(left) == 0:
+        return
+    pairs, counts = np.unique(np.stack([np.minimum(left, right), np.maximum(left, right)]), axis=1,
+                              return_counts=True)
+    for (i, j), count in zip(pairs.T, counts):
+        pair_counts[(int(i), int(j), kind)] += int(count)
+
+
+def mutual_best(left: np.ndarray, right: np.ndarray, weights: np.ndarray, sources: np.ndarray) -> np.ndarray:
+    """
+    Mask of the links where each record is the other's unique best-scored record of its source:
+    one record of a source stands for one patient, so ties and weaker alternatives are dropped
+    """
+    directed = pd.DataFrame({
+        "record": np.concatenate([left, right]),
+        "other_source": np.concatenate([sources[right], sources[left]]),
+        "weight": np.concatenate([weights, weights]),
+    })
+    group_keys = [directed["record"], directed["other_source"]]
+    best = directed["weight"] == directed.groupby(group_keys)["weight"].transform("max")
+    keep = (best & (best.groupby(group_keys).transform("sum") == 1)).to_numpy()
+    return keep[:len(left)] & keep[len(left):]
+
+
+def link_records(df: pd.DataFrame, columns: Optional[List[str]] = None) -> Tuple[np.ndarray, dict]:
+    """
+    Clusters the records of the same patient: exact duplicates (equal row hashes) within and across
+    sources plus blocked cross-source pairs reaching the threshold of their source pair (link_threshold).
+    df needs a source column,
+    columns are the compared fields (all others by default)
+    Returns a cluster id per record and the linkage report
+    """
+    columns = columns or [col for col in df.columns if col not in (SOURCE_COLUMN, CLUSTER_COLUMN)]
+    df = df.reset_index(drop=True)
+    sources, source_names = pd.factorize(df[SOURCE_COLUMN])
+    n = len(df)
+    pair_counts = Counter()
+
+    # Точные дубликаты: хэш строки вместо drop_duplicates по object-колонкам
+    hashes = pd.util.hash_pandas_object(df[columns], index=False).to_numpy()
+    first = pd.Series(np.arange(n)).groupby(hashes).transform("min").to_numpy()
+    duplicates = np.flatnonzero(first != np.arange(n))
+    edges_left, edges_right = [first[duplicates]], [duplicates]
+    _count_source_pairs(pair_counts, "exact_duplicates", sources[first[duplicates]], sources[duplicates])
+
+    keys = blocking_keys(df)
+    comparators = fit_comparators(df, [col for col in columns if col not in BLOCKING_KEYS])
+    all_pairs = shared_comparators(comparators, sources, threshold=-np.inf)
+    max_weights = {pair: sum(c.agree_weight for c in pair_comparators) for pair, pair_comparators in all_pairs.items()}
+    shared = {pair: all_pairs[pair] for pair, weight in max_weights.items() if weight >= MIN_LINK_WEIGHT}
+    thresholds = {pair: link_threshold(max_weights[pair]) for pair in shared}
+    linkable = np.zeros((len(source_names), len(source_names)), dtype=bool)
+    for i, j in shared:
+        linkable[i, j] = linkable[j, i] = True
+    comparisons = 0
+    linked = []
+    if shared:
+        for left, right in candidate_pairs(keys, sources, linkable):
+            comparisons += len(left)
+            pair_codes = np.minimum(sources[left], sources[right]) * len(source_names) + np.maximum(sources[left], sources[right])
+            for code in np.unique(pair_codes):
+                selected = pair_codes == code
+                pair = divmod(int(code), len(source_names))
+                pair_left, pair_right, weights = score_pairs(shared[pair], left[selected], right[selected],
+                                                             thresholds[pair])
+                # Точные дубликаты уже связаны
+                fuzzy = hashes[pair_left] != hashes[pair_right]
+                linked.append((pair_left[fuzzy], pair_right[fuzzy], weights[fuzzy]))
+
+    if linked:
+        # Связей на порядки меньше, чем кандидатов, поэтому взаимный выбор делается по всем сразу
+        left, right, weights = (np.concatenate(parts) for parts in zip(*linked))
+        keep = mutual_best(left, right, weights, sources)
+        edges_left.append(left[keep])
+        edges_right.append(right[keep])
+        _count_source_pairs(pair_counts, "linked_pairs", sources[left[keep]], sources[right[keep]])
+
+    left, right = np.concatenate(edges_left), np.concatenate(edges_right)
+    graph = coo_matrix((np.ones(len(left), dtype=np.int8), (left, right)), shape=(n, n))
+    n_clusters, cluster_ids = connected_components(graph, directed=False)
+
+    source_pairs = {}
+    for (i, j, kind), count in sorted(pair_counts.items()):
+        entry = source_pairs.setdefault(f"{source_names[i]} + {source_names[j]}",
+                                        {"exact_duplicates": 0, "linked_pairs": 0})
+        entry[kind] = count
+    report = {
+        "records": n,
+        "clusters": int(n_clusters),
+        "removed": int(n - n_clusters),
+        "unblocked": int(n - len(keys)),
+        # Пары источников, у которых хватает общих полей, чтобы набрать MIN_LINK_WEIGHT, и их пороги
+        "linkable_sources": [f"{source_names[i]} + {source_names[j]}" for i, j in shared],
+        "link_thresholds": {f"{source_names[i]} + {source_names[j]}": round(threshold, 2)
+                            for (i, j), threshold in thresholds.items()},
+        # Наибольший вес пары источников, если совпадут все общие поля; ниже MIN_LINK_WEIGHT - пары не сравниваются
+        "max_pair_weights": {f"{source_names[i]} + {source_names[j]}": round(weight, 2)
+                             for (i, j), weight in max_weights.items()},
+        "comparisons": comparisons,
+        "naive_comparisons": n * (n - 1) // 2,
+        "field_weights": {c.name: [round(c.agree_weight, 2), round(c.disagree_weight, 2)] for c in comparators},
+        "source_pairs": source_pairs,
+    }
+    return cluster_ids, report
+
+
+def merge_clusters(df: pd.DataFrame, cluster_ids: np.ndarray) -> pd.DataFrame:
+    """
+    One row per cluster in cluster id order: the most complete record of the cluster,
+    with its missing fields taken from the other records
+    """
+    completeness = df.notna().sum(axis=1).to_numpy()
+    order = np.lexsort((np.arange(len(df)), -completeness, cluster_ids))
+    merged = df.iloc[order].groupby(cluster_ids[order], sort=True).first()
+    return merged.reset_index(drop=True)[list(df.columns)]
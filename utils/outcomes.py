@@ -0,0 +1,76 @@
+"""
+Multi-outcome models: one binary classifier per transplant outcome, all trained on the same
+encoded features and packed into one forest (utils/packed_trees.py), so a request is encoded
+once and every outcome is scored in a single vectorized pass
+"""
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.calibration import apply_calibration
+from utils.cohort import Filter, cohort_columns, read_cohort
+from utils.training import NON_FEATURE_COLUMNS
+
+# Исходы гармонизированного датасета (1 - событие произошло)
+OUTCOMES = (
+    "engraftment_success",
+    "overall_survival_1y",
+    "acute_gvhd_grade",
+    "chronic_gvhd",
+    "relapse",
+    "trm",
+)
+
+# Вид запуска в реестре и файлы артефактов
+OUTCOMES_KIND = "multi_outcome"
+OUTCOME_MODELS_FILE = "outcomes.npz"
+OUTCOME_CALIBRATION_FILE = "outcome_calibration.json"
+
+# Исход без достаточного числа размеченных строк каждого класса не обучается
+MIN_CLASS_ROWS = 20
+
+
+def load_outcome_data(path: str = "processed/transplant_data.csv", outcomes: Tuple[str, ...] = OUTCOMES,
+                      filters: Optional[Sequence[Filter]] = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Loads the harmonized dataset (CSV or cohort store, rows of the cohort filters only) as shared features
+    (no outcome or leakage columns, so one encoding serves every model) and the outcome labels,
+    NaN where a source does not report the outcome
+    """
+    columns = [col for col in cohort_columns(path)
+               if col not in NON_FEATURE_COLUMNS and (col not in OUTCOMES or col in outcomes)]
+    df = read_cohort(path, columns, filters)
+    labels = df.reindex(columns=list(outcomes))
+    X = df.drop(columns=[col for col in list(OUTCOMES) + NON_FEATURE_COLUMNS if col in df.columns])
+    return X, labels
+
+
+def save_outcome_calibration(outcomes: List[str], tables: Dict[str, Optional[dict]], path: str) -> None:
+    """
+    Writes the outcome order of the packed forest and the calibration table of every outcome
+    (None for uncalibrated ones)
+    """
+    with open(path, "w") as f:
+        json.dump({"outcomes": outcomes, "calibration": tables}, f)
+
+
+def load_outcome_calibration(path: str) -> Tuple[List[str], Dict[str, Optional[dict]]]:
+    with open(path) as f:
+        data = json.load(f)
+    tables = {}
+    for outcome, table in data["calibration"].items():
+        tables[outcome] = None if table is None else {**table, "x": np.asarray(table["x"]), "y": np.asarray(table["y"])}
+    return data["outcomes"], tables
+
+
+def calibrate_outcomes(probabilities: np.ndarray, outcomes: List[str], tables: Dict[str, Optional[dict]]) -> np.ndarray:
+    """
+    Maps every column of (n_rows, n_outcomes) raw probabilities through its outcome's table
+    """
+    calibrated = np.asarray(probabilities, dtype=np.float64).copy()
+    for j, outcome in enumerate(outcomes):
+        if tables.get(outcome) is not None:
+            calibrated[:, j] = apply_calibration(calibrated[:, j], tables[outcome])
+    return calibrated
@@ -0,0 +1,180 @@
+"""
+Trees of one or more XGBoost boosters packed into flat numpy arrays.
+All trees of all members are evaluated together: one gather/compare step per tree level
+for the whole (rows x trees) matrix, then a single matrix product sums leaf values per member
+"""
+import json
+from typing import List, Sequence
+
+import numpy as np
+import xgboost as xgb
+
+# Строк за один проход: матрица узлов (rows x trees) остается в кэше процессора
+ROW_BLOCK = 64
+
+
+def _logit(p: float) -> float:
+    return float(np.log(p / (1 - p)))
+
+
+class PackedForest:
+    """
+    Flat node arrays of stacked boosters. Leaves point to themselves,
+    so every row can take exactly max_depth steps without a leaf check
+    """
+
+    def __init__(self, left, right, feature, threshold, default_left, value, roots, membership,
+                 base_margins, max_depth, feature_names):
+        self.left = left
+        self.right = right
+        # Потомки узла i лежат в children[2i] (левый) и children[2i + 1] (правый)
+        self.children = np.empty(2 * len(left), dtype=np.int32)
+        self.children[0::2] = left
+        self.children[1::2] = right
+        self.feature = feature
+        self.threshold = threshold
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.membership = membership
+        self.base_margins = base_margins
+        self.max_depth = int(max_depth)
+        self.feature_names = list(feature_names)
+
+    @property
+    def n_members(self) -> int:
+        return self.membership.shape[1]
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @classmethod
+    def from_boosters(cls, boosters: Sequence[xgb.Booster]) -> "PackedForest":
+        left, right, feature, threshold, default_left, value = [], [], [], [], [], []
+        roots, tree_member, base_margins = [], [], []
+        feature_names = None
+        offset = 0
+        max_depth = 0
+
+        for member, booster in enumerate(boosters):
+            learner = json.loads(booster.save_raw(raw_format="json"))["learner"]
+            if learner["objective"]["name"] != "binary:logistic":
+                raise ValueError(f"Unsupported objective: {learner['objective']['name']}")
+            names = learner.get("feature_names") or booster.feature_names
+            if feature_names is None:
+                feature_names = names
+            elif names != feature_names:
+                raise ValueError("All members must share the feature layout")
+            base_margins.append(_logit(float(learner["learner_model_param"]["base_score"])))
+
+            for tree in learner["gradient_booster"]["model"]["trees"]:
+                if any(tree["split_type"]):
+                    raise ValueError("Categorical splits are not supported, train members with one-hot encoding")
+                tree_left = np.asarray(tree["left_children"], dtype=np.int32)
+                tree_right = np.asarray(tree["right_children"], dtype=np.int32)
+                is_leaf = tree_left == -1
+                node_ids = np.arange(len(tree_left), dtype=np.int32)
+
+                left.append(np.where(is_leaf, node_ids, tree_left) + offset)
+                right.append(np.where(is_leaf, node_ids, tree_right) + offset)
+                feature.append(np.where(is_leaf, 0, tree["split_indices"]).astype(np.int32))
+                conditions = np.asarray(tree["split_conditions"], dtype=np.float32)
+                # У листьев split_conditions хранит значение листа
+                threshold.append(np.where(is_leaf, np.float32(0), conditions))
+                value.append(np.where(is_leaf, conditions, np.float32(0)))
+                default_left.append(np.asarray(tree["default_left"], dtype=bool))
+
+                roots.append(offset)
+                tree_member.append(member)
+                max_depth = max(max_depth, _tree_depth(tree_left, tree_right))
+                offset += len(tree_left)
+
+        membership = np.zeros((len(roots), len(boosters)), dtype=np.float32)
+        membership[np.arange(len(roots)), tree_member] = 1
+        return cls(
+            np.concatenate(left), np.concatenate(right), np.concatenate(feature),
+            np.concatenate(threshold), np.concatenate(default_left), np.concatenate(value),
+            np.asarray(roots, dtype=np.int32), membership, np.asarray(base_margins, dtype=np.float32),
+            max_depth, feature_names or []
+        )
+
+    def margins(self, X) -> np.ndarray:
+        """
+        Raw margins (log-odds) of every member, shape (n_rows, n_members)
+        """
+        X = np.ascontiguousarray(np.asarray(X, dtype=np.float32))
+        n_features = X.shape[1]
+        has_missing = bool(np.isnan(X).any())
+        result = np.empty((len(X), self.n_members), dtype=np.float32)
+        for start in range(0, len(X), ROW_BLOCK):
+            block = X[start:start + ROW_BLOCK]
+            flat = block.ravel()
+            row_offsets = (np.arange(len(block), dtype=np.int32) * n_features)[:, None]
+            nodes = np.broadcast_to(self.roots, (len(block), self.n_trees))
+            for _ in range(self.max_depth):
+                values = np.take(flat, row_offsets + np.take(self.feature, nodes))
+                go_right = ~(values < np.take(self.threshold, nodes))
+                if has_missing:
+                    # Пропуск идет по ветке default_left, как в XGBoost
+                    go_right &= ~(np.isnan(values) & np.take(self.default_left, nodes))
+                nodes = np.take(self.children, 2 * nodes + go_right)
+            result[start:start + len(block)] = np.take(self.value, nodes) @ self.membership + self.base_margins
+        return result
+
+    def predict_proba(self, X) -> np.ndarray:
+        """
+        Positive-class probability of every member, shape (n_rows, n_members)
+        """
+        return 1 / (1 + np.exp(-self.margins(X)))
+
+    def compact(self, leaf_dtype=np.float32) -> "PackedForest":
+        """
+        Copy with the node links and split features in the narrowest unsigned types and leaf values
+        in leaf_dtype (float16 halves them at about 1e-4 of probability); thresholds stay float32,
+        a float16 threshold would move splits on standardized features
+        """
+        return PackedForest(
+            _narrow(self.left), _narrow(self.right), _narrow(self.feature), self.threshold.astype(np.float32),
+            self.default_left, self.value.astype(leaf_dtype), self.roots, self.membership, self.base_margins,
+            self.max_depth, self.feature_names
+        )
+
+    def save(self, path: str) -> None:
+        np.savez(
+            path, left=self.left, right=self.right, feature=self.feature, threshold=self.threshold,
+            default_left=self.default_left, value=self.value, roots=self.roots, membership=self.membership,
+            base_margins=self.base_margins, max_depth=self.max_depth,
+            feature_names=np.asarray(json.dumps(self.feature_names))
+        )
+
+    @classmethod
+    def load(cls, path: str) -> "PackedForest":
+        with np.load(path) as data:
+            arrays = {name: data[name] for name in data.files}
+        arrays["feature_names"] = json.loads(str(arrays["feature_names"]))
+        arrays["max_depth"] = int(arrays["max_depth"])
+        return cls(**arrays)
+
+
+def _narrow(values: np.ndarray) -> np.ndarray:
+    for dtype in (np.uint8, np.uint16, np.uint32):
+        if values.max(initial=0) <= np.iinfo(dtype).max:
+            return values.astype(dtype)
+    return values
+
+
+def _tree_depth(left: np.ndarray, right: np.ndarray) -> int:
+    depth = np.zeros(len(left), dtype=np.int32)
+    # Дочерние узлы в XGBoost всегда имеют больший номер, чем родитель
+    for node in range(len(left)):
+        if left[node] != -1:
+            depth[left[node]] = depth[right[node]] = depth[node] + 1
+    return int(depth.max())
+
+
+def stack_boosters(models: List) -> PackedForest:
+    """
+    Packs XGBClassifier or Booster members into one forest
+    """
+    return PackedForest.from_boosters([getattr(model, "get_booster", lambda: model)() for model in models])
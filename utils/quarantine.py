@@ -0,0 +1,69 @@
+import os
+from typing import Dict, Optional, Tuple
+
+import pandas as pd
+
+from utils.validate_dataframe import rejection_reasons
+
+QUARANTINE_DIR = "processed/quarantine"
+
+# Служебные колонки файла карантина
+REASON_COLUMN = "_quarantine_reason"
+ROW_COLUMN = "_source_row"
+
+
+def quarantine_path(source_name: str, quarantine_dir: str = QUARANTINE_DIR) -> str:
+    return os.path.join(quarantine_dir, f"{source_name.lower().replace(' ', '_')}.csv")
+
+
+def split_rows(raw_df: pd.DataFrame, processed_df: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    """
+    Splits a processed source into accepted rows and raw rows that failed validation.
+    Rejected rows are kept in their raw layout (with the reason), so they can be
+    reprocessed once the mapping tables are fixed
+    """
+    reasons = rejection_reasons(processed_df)
+    rejected = reasons != ''
+
+    accepted_df = processed_df.loc[~rejected]
+    rejected_df = raw_df.loc[reasons.index[rejected]].copy()
+    rejected_df[REASON_COLUMN] = reasons[rejected]
+    if ROW_COLUMN not in rejected_df.columns:
+        rejected_df[ROW_COLUMN] = rejected_df.index
+    return accepted_df, rejected_df
+
+
+def write_quarantine(source_name: str, rejected_df: pd.DataFrame, quarantine_dir: str = QUARANTINE_DIR) -> Optional[str]:
+    """
+    Writes rejected rows of a source to its side file, removing the file when nothing is rejected
+    """
+    path = quarantine_path(source_name, quarantine_dir)
+    if rejected_df.empty:
+        if os.path.exists(path):
+            os.remove(path)
+        return None
+    os.makedirs(quarantine_dir, exist_ok=True)
+    rejected_df.to_csv(path, index=False)
+    return path
+
+
+def read_quarantine(source_name: str, quarantine_dir: str = QUARANTINE_DIR) -> Optional[pd.DataFrame]:
+    """
+    Reads quarantined raw rows of a source (without the reason column), or None if there are none
+    """
+    path = quarantine_path(source_name, quarantine_dir)
+    if not os.path.exists(path):
+        return None
+    df = pd.read_csv(path)
+    df = df.drop(columns=[REASON_COLUMN])
+    # Индекс - номер строки в исходном файле, чтобы повторный карантин его сохранил
+    return df.set_index(df[ROW_COLUMN].rename(None))
+
+
+def summarize(rejected_df: pd.DataFrame) -> Dict[str, int]:
+    """
+    Counts rejected rows per reason
+    """
+    if rejected_df.empty:
+        return {}
+    return rejected_df[REASON_COLUMN].value_counts().to_dict()
@@ -0,0 +1,209 @@
+"""
+Training-run registry: every run is stored in models/runs/<run_id>/, where run_id is derived
+from the content of the run (model, preprocessing objects, params and data fingerprint).
+models/runs/index.json keeps a summary of every run and the promoted run of each kind.
+
+Usage:
+    python -m utils.registry list [--kind engraftment_success]
+    python -m utils.registry show <run_id>
+    python -m utils.registry promote <run_id>
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import joblib
+
+RUNS_DIR = "models/runs"
+INDEX_FILE = "index.json"
+INDEX_LOCK_FILE = ".index.lock"
+RUN_FILE = "run.json"
+MODEL_FILE = "xgboost_model.json"
+PREPROCESSING_FILE = "preprocessing_objects.joblib"
+
+
+def fingerprint_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    Returns the sha256 of a file, read in chunks
+    """
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _read_index(runs_dir: str) -> dict:
+    path = os.path.join(runs_dir, INDEX_FILE)
+    if not os.path.exists(path):
+        return {"runs": {}, "promoted": {}}
+    with open(path) as f:
+        return json.load(f)
+
+
+@contextmanager
+def _index_lock(runs_dir: str):
+    # Чтение, изменение и запись индекса под одной блокировкой: параллельные запуски не теряют записи друг друга
+    os.makedirs(runs_dir, exist_ok=True)
+    with open(os.path.join(runs_dir, INDEX_LOCK_FILE), "w") as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        yield
+
+
+def _write_index(runs_dir: str, index: dict) -> None:
+    # Пишем во временный файл и атомарно подменяем индекс
+    os.makedirs(runs_dir, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=runs_dir, suffix=".tmp")
+    with os.fdopen(fd, "w") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(runs_dir, INDEX_FILE))
+
+
+def register_run(model, preprocessing_objects: dict, params: dict, metrics: dict, data_path: str,
+                 timings: Dict[str, float], kind: str = "engraftment_success",
+                 artifacts: Optional[Dict[str, str]] = None, runs_dir: str = RUNS_DIR) -> str:
+    """
+    Saves a training run into a content-addressed directory and adds it to the index.
+    model is an XGBClassifier or Booster (None for runs whose model is stored only in artifacts);
+    artifacts maps extra file names to files to copy into the run
+    Returns the run id
+    """
+    os.makedirs(runs_dir, exist_ok=True)
+    staging_dir = tempfile.mkdtemp(dir=runs_dir, prefix=".staging_")
+    try:
+        if model is not None:
+            model.save_model(os.path.join(staging_dir, MODEL_FILE))
+        joblib.dump(preprocessing_objects, os.path.join(staging_dir, PREPROCESSING_FILE))
+        for name, source_path in (artifacts or {}).items():
+            shutil.copyfile(source_path, os.path.join(staging_dir, name))
+
+        data = {"path": data_path, "sha256": fingerprint_file(data_path)}
+
+        # Идентификатор запуска - хэш содержимого артефактов, параметров и версии данных
+        digest = hashlib.sha256()
+        for name in sorted(os.listdir(staging_dir)):
+            digest.update(name.encode())
+            digest.update(fingerprint_file(os.path.join(staging_dir, name)).encode())
+        digest.update(json.dumps(params, sort_keys=True, default=str).encode())
+        digest.update(data["sha256"].encode())
+        run_id = digest.hexdigest()[:12]
+
+        run = {
+            "run_id": run_id,
+            "kind": kind,
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "data": data,
+            "params": params,
+            "metrics": metrics,
+            "timings": timings,
+            "n_features": len(preprocessing_objects["feature_names"]),
+            "artifacts": sorted(os.listdir(staging_dir)),
+        }
+        with open(os.path.join(staging_dir, RUN_FILE), "w") as f:
+            json.dump(run, f, indent=2, ensure_ascii=False, default=str)
+
+        run_dir = os.path.join(runs_dir, run_id)
+        with _index_lock(runs_dir):
+            if os.path.exists(run_dir):
+                # Тот же контент уже зарегистрирован: в индексе остается исходная запись запуска
+                print(f"Run {run_id} already registered")
+                run = get_run(run_id, runs_dir)
+            else:
+                os.replace(staging_dir, run_dir)
+
+            index = _read_index(runs_dir)
+            index["runs"][run_id] = {
+                "kind": run["kind"],
+                "created_at": run["created_at"],
+                "data_sha256": run["data"]["sha256"],
+                "metrics": {name: value for name, value in run["metrics"].items()
+                            if not isinstance(value, (list, dict))},
+                "timings": run["timings"],
+            }
+            _write_index(runs_dir, index)
+    finally:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+    return run_id
+
+
+def list_runs(kind: Optional[str] = None, runs_dir: str = RUNS_DIR) -> List[dict]:
+    """
+    Returns run summaries from the index, newest first
+    """
+    index = _read_index(runs_dir)
+    runs = [
+        {"run_id": run_id, "promoted": index["promoted"].get(summary["kind"]) == run_id, **summary}
+        for run_id, summary in index["runs"].items()
+        if kind is None or summary["kind"] == kind
+    ]
+    return sorted(runs, key=lambda run: run["created_at"], reverse=True)
+
+
+def get_run(run_id: str, runs_dir: str = RUNS_DIR) -> dict:
+    """
+    Returns the full run record from run.json
+    """
+    path = os.path.join(runs_dir, run_id, RUN_FILE)
+    if not os.path.exists(path):
+        raise ValueError(f"Unknown run: {run_id}")
+    with open(path) as f:
+        return json.load(f)
+
+
+def promote_run(run_id: str, runs_dir: str = RUNS_DIR) -> None:
+    """
+    Marks the run as the one served for its kind; promoting an older run is a rollback
+    """
+    run = get_run(run_id, runs_dir)
+    with _index_lock(runs_dir):
+        index = _read_index(runs_dir)
+        index["promoted"][run["kind"]] = run_id
+        _write_index(runs_dir, index)
+
+
+def get_promoted_run_dir(kind: str = "engraftment_success", runs_dir: str = RUNS_DIR) -> Optional[str]:
+    """
+    Returns the directory of the promoted run of the given kind, or None if nothing is promoted
+    """
+    run_id = _read_index(runs_dir)["promoted"].get(kind)
+    if run_id is None:
+        return None
+    return os.path.join(runs_dir, run_id)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Training-run registry")
+    parser.add_argument("--runs-dir", default=RUNS_DIR)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    list_parser = subparsers.add_parser("list", help="List registered runs")
+    list_parser.add_argument("--kind")
+    show_parser = subparsers.add_parser("show", help="Show a run record")
+    show_parser.add_argument("run_id")
+    promote_parser = subparsers.add_parser("promote", help="Promote a run to be served by the API")
+    promote_parser.add_argument("run_id")
+    args = parser.parse_args()
+
+    if args.command == "list":
+        for run in list_runs(args.kind, args.runs_dir):
+            marker = "*" if run["promoted"] else " "
+            metrics = ", ".join(f"{name}={value:.4f}" for name, value in run["metrics"].items()
+                                if isinstance(value, (int, float)))
+            total_time = sum(run["timings"].values())
+            print(f"{marker} {run['run_id']}  {run['created_at']}  {run['kind']:<22} "
+                  f"data={run['data_sha256'][:8]}  time={total_time:.1f}s  {metrics}")
+    elif args.command == "show":
+        print(json.dumps(get_run(args.run_id, args.runs_dir), indent=2, ensure_ascii=False))
+    elif args.command == "promote":
+        promote_run(args.run_id, args.runs_dir)
+        print(f"Promoted run {args.run_id}")
+
+
+if __name__ == "__main__":
+    main()
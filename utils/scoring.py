@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+
+# Пороги уровней риска по вероятности успешной трансплантации
+LOW_RISK_THRESHOLD = 0.85
+MODERATE_RISK_THRESHOLD = 0.70
+
+RISK_LEVELS = ("Низкий риск", "Умеренный риск", "Высокий риск")
+RECOMMENDATIONS = (
+    "Высокая вероятность успешной трансплантации. Можно планировать процедуру.",
+    "Умеренная вероятность успеха. Рекомендуется дополнительное обследование.",
+    "Высокий риск отторжения. Рекомендуется поиск альтернативного донора.",
+)
+
+# Поля входных данных API (TransplantData) и обязательные колонки пакетного скоринга
+INPUT_FIELDS = (
+    "hla_match_score",
+    "donor_age",
+    "patient_age",
+    "donor_sex",
+    "patient_sex",
+    "diagnosis",
+    "conditioning_regimen",
+    "source_of_cells",
+    "days_from_diagnosis_to_hct",
+    "cd34_dose",
+)
+
+# Значения клинических полей, которые API не принимает во входных данных
+DEFAULT_FIELDS = {
+    "disease_status": "active",
+    "donor_relation": "sibling",
+    "gvhd_prophylaxis": "standard",
+    "patient_ethnicity": "white",
+    "acute_gvhd_grade": 0,
+    "chronic_gvhd": 0,
+    "overall_survival_1y": 1,
+    "relapse": 0,
+    "trm": 0
+}
+
+
+def get_risk_level(probability: float) -> str:
+    if probability >= LOW_RISK_THRESHOLD:
+        return RISK_LEVELS[0]
+    elif probability >= MODERATE_RISK_THRESHOLD:
+        return RISK_LEVELS[1]
+    else:
+        return RISK_LEVELS[2]
+
+
+def get_recommendation(probability: float) -> str:
+    if probability >= LOW_RISK_THRESHOLD:
+        return RECOMMENDATIONS[0]
+    elif probability >= MODERATE_RISK_THRESHOLD:
+        return RECOMMENDATIONS[1]
+    else:
+        return RECOMMENDATIONS[2]
+
+
+def risk_levels(probabilities: np.ndarray) -> np.ndarray:
+    """
+    Vectorized get_risk_level for a batch of probabilities
+    """
+    probabilities = np.asarray(probabilities)
+    return np.select(
+        [probabilities >= LOW_RISK_THRESHOLD, probabilities >= MODERATE_RISK_THRESHOLD],
+        RISK_LEVELS[:2],
+        default=RISK_LEVELS[2]
+    )
+
+
+def recommendations(probabilities: np.ndarray) -> np.ndarray:
+    """
+    Vectorized get_recommendation for a batch of probabilities
+    """
+    probabilities = np.asarray(probabilities)
+    return np.select(
+        [probabilities >= LOW_RISK_THRESHOLD, probabilities >= MODERATE_RISK_THRESHOLD],
+        RECOMMENDATIONS[:2],
+        default=RECOMMENDATIONS[2]
+    )
+
+
+def fill_default_fields(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Adds DEFAULT_FIELDS columns missing from a batch, so rows with the API's
+    input fields are scored exactly like /predict requests
+    """
+    missing = {col: value for col, value in DEFAULT_FIELDS.items() if col not in df.columns}
+    return df.assign(**missing) if missing else df
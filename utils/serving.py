@@ -0,0 +1,194 @@
+import json
+import os
+from functools import cached_property
+from typing import Optional, Tuple
+
+import joblib
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+from xgboost import XGBClassifier
+
+from utils.calibration import PROBABILITY_CALIBRATION_FILE, apply_calibration, load_calibration
+from utils.compaction import PACKED_MODEL_FILE
+from utils.drift import DRIFT_SKETCHES_FILE, load_drift_sketches
+from utils.encoding import encode_features
+from utils.explain import contribution_groups, fold_contributions
+from utils.outcomes import (
+    OUTCOME_CALIBRATION_FILE,
+    OUTCOME_MODELS_FILE,
+    OUTCOMES_KIND,
+    calibrate_outcomes,
+    load_outcome_calibration,
+)
+from utils.packed_trees import PackedForest
+from utils.uncertainty import CALIBRATION_FILE, ENSEMBLE_FILE, ENSEMBLE_KIND, member_intervals
+from utils.registry import MODEL_FILE, PREPROCESSING_FILE, RUNS_DIR, get_promoted_run_dir
+from utils.scoring import DEFAULT_FIELDS
+
+# До скольких строк батч оценивается упакованным лесом: дальше быстрее собственный предиктор XGBoost
+PACKED_MAX_ROWS = 512
+
+
+class ModelBundle:
+    """
+    Model and preprocessing objects served together
+    """
+
+    def __init__(self, model_dir: str, run_id: Optional[str] = None):
+        self.model_dir = model_dir
+        self.run_id = run_id
+        self.model = XGBClassifier()
+        self.model.load_model(os.path.join(model_dir, MODEL_FILE))
+        self.preprocessing_objects = joblib.load(os.path.join(model_dir, PREPROCESSING_FILE))
+        # Модель, обученная на pandas category, требует enable_categorical при предсказании
+        self.model.set_params(enable_categorical=self.preprocessing_objects.get('encoding') == 'native')
+        # Таблица калибровки вероятностей (у старых запусков ее нет)
+        calibration_path = os.path.join(model_dir, PROBABILITY_CALIBRATION_FILE)
+        self.calibration = load_calibration(calibration_path) if os.path.exists(calibration_path) else None
+        # Скетчи распределений обучающих признаков для мониторинга дрейфа
+        sketches_path = os.path.join(model_dir, DRIFT_SKETCHES_FILE)
+        self.drift_sketches = load_drift_sketches(sketches_path) if os.path.exists(sketches_path) else None
+        # Упакованный лес сжатого запуска (compact_model.py)
+        packed_path = os.path.join(model_dir, PACKED_MODEL_FILE)
+        self.forest = PackedForest.load(packed_path) if os.path.exists(packed_path) else None
+
+    @property
+    def version(self) -> str:
+        return self.run_id or 'legacy'
+
+    def encode(self, df: pd.DataFrame, timings: Optional[dict] = None) -> pd.DataFrame:
+        return encode_features(df, self.preprocessing_objects, timings)
+
+    def predict_proba(self, X: pd.DataFrame, calibrated: bool = True) -> np.ndarray:
+        """
+        Returns the probability of the positive class for encoded rows,
+        mapped through the calibration table of the run if it has one;
+        request-sized batches of a compacted run are scored by its packed forest
+        """
+        if self.forest is not None and len(X) <= PACKED_MAX_ROWS:
+            probabilities = self.forest.predict_proba(X)[:, 0]
+        else:
+            probabilities = self.model.predict_proba(X)[:, 1]
+        return self.calibrate(probabilities) if calibrated else probabilities
+
+    def calibrate(self, probabilities: np.ndarray) -> np.ndarray:
+        if self.calibration is None:
+            return probabilities
+        return apply_calibration(probabilities, self.calibration)
+
+    @cached_property
+    def contribution_groups(self):
+        # Колонки DEFAULT_FIELDS не принимаются во входных данных и объясняются одной группой
+        return contribution_groups(self.preprocessing_objects, defaults=DEFAULT_FIELDS)
+
+    def explain(self, X: pd.DataFrame) -> Tuple[pd.DataFrame, np.ndarray]:
+        """
+        TreeSHAP contributions (log-odds) of encoded rows, folded to the original columns,
+        and the bias term; computed for the whole batch in one call
+        """
+        dmatrix = xgb.DMatrix(X, enable_categorical=self.preprocessing_objects.get('encoding') == 'native')
+        contributions = self.model.get_booster().predict(dmatrix, pred_contribs=True)
+        columns, matrix = self.contribution_groups
+        folded, bias = fold_contributions(contributions, columns, matrix)
+        folded.index = X.index
+        return folded, bias
+
+
+def load_bundle(kind: str = 'engraftment_success', models_dir: str = 'models', runs_dir: str = RUNS_DIR) -> ModelBundle:
+    """
+    Loads the promoted run of the given kind from the registry,
+    falling back to the model files saved directly in models_dir
+    """
+    run_dir = get_promoted_run_dir(kind, runs_dir)
+    if run_dir is not None:
+        return ModelBundle(run_dir, run_id=os.path.basename(run_dir))
+    return ModelBundle(models_dir)
+
+
+class EnsembleBundle:
+    """
+    Bootstrap ensemble packed into one forest, with its preprocessing objects, the probability
+    calibration of its members (if trained with one) and the interval calibration
+    """
+
+    def __init__(self, model_dir: str, run_id: Optional[str] = None):
+        self.model_dir = model_dir
+        self.run_id = run_id
+        self.forest = PackedForest.load(os.path.join(model_dir, ENSEMBLE_FILE))
+        self.preprocessing_objects = joblib.load(os.path.join(model_dir, PREPROCESSING_FILE))
+        with open(os.path.join(model_dir, CALIBRATION_FILE)) as f:
+            self.calibration = json.load(f)
+        member_calibration_path = os.path.join(model_dir, PROBABILITY_CALIBRATION_FILE)
+        self.member_calibration = (load_calibration(member_calibration_path)
+                                   if os.path.exists(member_calibration_path) else None)
+
+    @property
+    def version(self) -> str:
+        return self.run_id or 'legacy'
+
+    @property
+    def level(self) -> float:
+        return self.calibration['level']
+
+    def encode(self, df: pd.DataFrame) -> pd.DataFrame:
+        return encode_features(df, self.preprocessing_objects)
+
+    def intervals(self, X: pd.DataFrame,
+                  center: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Center and calibrated interval bounds of encoded rows; all members are scored in one pass.
+        Member probabilities go through the ensemble's own calibration table first, as in training,
+        and the interval is placed around `center` (the ensemble median if not given)
+        """
+        member_probs = self.forest.predict_proba(X)
+        if self.member_calibration is not None:
+            member_probs = apply_calibration(member_probs, self.member_calibration)
+        return member_intervals(member_probs, self.calibration['level'], self.calibration['scale'], center)
+
+
+def load_ensemble(kind: str = ENSEMBLE_KIND, runs_dir: str = RUNS_DIR) -> Optional[EnsembleBundle]:
+    """
+    Loads the promoted bootstrap ensemble, or None if none is promoted
+    """
+    run_dir = get_promoted_run_dir(kind, runs_dir)
+    if run_dir is None:
+        return None
+    return EnsembleBundle(run_dir, run_id=os.path.basename(run_dir))
+
+
+class OutcomeBundle:
+    """
+    Per-outcome models packed into one forest over shared features, with their calibration tables
+    """
+
+    def __init__(self, model_dir: str, run_id: Optional[str] = None):
+        self.model_dir = model_dir
+        self.run_id = run_id
+        self.forest = PackedForest.load(os.path.join(model_dir, OUTCOME_MODELS_FILE))
+        self.preprocessing_objects = joblib.load(os.path.join(model_dir, PREPROCESSING_FILE))
+        self.outcomes, self.calibration = load_outcome_calibration(os.path.join(model_dir, OUTCOME_CALIBRATION_FILE))
+
+    @property
+    def version(self) -> str:
+        return self.run_id or 'legacy'
+
+    def encode(self, df: pd.DataFrame, timings: Optional[dict] = None) -> pd.DataFrame:
+        return encode_features(df, self.preprocessing_objects, timings)
+
+    def predict_proba(self, X: pd.DataFrame) -> np.ndarray:
+        """
+        Calibrated probabilities of every outcome (n_rows, n_outcomes in self.outcomes order),
+        all outcome models evaluated in one pass over the packed forest
+        """
+        return calibrate_outcomes(self.forest.predict_proba(X), self.outcomes, self.calibration)
+
+
+def load_outcomes(kind: str = OUTCOMES_KIND, runs_dir: str = RUNS_DIR) -> Optional[OutcomeBundle]:
+    """
+    Loads the promoted multi-outcome run, or None if none is promoted
+    """
+    run_dir = get_promoted_run_dir(kind, runs_dir)
+    if run_dir is None:
+        return None
+    return OutcomeBundle(run_dir, run_id=os.path.basename(run_dir))
@@ -0,0 +1,90 @@
+"""
+What-if sweeps: one base request scored over a grid of values of one or two of its fields.
+The base row and the values of every axis are encoded once; the grid is assembled from the
+encoded base row by overwriting only the feature columns of the swept fields, so an n x m
+sweep costs 1 + n + m encoded rows and a single model call
+"""
+from typing import Callable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+# Ограничения размера сетки: до 2 осей и не больше 10000 точек (например, 100x100)
+MAX_SWEEP_AXES = 2
+MAX_AXIS_VALUES = 500
+MAX_SWEEP_POINTS = 10_000
+DEFAULT_AXIS_STEPS = 20
+
+Value = Union[float, str]
+
+
+def axis_values(values: Optional[Sequence[Value]] = None, start: Optional[float] = None,
+                stop: Optional[float] = None, steps: int = DEFAULT_AXIS_STEPS) -> List[Value]:
+    """
+    Values of one sweep axis: the explicit list, or `steps` evenly spaced numbers from start to stop
+    """
+    if values is not None:
+        if start is not None or stop is not None:
+            raise ValueError("Give either values or start/stop for a sweep axis, not both")
+        values = list(values)
+    elif start is not None and stop is not None:
+        if steps < 2:
+            raise ValueError("A start/stop sweep axis needs at least 2 steps")
+        values = np.linspace(start, stop, steps).tolist()
+    else:
+        raise ValueError("A sweep axis needs values or start and stop")
+    if not values:
+        raise ValueError("A sweep axis needs at least one value")
+    if len(values) > MAX_AXIS_VALUES:
+        raise ValueError(f"A sweep axis takes at most {MAX_AXIS_VALUES} values, got {len(values)}")
+    return values
+
+
+def check_axes(fields: Sequence[str], sizes: Sequence[int], allowed: Sequence[str]) -> None:
+    if not 1 <= len(fields) <= MAX_SWEEP_AXES:
+        raise ValueError(f"A sweep takes 1 to {MAX_SWEEP_AXES} axes, got {len(fields)}")
+    unknown = [field for field in fields if field not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown sweep fields: {unknown}")
+    if len(set(fields)) != len(fields):
+        raise ValueError("Sweep axes must be different fields")
+    points = int(np.prod(sizes))
+    if points > MAX_SWEEP_POINTS:
+        raise ValueError(f"A sweep takes at most {MAX_SWEEP_POINTS} grid points, got {points}")
+
+
+def field_positions(field: str, columns: List[str], matrix: np.ndarray) -> np.ndarray:
+    """
+    Encoded feature positions of an input field (its numeric column or all its one-hot dummies),
+    from the contribution_groups mapping of the served model
+    """
+    if field not in columns:
+        raise ValueError(f"Field {field} is not a feature of the served model")
+    return np.flatnonzero(matrix[:, columns.index(field)])
+
+
+def sweep_grid(base: pd.DataFrame, base_encoded: pd.DataFrame, axes: List[Tuple[str, List[Value]]],
+               encode: Callable[[pd.DataFrame], pd.DataFrame], groups: Tuple[List[str], np.ndarray],
+               numeric: Sequence[str] = ()) -> pd.DataFrame:
+    """
+    Encoded grid of a one-row merged request and its encoded row: row i * len(values_2) + j has the i-th value of the
+    first axis and the j-th value of the second (C order, like np.meshgrid(..., indexing='ij').ravel());
+    `numeric` lists the fields that only take numbers
+    """
+    columns, matrix = groups
+    base = base.reset_index(drop=True)
+    sizes = [len(values) for _, values in axes]
+    # Индексы значений каждой оси для всех точек сетки
+    grid_index = np.indices(sizes).reshape(len(axes), -1)
+
+    # Закодированная строка базового запроса, размноженная на всю сетку
+    grid = base_encoded.iloc[np.zeros(grid_index.shape[1], dtype=np.intp)].reset_index(drop=True)
+    for (field, values), index in zip(axes, grid_index):
+        positions = field_positions(field, columns, matrix)
+        if field in numeric and any(isinstance(value, str) for value in values):
+            raise ValueError(f"Sweep values of the numeric field {field} must be numbers")
+        # Значения оси кодируются один раз, в сетку копируются только колонки этого поля
+        encoded = encode(base.iloc[np.zeros(len(values), dtype=np.intp)].assign(**{field: values}))
+        block = encoded.iloc[index, positions].reset_index(drop=True)
+        grid[block.columns] = block
+    return grid
@@ -0,0 +1,260 @@
+import copy
+import os
+import pandas as pd
+import numpy as np
+from sklearn.impute import SimpleImputer
+from sklearn.model_selection import train_test_split
+from sklearn.preprocessing import StandardScaler
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from utils.cohort import Filter, cohort_columns, read_cohort
+from utils.constants import CATEGORY_SETS
+from utils.linkage import SOURCE_COLUMN
+
+TARGET = "engraftment_success"
+
+# Потенциальные leakage-признаки
+LEAKAGE_COLUMNS = ["engraftment_days"]
+
+# Не признаки: утечки и метка реестра-источника (pipeline.py), которой нет в запросах API
+NON_FEATURE_COLUMNS = LEAKAGE_COLUMNS + [SOURCE_COLUMN]
+
+# onehot - pd.get_dummies(drop_first=True), native - pandas category + XGBoost enable_categorical
+ENCODINGS = ('onehot', 'native')
+
+# Артефакт запуска: хэши строк обучения, калибровки и теста. По нему дообучение и сжатие модели
+# оценивают ее только на строках, которых она не видела, даже после пересборки набора данных
+SPLIT_FILE = "split_rows.npz"
+SPLIT_PARTS = ('train', 'calibration', 'test')
+
+
+def load_training_data(path: str = "processed/transplant_data.csv", target: str = TARGET,
+                       filters: Optional[Sequence[Filter]] = None) -> Tuple[pd.DataFrame, pd.Series]:
+    """
+    Loads the harmonized dataset (CSV or cohort store) and splits it into features and target.
+    Rows with a missing target and rows outside the cohort filters (utils/cohort.py) are not read,
+    non-feature columns are not read either; the index is the row number of the dataset,
+    so the source column can be aligned with the rows (see utils/evaluation.py)
+    """
+    columns = [col for col in cohort_columns(path) if col not in NON_FEATURE_COLUMNS]
+    df = read_cohort(path, columns, [*(filters or []), (target, "not null", None)])
+    if df.empty:
+        raise ValueError(f"No rows with a known {target} in the cohort")
+
+    X = df.drop(columns=[target])
+    y = df[target]
+    return X, y
+
+
+def unknown_categories(X: pd.DataFrame, categories: Dict[str, List[str]]) -> Dict[str, Dict[str, int]]:
+    """
+    Counts of the values of every categorical column that are not in its category set
+    """
+    unknown = {}
+    for col, allowed in categories.items():
+        values = X[col].dropna()
+        counts = values[~values.isin(allowed)].astype(str).value_counts()
+        if len(counts):
+            unknown[col] = {value: int(count) for value, count in counts.items()}
+    return unknown
+
+
+def fit_preprocessing(X: pd.DataFrame, encoding: str = 'onehot') -> Tuple[pd.DataFrame, dict]:
+    """
+    Imputes, encodes and scales the features.
+    With encoding='native' categorical columns become pandas categories with the fixed sets
+    from utils/constants.py; missing and unknown values are left to XGBoost
+    Returns the encoded matrix and the preprocessing objects used by api.py
+    """
+    if encoding not in ENCODINGS:
+        raise ValueError(f"Unknown encoding: {encoding}")
+    X = X.copy()
+
+    # Разделение на категориальные и числовые признаки
+    cat_cols = X.select_dtypes(include=['object']).columns.tolist()
+    num_cols = X.select_dtypes(include=[np.number]).columns.tolist()
+    categories = {}
+
+    # Удаляем пустые категориальные колонки
+    empty_cat_cols = [col for col in cat_cols if X[col].isna().all()]
+    if empty_cat_cols:
+        print(f"Removing empty categorical columns: {empty_cat_cols}")
+        cat_cols = [col for col in cat_cols if col not in empty_cat_cols]
+        X = X.drop(columns=empty_cat_cols)
+
+    # Пустые числовые колонки (например, поле одного реестра при обучении без него) импутер отбрасывает
+    empty_num_cols = [col for col in num_cols if X[col].isna().all()]
+    if empty_num_cols:
+        print(f"Removing empty numeric columns: {empty_num_cols}")
+        num_cols = [col for col in num_cols if col not in empty_num_cols]
+        X = X.drop(columns=empty_num_cols)
+
+    cat_imputer = None
+    if cat_cols and encoding == 'native':
+        # Фиксированные категории вместо расширения матрицы dummy-колонками
+        categories = {col: CATEGORY_SETS.get(col, sorted(X[col].dropna().unique())) for col in cat_cols}
+        # Коды, которых нет в словарях utils/constants.py, в нативном режиме теряются как пропуски
+        for col, counts in unknown_categories(X, categories).items():
+            print(f"Warning: {col} has {sum(counts.values())} values outside CATEGORY_SETS, "
+                  f"encoded as missing (extend the maps in utils/constants.py): {counts}")
+        for col in cat_cols:
+            X[col] = pd.Categorical(X[col], categories=categories[col])
+    elif cat_cols:
+        # Импутация пропущенных значений
+        cat_imputer = SimpleImputer(strategy='most_frequent')
+        X[cat_cols] = pd.DataFrame(
+            cat_imputer.fit_transform(X[cat_cols]),
+            columns=cat_cols,
+            index=X.index
+        )
+        categories = {col: sorted(X[col].unique()) for col in cat_cols}
+
+        # One-hot encoding
+        X = pd.get_dummies(X, columns=cat_cols, drop_first=True)
+
+    num_imputer = scaler = None
+    if num_cols:
+        # Импутация пропущенных значений
+        num_imputer = SimpleImputer(strategy='mean')
+        X[num_cols] = pd.DataFrame(
+            num_imputer.fit_transform(X[num_cols]),
+            columns=num_cols,
+            index=X.index
+        )
+
+        # Стандартизация
+        scaler = StandardScaler()
+        X[num_cols] = scaler.fit_transform(X[num_cols])
+
+    preprocessing_objects = {
+        'cat_imputer': cat_imputer,
+        'num_imputer': num_imputer,
+        'scaler': scaler,
+        'cat_cols': cat_cols,
+        'num_cols': num_cols,
+        'categories': categories,
+        'encoding': encoding,
+        'feature_names': X.columns.tolist()
+    }
+    return X, preprocessing_objects
+
+
+def check_feature_layout(preprocessing_objects: dict, X: pd.DataFrame) -> List[str]:
+    """
+    Checks that new data can be encoded into the feature layout of an existing model.
+    Returns a list of incompatibilities (empty if the layout is compatible)
+    """
+    problems = []
+    missing_columns = [
+        col for col in preprocessing_objects['num_cols'] + preprocessing_objects['cat_cols']
+        if col not in X.columns
+    ]
+    if missing_columns:
+        problems.append(f"Missing columns: {', '.join(missing_columns)}")
+
+    new_numeric = [col for col in X.select_dtypes(include=[np.number]).columns if col not in preprocessing_objects['num_cols']]
+    if new_numeric:
+        problems.append(f"New numeric columns: {', '.join(new_numeric)}")
+
+    categories = preprocessing_objects.get('categories')
+    if preprocessing_objects.get('encoding') != 'native' and categories:
+        # Новая категория означала бы новую dummy-колонку, которой нет в деревьях
+        for col in preprocessing_objects['cat_cols']:
+            if col in X.columns:
+                unknown = set(X[col].dropna().unique()) - set(categories[col])
+                if unknown:
+                    problems.append(f"New categories in {col}: {', '.join(map(str, sorted(unknown)))}")
+    return problems
+
+
+def refit_changed_statistics(preprocessing_objects: dict, X: pd.DataFrame, tolerance: float = 0.01) -> Tuple[dict, List[str]]:
+    """
+    Refits imputation statistics that moved by more than tolerance (relative) on new data.
+    The scaler is kept frozen: split thresholds of the existing trees are expressed in scaled units
+    Returns updated preprocessing objects and a list of changes
+    """
+    updated = copy.deepcopy(preprocessing_objects)
+    changes = []
+
+    num_cols = preprocessing_objects['num_cols']
+    if num_cols:
+        means = updated['num_imputer'].statistics_
+        new_means = X[num_cols].apply(pd.to_numeric, errors='coerce').mean().to_numpy()
+        scale_drift = np.abs(new_means - updated['scaler'].mean_)
+        changed = np.abs(new_means - means) > tolerance * np.maximum(np.abs(means), 1e-9)
+        changed &= ~np.isnan(new_means)
+        for j in np.flatnonzero(changed):
+            changes.append(f"num_imputer[{num_cols[j]}]: {means[j]:.4g} -> {new_means[j]:.4g}")
+        means[changed] = new_means[changed]
+
+        drifted = [col for col, drift, scale in zip(num_cols, scale_drift, updated['scaler'].scale_) if drift > tolerance * scale]
+        if drifted:
+            changes.append(f"scaler kept frozen, mean drift in: {', '.join(drifted)}")
+
+    cat_cols = preprocessing_objects['cat_cols']
+    if cat_cols and updated.get('cat_imputer') is not None:
+        modes = updated['cat_imputer'].statistics_
+        for j, col in enumerate(cat_cols):
+            counts = X[col].value_counts()
+            if counts.empty:
+                continue
+            # Как SimpleImputer(most_frequent): при равенстве частот берется наименьшее значение
+            new_mode = min(counts[counts == counts.max()].index)
+            if new_mode != modes[j]:
+                changes.append(f"cat_imputer[{col}]: {modes[j]} -> {new_mode}")
+                modes[j] = new_mode
+
+    return updated, changes
+
+
+def row_keys(X: pd.DataFrame, y: pd.Series) -> np.ndarray:
+    """
+    Content hash of every row (raw features and target): identifies a row across dataset
+    rebuilds, appended rows and reordering. Numbers are hashed as float64 rounded to 9 decimals
+    (a CSV round trip may change the last bit), missing values alike, so a column read as int64
+    or object in one build and float64 in the next gives the same key
+    """
+    df = X[sorted(X.columns)].copy()
+    for col in df.columns:
+        if pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = df[col].astype('float64').round(9)
+    df = df.astype(str)
+    df['__target'] = pd.Series(y, index=X.index).astype('float64').astype(str)
+    return pd.util.hash_pandas_object(df, index=False).to_numpy()
+
+
+def holdout_mask(y: pd.Series, size: float, random_state: int = 42) -> np.ndarray:
+    """
+    Boolean mask of a held-out share of the rows. Stratified train_test_split as in XGBoost.py
+    (the same rows for the same y), unstratified when a class is too small to be split
+    """
+    mask = np.zeros(len(y), dtype=bool)
+    if size <= 0 or len(y) < 2:
+        return mask
+    rows = np.arange(len(y))
+    try:
+        _, held_out = train_test_split(rows, stratify=y, test_size=size, random_state=random_state)
+    except ValueError:
+        _, held_out = train_test_split(rows, test_size=size, random_state=random_state)
+    mask[held_out] = True
+    return mask
+
+
+def split_artifacts(split: Dict[str, np.ndarray], directory: str) -> Dict[str, str]:
+    """
+    Writes the row keys of every part of the split (SPLIT_PARTS) for register_run
+    """
+    path = os.path.join(directory, SPLIT_FILE)
+    np.savez_compressed(path, **{part: np.asarray(split.get(part, []), dtype=np.uint64) for part in SPLIT_PARTS})
+    return {SPLIT_FILE: path}
+
+
+def load_split(model_dir: str) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Row keys of the split of a run; None for runs trained before the split was recorded
+    """
+    path = os.path.join(model_dir, SPLIT_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return {part: data[part] for part in SPLIT_PARTS}
@@ -0,0 +1,77 @@
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+from utils.training import TARGET
+
+# Вид запуска в реестре и файлы артефактов бутстрап-ансамбля
+ENSEMBLE_KIND = f"{TARGET}_ensemble"
+ENSEMBLE_FILE = "ensemble.npz"
+CALIBRATION_FILE = "interval_calibration.json"
+
+DEFAULT_LEVEL = 0.9
+
+# Масштаб выше этого значит, что разброс участников почти не несет информации о неопределенности
+MAX_SCALE = 10.0
+
+
+def _logit(p: np.ndarray) -> np.ndarray:
+    p = np.clip(p, 1e-6, 1 - 1e-6)
+    return np.log(p / (1 - p))
+
+
+def _sigmoid(x: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-x))
+
+
+def member_intervals(member_probs: np.ndarray, level: float = DEFAULT_LEVEL, scale: float = 1.0,
+                     center: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Interval of every row from the member probabilities (n_rows, n_members):
+    the spread of the member quantiles around their median in log-odds, stretched by the calibrated scale
+    and placed around `center` (served point probabilities; the member median if not given)
+    Returns the center, lower and upper probabilities
+    """
+    logits = _logit(member_probs)
+    median = np.median(logits, axis=1)
+    q_low, q_high = np.quantile(logits, [(1 - level) / 2, (1 + level) / 2], axis=1)
+    point = median if center is None else _logit(np.asarray(center, dtype=float))
+    lower = point - scale * (median - q_low)
+    upper = point + scale * (q_high - median)
+    return _sigmoid(point), _sigmoid(lower), _sigmoid(upper)
+
+
+def member_scores(member_probs: np.ndarray, level: float = DEFAULT_LEVEL) -> np.ndarray:
+    """
+    Leave-one-member-out conformity scores: the distance of each member's log-odds from the median of
+    the others, in units of the others' half-width on that side (one score per row and member)
+    """
+    logits = _logit(member_probs)
+    scores = []
+    for member in range(logits.shape[1]):
+        others = np.delete(logits, member, axis=1)
+        median = np.median(others, axis=1)
+        q_low, q_high = np.quantile(others, [(1 - level) / 2, (1 + level) / 2], axis=1)
+        deviation = logits[:, member] - median
+        half_width = np.where(deviation < 0, median - q_low, q_high - median)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            scores.append(np.where(deviation == 0, 0.0, np.abs(deviation) / half_width))
+    return np.concatenate(scores)
+
+
+def calibrate_scale(member_probs: np.ndarray, level: float = DEFAULT_LEVEL) -> Tuple[float, float]:
+    """
+    Split-conformal interval scale on held-out rows: the ceil((n + 1) * level)-th smallest
+    leave-one-member-out score, so that a held-out member falls inside the scaled interval of the
+    others with probability of at least `level`
+    Returns the scale and its empirical coverage; raises ValueError if the members carry no spread
+    """
+    scores = np.sort(member_scores(member_probs, level))
+    rank = min(math.ceil((len(scores) + 1) * level), len(scores))
+    scale = float(scores[rank - 1])
+    if not np.isfinite(scale) or scale <= 0:
+        raise ValueError(f"Members agree on most held-out rows (conformal scale {scale}); "
+                         f"intervals cannot be calibrated, train more or more diverse members")
+    coverage = float(np.mean(scores <= scale))
+    return scale, coverage
@@ -1,81 +1,302 @@
 import pandas as pd
 import numpy as np
-from typing import List
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional, Union
 
-def validate_dataframe(df: pd.DataFrame) -> List[str]:
+from utils.constants import CATEGORY_SETS
+
+# Максимальное число примеров строк и значений, сохраняемых для каждого правила
+SAMPLE_LIMIT = 10
+
+# Проверяем наличие необходимых колонок
+REQUIRED_COLUMNS = {
+    'patient_age', 'donor_age', 'patient_sex', 'donor_sex',
+    'diagnosis', 'disease_status', 'source_of_cells',
+    'donor_relation', 'hla_match_score', 'engraftment_success',
+    'engraftment_days', 'acute_gvhd_grade', 'chronic_gvhd',
+    'relapse', 'overall_survival_1y'
+}
+
+# Допустимые значения категориальных колонок - словарь унифицированных значений из utils/constants.py
+VALID_VALUES = {
+    col: set(CATEGORY_SETS[col])
+    for col in ['patient_sex', 'donor_sex', 'diagnosis', 'disease_status', 'source_of_cells', 'donor_relation']
+}
+
+# Коды hla_match в P5191/P5303 не являются числом совпадений, поэтому правило только предупреждает
+VALID_NUMERIC_VALUES = {
+    'hla_match_score': ({6, 7, 8, 9, 10}, 'warning'),
+}
+
+# Проверяем числовые значения
+NUMERIC_RANGES = {
+    'patient_age': (0, 100),
+    'donor_age': (0, 100),
+    'engraftment_days': (0, 3650),
+    'acute_gvhd_days': (0, 365),
+    'chronic_gvhd_days': (0, 365),
+    'relapse_days': (0, 3650),
+    'survival_days': (0, 3650)
+}
+
+
+class ColumnCache:
     """
-    Validates the dataframe for data quality issues
-    Returns a list of validation issues found
+    Lazily prepared views of a column shared by all rules of that column,
+    so every column is coerced or factorized at most once per validation pass
     """
-    issues = []
-
-    # Проверяем наличие необходимых колонок
-    required_columns = {
-        'patient_age', 'donor_age', 'patient_sex', 'donor_sex',
-        'diagnosis', 'disease_status', 'source_of_cells',
-        'donor_relation', 'hla_match_score', 'engraftment_success',
-        'engraftment_days', 'acute_gvhd', 'chronic_gvhd',
-        'relapse', 'survival'
-    }
 
-    missing_columns = required_columns - set(df.columns)
-    if missing_columns:
-        issues.append(f"Missing required columns: {', '.join(missing_columns)}")
-
-    # Проверяем категориальные значения
-    valid_values = {
-        'patient_sex': {'M', 'F'},
-        'donor_sex': {'M', 'F'},
-        'diagnosis': {'ALL', 'AML', 'CML', 'MDS', 'NHL', 'HL', 'MM', 'Other'},
-        'disease_status': {'CR1', 'CR2', 'PR', 'Relapse', 'Refractory'},
-        'source_of_cells': {'BM', 'PBSC', 'Cord'},
-        'donor_relation': {'MRD', 'MUD', 'MMUD', 'Haplo'},
-        'hla_match_score': {6, 7, 8, 9, 10}
-    }
+    def __init__(self, series: pd.Series):
+        self.series = series
+        self._numeric = None
+        self._factorized = None
+
+    @property
+    def numeric(self) -> pd.Series:
+        if self._numeric is None:
+            self._numeric = pd.to_numeric(self.series, errors='coerce')
+        return self._numeric
+
+    @property
+    def factorized(self):
+        if self._factorized is None:
+            codes, uniques = pd.factorize(self.series)
+            self._factorized = (codes, pd.Index(uniques))
+        return self._factorized
+
+
+@dataclass
+class Rule(ABC):
+    name: str
+    columns: List[str]
+    severity: str = 'error'
+
+    @abstractmethod
+    def evaluate(self, df: pd.DataFrame, caches: Dict[str, ColumnCache]) -> np.ndarray:
+        """
+        Returns a boolean mask of violating rows
+        """
+
+    def offending_values(self, df: pd.DataFrame, mask: np.ndarray) -> list:
+        return []
+
+
+@dataclass
+class SetRule(Rule):
+    allowed: set = field(default_factory=set)
+
+    def evaluate(self, df, caches):
+        # Сравнение на уникальных значениях: один проход по колонке, без astype(str) на каждую строку
+        codes, uniques = caches[self.columns[0]].factorized
+        allowed_upper = {str(value).upper() for value in self.allowed}
+        invalid_unique = ~uniques.astype(str).str.upper().isin(allowed_upper)
+        invalid_unique = np.append(np.asarray(invalid_unique), False)  # код -1 (пропуск) допустим
+        return invalid_unique[codes]
+
+    def offending_values(self, df, mask):
+        return pd.unique(df.loc[mask, self.columns[0]])[:SAMPLE_LIMIT].tolist()
+
+
+@dataclass
+class NumericSetRule(Rule):
+    allowed: set = field(default_factory=set)
+
+    def evaluate(self, df, caches):
+        cache = caches[self.columns[0]]
+        values = cache.numeric
+        present = cache.series.notna().to_numpy()
+        return present & ~values.isin(self.allowed).to_numpy()
+
+    def offending_values(self, df, mask):
+        return pd.unique(df.loc[mask, self.columns[0]])[:SAMPLE_LIMIT].tolist()
+
+
+@dataclass
+class RangeRule(Rule):
+    min_value: float = 0
+    max_value: float = 0
+
+    def evaluate(self, df, caches):
+        cache = caches[self.columns[0]]
+        values = cache.numeric
+        # Нечисловое значение тоже нарушение; пропуск - нет
+        present = cache.series.notna().to_numpy()
+        return present & ~values.between(self.min_value, self.max_value).to_numpy()
+
+    def offending_values(self, df, mask):
+        return pd.unique(df.loc[mask, self.columns[0]])[:SAMPLE_LIMIT].tolist()
+
+
+@dataclass
+class CrossColumnRule(Rule):
+    check: Callable[[pd.DataFrame, Dict[str, ColumnCache]], np.ndarray] = None
+
+    def evaluate(self, df, caches):
+        return np.asarray(self.check(df, caches), dtype=bool)
+
+
+def _successful_engraftment_days(df: pd.DataFrame, caches: Dict[str, ColumnCache]) -> np.ndarray:
+    days = caches['engraftment_days'].numeric
+    success = caches['engraftment_success'].numeric == 1
+    return (success & days.notna() & ~days.between(0, 100)).to_numpy()
 
-    for col, valid_set in valid_values.items():
-        if col in df.columns:
-            # Преобразуем в строку для сравнения
-            values = df[col].astype(str).str.upper()
-            invalid_values = set(values.dropna().unique()) - valid_set
-            if invalid_values:
-                issues.append(f"Invalid values in {col}: {', '.join(map(str, invalid_values))}")
-
-    # Проверяем числовые значения
-    numeric_ranges = {
-        'patient_age': (0, 100),
-        'donor_age': (0, 100),
-        'engraftment_days': (0, 3650),
-        'acute_gvhd_days': (0, 365),
-        'chronic_gvhd_days': (0, 365),
-        'relapse_days': (0, 3650),
-        'survival_days': (0, 3650)
+
+def compile_rules() -> List[Rule]:
+    """
+    Builds the rule set from the declarative tables above
+    """
+    rules: List[Rule] = []
+    for col, valid_set in VALID_VALUES.items():
+        rules.append(SetRule(f"{col} in vocabulary", [col], allowed=valid_set))
+    for col, (valid_set, severity) in VALID_NUMERIC_VALUES.items():
+        rules.append(NumericSetRule(f"{col} in {sorted(valid_set)}", [col], severity=severity, allowed=valid_set))
+    for col, (min_val, max_val) in NUMERIC_RANGES.items():
+        rules.append(RangeRule(f"{col} in [{min_val}, {max_val}]", [col], min_value=min_val, max_value=max_val))
+    rules.append(CrossColumnRule(
+        "engraftment_days in [0, 100] for successful engraftments",
+        ['engraftment_success', 'engraftment_days'],
+        check=_successful_engraftment_days
+    ))
+    return rules
+
+
+RULES = compile_rules()
+
+
+@dataclass
+class RuleResult:
+    rule: str
+    severity: str
+    violations: int = 0
+    sample_rows: list = field(default_factory=list)
+    invalid_values: list = field(default_factory=list)
+
+
+@dataclass
+class ValidationReport:
+    rows_checked: int = 0
+    total_rows: int = 0
+    sampled: bool = False
+    missing_columns: List[str] = field(default_factory=list)
+    results: List[RuleResult] = field(default_factory=list)
+
+    @property
+    def violations(self) -> Dict[str, int]:
+        return {result.rule: result.violations for result in self.results}
+
+    @property
+    def issues(self) -> List[str]:
+        """
+        Human-readable issues in the format of the former list-of-strings API
+        """
+        issues = []
+        if self.missing_columns:
+            issues.append(f"Missing required columns: {', '.join(self.missing_columns)}")
+        for result in self.results:
+            if result.violations:
+                message = f"[{result.severity}] {result.rule}: {result.violations} rows (e.g. rows {result.sample_rows[:5]})"
+                if result.invalid_values:
+                    message += f", values: {', '.join(map(str, result.invalid_values))}"
+                issues.append(message)
+        return issues
+
+
+def rule_violations(df: pd.DataFrame, rules: Optional[List[Rule]] = None) -> pd.DataFrame:
+    """
+    Evaluates all applicable rules in one pass per column
+    Returns a boolean frame (rows x rules) of violations aligned with df.index
+    """
+    rules = RULES if rules is None else rules
+    caches = {col: ColumnCache(df[col]) for rule in rules for col in rule.columns if col in df.columns}
+    masks = {
+        rule.name: rule.evaluate(df, caches)
+        for rule in rules
+        if all(col in df.columns for col in rule.columns)
     }
+    return pd.DataFrame(masks, index=df.index, dtype=bool)
+
+
+def rejection_reasons(df: pd.DataFrame, rules: Optional[List[Rule]] = None, severity: str = 'error') -> pd.Series:
+    """
+    Returns, for every row, the '; '-joined names of the violated rules of the given severity
+    (an empty string for rows that pass)
+    """
+    rules = [rule for rule in (RULES if rules is None else rules) if rule.severity == severity]
+    masks = rule_violations(df, rules)
+    if masks.empty:
+        return pd.Series('', index=df.index)
+    # bool x str в numpy дает строку или '', поэтому причины собираются одним матричным умножением
+    reasons = masks.dot(pd.Series([f"{name}; " for name in masks.columns], index=masks.columns))
+    return reasons.str.rstrip('; ')
+
+
+def _accumulate(report: ValidationReport, df: pd.DataFrame, rules: List[Rule]) -> None:
+    masks = rule_violations(df, rules)
+    results = {result.rule: result for result in report.results}
+    for rule in rules:
+        if rule.name not in masks.columns:
+            continue
+        mask = masks[rule.name].to_numpy()
+        count = int(mask.sum())
+        if rule.name not in results:
+            results[rule.name] = RuleResult(rule.name, rule.severity)
+            report.results.append(results[rule.name])
+        result = results[rule.name]
+        if count:
+            result.violations += count
+            if len(result.sample_rows) < SAMPLE_LIMIT:
+                result.sample_rows.extend(df.index[mask][:SAMPLE_LIMIT - len(result.sample_rows)].tolist())
+            for value in rule.offending_values(df, mask):
+                if len(result.invalid_values) < SAMPLE_LIMIT and value not in result.invalid_values:
+                    result.invalid_values.append(value)
+    report.rows_checked += len(df)
+
+
+def validate_dataframe(df: pd.DataFrame, sample_size: Optional[int] = None, chunksize: Optional[int] = None,
+                       rules: Optional[List[Rule]] = None, random_state: int = 42) -> ValidationReport:
+    """
+    Validates the dataframe for data quality issues.
+    sample_size validates a random sample of rows, chunksize validates the frame chunk by chunk
+    Returns a structured report with per-rule violation counts and sample row indices
+    """
+    rules = RULES if rules is None else rules
+    report = ValidationReport(total_rows=len(df))
+    report.missing_columns = sorted(REQUIRED_COLUMNS - set(df.columns))
+
+    if sample_size is not None and sample_size < len(df):
+        df = df.sample(n=sample_size, random_state=random_state)
+        report.sampled = True
+
+    if chunksize:
+        for start in range(0, len(df), chunksize):
+            _accumulate(report, df.iloc[start:start + chunksize], rules)
+    else:
+        _accumulate(report, df, rules)
+    return report
+
+
+def validate_chunks(chunks: Iterable[pd.DataFrame], rules: Optional[List[Rule]] = None) -> ValidationReport:
+    """
+    Stream-validates an iterable of chunks (e.g. pd.read_csv(..., chunksize=...))
+    """
+    rules = RULES if rules is None else rules
+    report = ValidationReport()
+    for i, chunk in enumerate(chunks):
+        if i == 0:
+            report.missing_columns = sorted(REQUIRED_COLUMNS - set(chunk.columns))
+        _accumulate(report, chunk, rules)
+    report.total_rows = report.rows_checked
+    return report
+
 
-    for col, (min_val, max_val) in numeric_ranges.items():
-        if col in df.columns:
-            try:
-                # Преобразуем в числовые значения, преобразуя ошибки в NaN
-                numeric_values = pd.to_numeric(df[col], errors='coerce')
-                if not numeric_values.between(min_val, max_val).all():
-                    issues.append(f"Values in {col} outside valid range [{min_val}, {max_val}]")
-            except Exception as e:
-                issues.append(f"Error validating {col}: {str(e)}")
-
-    # Проверяем логику
-    if 'engraftment_success' in df.columns and 'engraftment_days' in df.columns:
-        # Преобразуем в числовые значения для сравнения
-        engraftment_days = pd.to_numeric(df['engraftment_days'], errors='coerce')
-        success_mask = df['engraftment_success'] == 1
-        if not engraftment_days[success_mask].between(0, 100).all():
-            issues.append("Invalid engraftment days for successful engraftments")
-
-    return issues
-
-def print_validation_results(issues: List[str]) -> None:
+def print_validation_results(report: Union[ValidationReport, List[str]]) -> None:
     """
     Prints validation results in a formatted way
     """
+    issues = report.issues if isinstance(report, ValidationReport) else report
+    if isinstance(report, ValidationReport) and report.sampled:
+        print(f"Validated a sample of {report.rows_checked}/{report.total_rows} rows")
     if not issues:
         print("No validation issues found!")
         return
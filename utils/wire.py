@@ -0,0 +1,175 @@
+"""
+Columnar wire formats of the batch endpoints: Arrow IPC streams and msgpack maps of columns.
+A payload is validated column by column against the fields of a pydantic model, without
+building one model instance per row; numeric Arrow columns without nulls reach the encoder
+as NumPy views of the request buffer
+"""
+from typing import Dict, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+# msgpack - необязательная зависимость: без нее формат отвечает 415/406
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+JSON = "application/json"
+ARROW_STREAM = "application/vnd.apache.arrow.stream"
+MSGPACK = "application/msgpack"
+MEDIA_TYPE_ALIASES = {"application/x-msgpack": MSGPACK}
+COLUMNAR_FORMATS = (ARROW_STREAM, MSGPACK)
+
+# Сколько номеров ошибочных строк приводится в сообщении
+ERROR_ROWS = 5
+
+
+class UnsupportedFormat(Exception):
+    pass
+
+
+class ColumnValidationError(ValueError):
+    """
+    Column-wise validation errors in the format of pydantic's ValidationError.errors()
+    """
+
+    def __init__(self, errors: list):
+        super().__init__(f"{len(errors)} invalid columns")
+        self.errors = errors
+
+
+def media_type(header: Optional[str]) -> str:
+    """
+    Normalized media type of a Content-Type header; JSON when the header is missing
+    """
+    if not header:
+        return JSON
+    value = header.split(";", 1)[0].strip().lower()
+    return MEDIA_TYPE_ALIASES.get(value, value)
+
+
+def check_format(fmt: str) -> None:
+    if fmt == MSGPACK and msgpack is None:
+        raise UnsupportedFormat("msgpack payloads need the msgpack package (pip install msgpack)")
+
+
+def response_format(accept: Optional[str], default: str = JSON) -> str:
+    """
+    First columnar format or JSON named in an Accept header; `default` for a missing header or */*
+    """
+    for part in (accept or "").split(","):
+        value = media_type(part)
+        if value in COLUMNAR_FORMATS or value == JSON:
+            return value
+    return default
+
+
+def arrow_to_numpy(column: pa.ChunkedArray) -> np.ndarray:
+    array = column.combine_chunks() if column.num_chunks != 1 else column.chunk(0)
+    if pa.types.is_dictionary(array.type) and array.null_count == 0:
+        # Словарь категорий раскодируется одной индексацией NumPy: строки не создаются заново для каждой строки
+        dictionary = array.dictionary.to_numpy(zero_copy_only=False)
+        return dictionary[array.indices.to_numpy(zero_copy_only=False)]
+    if (pa.types.is_integer(array.type) or pa.types.is_floating(array.type)) and array.null_count == 0:
+        # Без копирования: NumPy-представление буфера запроса
+        return array.to_numpy(zero_copy_only=True)
+    return array.to_numpy(zero_copy_only=False)
+
+
+def read_columns(body: bytes, fmt: str) -> Dict[str, np.ndarray]:
+    """
+    Decodes an Arrow IPC stream or a msgpack map {column: [values]} into NumPy columns
+    """
+    check_format(fmt)
+    if fmt == ARROW_STREAM:
+        table = pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+        return {name: arrow_to_numpy(table.column(name)) for name in table.column_names}
+
+    data = msgpack.unpackb(body)
+    if not isinstance(data, dict) or not all(isinstance(values, list) for values in data.values()):
+        raise ValueError("A msgpack payload must be a map of column names to lists of values")
+    columns = {}
+    for name, values in data.items():
+        array = np.asarray(values)
+        # Строки и смешанные типы - объектные колонки, как у pandas
+        columns[str(name)] = array.astype(object) if array.dtype.kind in "USO" else array
+    return columns
+
+
+def column_error(name: str, kind: str, message: str, values: np.ndarray, bad: np.ndarray) -> dict:
+    rows = np.flatnonzero(bad)
+    value = values[rows[0]]
+    value = value.item() if isinstance(value, np.generic) else value
+    return {
+        "type": kind,
+        "loc": ("body", name),
+        "msg": f"{message} in {len(rows)} of {len(values)} rows, first at rows {rows[:ERROR_ROWS].tolist()}",
+        # NaN/inf не сериализуются в JSON ответа
+        "input": str(value) if isinstance(value, float) and not np.isfinite(value) else value,
+    }
+
+
+def validate_columns(columns: Dict[str, np.ndarray], fields: dict) -> pd.DataFrame:
+    """
+    Checks columns against pydantic model fields (int, float or str, all required) in whole-column
+    operations and returns them as a frame in field order; extra columns are ignored, like pydantic does
+    """
+    errors = []
+    lengths = {len(values) for values in columns.values()}
+    if len(lengths) > 1:
+        raise ColumnValidationError([{"type": "value_error", "loc": ("body",), "input": None,
+                                      "msg": f"Columns have different lengths: {sorted(lengths)}"}])
+
+    for name, field in fields.items():
+        if name not in columns:
+            errors.append({"type": "missing", "loc": ("body", name), "msg": "Field required", "input": None})
+            continue
+        values = columns[name]
+        if not len(values):
+            continue
+        if field.annotation in (int, float):
+            if values.dtype.kind not in "iuf":
+                # Например, пропуски (None) в колонке msgpack или строки вместо чисел
+                numeric = pd.to_numeric(pd.Series(values), errors="coerce").to_numpy()
+                bad = np.isnan(numeric) if numeric.dtype.kind == "f" else np.ones(len(values), dtype=bool)
+                errors.append(column_error(name, "float_type", "Input should be a valid number", values,
+                                           bad if bad.any() else np.ones(len(values), dtype=bool)))
+                continue
+            if values.dtype.kind == "f":
+                bad = ~np.isfinite(values)
+                if bad.any():
+                    errors.append(column_error(name, "finite_number", "Input should be a finite number", values, bad))
+                    continue
+                if field.annotation is int:
+                    bad = values != np.floor(values)
+                    if bad.any():
+                        errors.append(column_error(name, "int_from_float",
+                                                   "Input should be a valid integer, got a number with a fractional part",
+                                                   values, bad))
+        elif field.annotation is str:
+            if values.dtype.kind == "O" and pd.api.types.infer_dtype(values, skipna=False) == "string":
+                continue
+            if values.dtype.kind == "O":
+                bad = np.fromiter((not isinstance(value, str) for value in values), dtype=bool, count=len(values))
+            else:
+                bad = np.ones(len(values), dtype=bool)
+            errors.append(column_error(name, "string_type", "Input should be a valid string", values, bad))
+    if errors:
+        raise ColumnValidationError(errors)
+    return pd.DataFrame({name: columns[name] for name in fields}, copy=False)
+
+
+def write_columns(df: pd.DataFrame, fmt: str) -> bytes:
+    """
+    Encodes a frame as an Arrow IPC stream or a msgpack map of columns
+    """
+    check_format(fmt)
+    if fmt == ARROW_STREAM:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        sink = pa.BufferOutputStream()
+        with pa.ipc.new_stream(sink, table.schema) as writer:
+            writer.write_table(table)
+        return sink.getvalue().to_pybytes()
+    return msgpack.packb({name: df[name].tolist() for name in df.columns})